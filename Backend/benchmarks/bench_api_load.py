@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+"""Mixed API traffic against generated catalogues: throughput and p50/p95/p99 latency per scenario, as JSON,
+compared with a saved baseline."""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime, timezone
+
+from dataset import BACKEND_DIR, GENERATED_AS_OF, build_generated_dataset, use_temp_database
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class Context:
+    """Ids the scenarios draw from: the generated catalogue's reference rows
+    and items, plus what the run itself creates (so deletes only ever remove
+    benchmark-made rows)."""
+
+    def __init__(self, db_path):
+        conn = sqlite3.connect(db_path)
+        self.max_item_id = conn.execute("SELECT MAX(item_id) FROM items").fetchone()[0] or 1
+        self.item_types = conn.execute(
+            "SELECT t.item_type_id, t.category_id, c.department_id FROM item_types t "
+            "JOIN categories c ON c.category_id = t.category_id"
+        ).fetchall()
+        self.reference = {
+            "departments": self._ids(conn, "department_id", "departments"),
+            "categories": self._ids(conn, "category_id", "categories"),
+            "item-types": self._ids(conn, "item_type_id", "item_types"),
+            "sizes": self._ids(conn, "size_id", "sizes"),
+            "colors": self._ids(conn, "color_id", "colors"),
+            "tags": self._ids(conn, "tag_id", "tags"),
+            "conditions": self._ids(conn, "condition_id", "conditions"),
+            "item-statuses": self._ids(conn, "status_id", "item_status"),
+            "locations": self._ids(conn, "location_id", "locations"),
+        }
+        self.brands = [brand for (brand,) in conn.execute(
+            "SELECT brand FROM items WHERE brand IS NOT NULL GROUP BY brand ORDER BY COUNT(*) DESC LIMIT 30"
+        )]
+        self.max_change_id = conn.execute("SELECT MAX(change_id) FROM item_changes").fetchone()[0] or 0
+        conn.close()
+        self.created_items = []
+        self.created_photos = []
+        self.created_tags = []
+        self.counter = 0
+
+    @staticmethod
+    def _ids(conn, column, table):
+        return [value for (value,) in conn.execute(f"SELECT {column} FROM {table}")]
+
+    def item_id(self, rng):
+        return rng.randint(1, self.max_item_id)
+
+    def next_name(self, prefix):
+        self.counter += 1
+        return f"{prefix} {os.getpid()}-{self.counter}"
+
+
+def _jpeg(rng):
+    import imaging
+    buffer = io.BytesIO()
+    color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    imaging.Image.new("RGB", (96, 72), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def _item_payload(ctx, rng):
+    item_type_id, category_id, department_id = rng.choice(ctx.item_types)
+    return {
+        "department_id": department_id, "category_id": category_id, "item_type_id": item_type_id,
+        "brand": rng.choice(ctx.brands + [None]) if ctx.brands else None,
+        "size_id": rng.choice(ctx.reference["sizes"]), "color_primary_id": rng.choice(ctx.reference["colors"]),
+        "condition_id": rng.choice(ctx.reference["conditions"]), "status_id": ctx.reference["item-statuses"][0],
+        "current_location_id": rng.choice(ctx.reference["locations"]), "price": round(rng.uniform(3, 120), 2),
+        "description": "Benchmark item", "tag_ids": rng.sample(ctx.reference["tags"], 2),
+    }
+
+
+def _filters(ctx, rng):
+    params = {"page": rng.choice((1, 1, 1, 2, 3, 10)), "page_size": rng.choice((20, 20, 50, 100))}
+    for name, values in (
+        ("department_id", ctx.reference["departments"]), ("category_id", ctx.reference["categories"]),
+        ("condition_id", ctx.reference["conditions"]), ("status_id", ctx.reference["item-statuses"]),
+        ("location_id", ctx.reference["locations"]), ("size_id", ctx.reference["sizes"]),
+    ):
+        if rng.random() < 0.25:
+            params[name] = rng.choice(values)
+    if rng.random() < 0.3:
+        low = rng.choice((0, 5, 10, 20, 50))
+        params.update(min_price=low, max_price=low + rng.choice((10, 25, 100)))
+    if rng.random() < 0.1:
+        params["on_sale"] = "true"
+    if rng.random() < 0.15:
+        params["tag_ids"] = rng.sample(ctx.reference["tags"], 2)
+    if rng.random() < 0.3:
+        params.update(sort_by=rng.choice(("price", "date_added", "brand")), sort_order=rng.choice(("asc", "desc")))
+    return params
+
+
+# Each scenario sends one request and returns the response.
+
+async def list_items(client, ctx, rng):
+    return await client.get("/items/", params={"page": rng.randint(1, 5)})
+
+
+async def filter_items(client, ctx, rng):
+    return await client.get("/items/", params=_filters(ctx, rng))
+
+
+async def search_items(client, ctx, rng):
+    term = rng.choice(ctx.brands + ["Jeans", "Sweater", "Boots", "Dress", "vintage"])
+    return await client.get("/items/", params={"search": term, "page_size": 20})
+
+
+async def list_items_msgpack(client, ctx, rng):
+    return await client.get("/items/", params=_filters(ctx, rng), headers={"Accept": "application/msgpack"})
+
+
+async def get_item(client, ctx, rng):
+    return await client.get(f"/items/{ctx.item_id(rng)}")
+
+
+async def item_history(client, ctx, rng):
+    return await client.get(f"/items/{ctx.item_id(rng)}/history")
+
+
+async def item_photos(client, ctx, rng):
+    return await client.get(f"/items/{ctx.item_id(rng)}/photos")
+
+
+async def similar_items(client, ctx, rng):
+    return await client.get(f"/items/{ctx.item_id(rng)}/similar")
+
+
+async def price_suggestion(client, ctx, rng):
+    item_type_id = rng.choice(ctx.item_types)[0]
+    params = {"item_type_id": item_type_id, "condition_id": rng.choice(ctx.reference["conditions"])}
+    if ctx.brands and rng.random() < 0.6:
+        params["brand"] = rng.choice(ctx.brands)
+    return await client.get("/items/price-suggestion", params=params)
+
+
+async def item_changes(client, ctx, rng):
+    return await client.get("/items/changes", params={"since": rng.randint(0, ctx.max_change_id), "limit": 200})
+
+
+async def create_item(client, ctx, rng):
+    response = await client.post("/items/", json=_item_payload(ctx, rng))
+    if response.status_code == 201:
+        ctx.created_items.append(response.json()["item_id"])
+    return response
+
+
+async def update_item(client, ctx, rng):
+    changes = rng.choice((
+        {"price": round(rng.uniform(3, 120), 2)},
+        {"description": "Benchmark edit"},
+        {"current_location_id": rng.choice(ctx.reference["locations"])},
+        {"on_sale": True, "sale_price": round(rng.uniform(2, 20), 2)},
+    ))
+    return await client.patch(f"/items/{ctx.item_id(rng)}", json=changes)
+
+
+async def delete_item(client, ctx, rng):
+    if not ctx.created_items:
+        return await create_item(client, ctx, rng)
+    return await client.delete(f"/items/{ctx.created_items.pop()}")
+
+
+async def add_photo(client, ctx, rng):
+    item_id = ctx.item_id(rng)
+    payload = {"item_id": item_id, "file_path": f"/images/items/bench_{ctx.next_name('p').replace(' ', '_')}.jpg",
+               "sort_order": 9}
+    response = await client.post(f"/items/{item_id}/photos", json=payload)
+    if response.status_code == 201:
+        ctx.created_photos.append(response.json()["photo_id"])
+    return response
+
+
+async def update_photo(client, ctx, rng):
+    if not ctx.created_photos:
+        return await add_photo(client, ctx, rng)
+    return await client.patch(f"/items/photos/{rng.choice(ctx.created_photos)}", json={"sort_order": rng.randint(1, 9)})
+
+
+async def delete_photo(client, ctx, rng):
+    if not ctx.created_photos:
+        return await add_photo(client, ctx, rng)
+    return await client.delete(f"/items/photos/{ctx.created_photos.pop()}")
+
+
+async def upload_photo(client, ctx, rng):
+    files = {"file": ("photo.jpg", _jpeg(rng), "image/jpeg")}
+    return await client.post(f"/items/{ctx.item_id(rng)}/photos/upload", files=files)
+
+
+async def upload_photo_batch(client, ctx, rng):
+    files = [("files", (f"photo{index}.jpg", _jpeg(rng), "image/jpeg")) for index in range(3)]
+    return await client.post(f"/items/{ctx.item_id(rng)}/photos/upload-batch", files=files)
+
+
+async def duplicate_check(client, ctx, rng):
+    return await client.post("/items/duplicate-check", files={"file": ("photo.jpg", _jpeg(rng), "image/jpeg")})
+
+
+def _some_items(ctx, rng):
+    return [ctx.item_id(rng) for _ in range(rng.choice((5, 20, 50)))]
+
+
+async def bulk_status(client, ctx, rng):
+    statuses = ctx.reference["item-statuses"]
+    payload = {"item_ids": _some_items(ctx, rng), "status_id": rng.choice(statuses[:1] + statuses[2:] or statuses)}
+    return await client.post("/items/bulk/update-status", json=payload)
+
+
+async def bulk_location(client, ctx, rng):
+    payload = {"item_ids": _some_items(ctx, rng), "location_id": rng.choice(ctx.reference["locations"])}
+    return await client.post("/items/bulk/update-location", json=payload)
+
+
+async def bulk_price(client, ctx, rng):
+    payload = {"item_ids": _some_items(ctx, rng), "price": round(rng.uniform(3, 120), 2)}
+    return await client.post("/items/bulk/update-price", json=payload)
+
+
+async def bulk_delete(client, ctx, rng):
+    if len(ctx.created_items) < 3:
+        return await create_item(client, ctx, rng)
+    item_ids = [ctx.created_items.pop() for _ in range(3)]
+    return await client.post("/items/bulk/delete", json={"item_ids": item_ids})
+
+
+async def list_reference(client, ctx, rng):
+    return await client.get(f"/{rng.choice(list(ctx.reference))}/")
+
+
+async def get_reference(client, ctx, rng):
+    table = rng.choice(list(ctx.reference))
+    return await client.get(f"/{table}/{rng.choice(ctx.reference[table])}")
+
+
+async def create_reference(client, ctx, rng):
+    response = await client.post("/tags/", json={"tag_name": ctx.next_name("Bench tag"), "tag_category": "Benchmark"})
+    if response.status_code == 201:
+        ctx.created_tags.append(response.json()["tag_id"])
+    return response
+
+
+async def update_reference(client, ctx, rng):
+    if not ctx.created_tags:
+        return await create_reference(client, ctx, rng)
+    return await client.patch(f"/tags/{rng.choice(ctx.created_tags)}", json={"description": "edited"})
+
+
+async def delete_reference(client, ctx, rng):
+    if not ctx.created_tags:
+        return await create_reference(client, ctx, rng)
+    return await client.delete(f"/tags/{ctx.created_tags.pop()}")
+
+
+# (scenario, relative weight): reads dominate, as on the shop floor. The
+# live event streams are left out; their latency is not per request.
+MIX = [
+    (list_items, 8), (filter_items, 14), (search_items, 6), (list_items_msgpack, 2), (get_item, 16),
+    (item_history, 3), (item_photos, 3), (similar_items, 1), (price_suggestion, 3), (item_changes, 2),
+    (create_item, 4), (update_item, 5), (delete_item, 1), (add_photo, 1), (update_photo, 1), (delete_photo, 0.5),
+    (upload_photo, 0.5), (upload_photo_batch, 0.2), (duplicate_check, 0.3),
+    (bulk_status, 1), (bulk_location, 1), (bulk_price, 1), (bulk_delete, 0.3),
+    (list_reference, 8), (get_reference, 5), (create_reference, 0.3), (update_reference, 0.3), (delete_reference, 0.3),
+]
+IMAGE_SCENARIOS = {upload_photo, upload_photo_batch, duplicate_check}
+
+
+def available_mix():
+    try:
+        import imaging
+        has_images = imaging.Image is not None
+    except ImportError:
+        has_images = False
+    try:
+        import msgpack  # noqa: F401
+        has_msgpack = True
+    except ImportError:
+        has_msgpack = False
+    skipped = [scenario for scenario, _ in MIX if (scenario in IMAGE_SCENARIOS and not has_images)
+               or (scenario is list_items_msgpack and not has_msgpack)]
+    return [(scenario, weight) for scenario, weight in MIX if scenario not in skipped], [s.__name__ for s in skipped]
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarise(samples, seconds):
+    ordered = sorted(latency for _, latency, _ in samples)
+    errors = Counter(error for _, _, error in samples if error)
+    return {
+        "count": len(samples),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "throughput_rps": round(len(samples) / seconds, 1) if seconds else None,
+        "latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in (
+                ("p50", percentile(ordered, 50)), ("p95", percentile(ordered, 95)),
+                ("p99", percentile(ordered, 99)), ("max", ordered[-1] if ordered else None),
+            )
+        },
+    }
+
+
+async def drive(client, ctx, mix, total, concurrency, seed):
+    scenarios = [scenario for scenario, _ in mix]
+    weights = [weight for _, weight in mix]
+    samples = []
+    remaining = total
+
+    async def worker(index):
+        nonlocal remaining
+        rng = random.Random(seed * 1000 + index)
+        while remaining > 0:
+            remaining -= 1
+            scenario = rng.choices(scenarios, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, ctx, rng)
+                error = str(response.status_code) if response.status_code >= 400 else None
+            except Exception as exc:
+                error = type(exc).__name__
+            samples.append((scenario.__name__, time.perf_counter() - start, error))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+async def measure(client, ctx, mix, options):
+    await drive(client, ctx, mix, options["warmup"], options["concurrency"], options["seed"] + 1)
+    samples, seconds = await drive(client, ctx, mix, options["requests"], options["concurrency"], options["seed"])
+    result = summarise(samples, seconds)
+    result["duration_seconds"] = round(seconds, 3)
+    result["scenarios"] = {
+        scenario.__name__: summarise([sample for sample in samples if sample[0] == scenario.__name__], seconds)
+        for scenario, _ in mix
+    }
+    return result
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def uvicorn_server(workdir):
+    port = _free_port()
+    env = {**os.environ, "PYTHONPATH": BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning",
+         "--timeout-graceful-shutdown", "2"],
+        cwd=workdir, env=env,
+    )
+    try:
+        import httpx
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.2)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+async def _run_against(base_url, app, ctx, mix, options):
+    import httpx
+    # Unhandled app errors count as 500s, as they would behind uvicorn.
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False) if app is not None else None
+    limits = httpx.Limits(max_connections=options["concurrency"])
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=120, limits=limits) as client:
+        return await measure(client, ctx, mix, options)
+
+
+# Runs in a fresh process per dataset size, so module-level caches and the
+# database engine never carry over from another catalogue.
+def run_size(n_items, options):
+    workdir = use_temp_database()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):
+        build_generated_dataset(n_items, options["seed"], date.fromisoformat(options["as_of"]), options["cache_dir"])
+    build_seconds = time.perf_counter() - started
+
+    mix, skipped = available_mix()
+    ctx = Context(os.path.join(workdir, "inventory.db"))
+    if options["mode"] == "uvicorn":
+        with uvicorn_server(workdir) as base_url:
+            result = asyncio.run(_run_against(base_url, None, ctx, mix, options))
+    else:
+        from main import app
+
+        async def in_process():
+            # The ASGI transport does not run lifespan events.
+            async with app.router.lifespan_context(app):
+                return await _run_against("http://bench", app, ctx, mix, options)
+
+        result = asyncio.run(in_process())
+    return {"items": n_items, "build_seconds": round(build_seconds, 1), "skipped": skipped, **result}
+
+
+def _report_size(connection, n_items, options):
+    connection.send(run_size(n_items, options))
+    connection.close()
+
+
+# Not a Pool: its daemonic workers could not start the app's image workers.
+def run_size_in_process(context, n_items, options):
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_report_size, args=(sender, n_items, options))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise SystemExit(f"Benchmark of {n_items:,} items failed (exit code {process.join() or process.exitcode})")
+    finally:
+        process.join()
+
+
+def compare(results, baseline, threshold, min_samples):
+    """Regressions of `results` against `baseline`: throughput down, or
+    p95/p99 latency up, by more than `threshold` (a fraction), overall and
+    per scenario with at least `min_samples` requests in both runs."""
+    regressions = []
+
+    def check(label, current, previous):
+        if not previous or not current or min(current["count"], previous["count"]) < min_samples:
+            return
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - threshold):
+            regressions.append({"where": label, "metric": "throughput_rps",
+                                "baseline": previous["throughput_rps"], "current": current["throughput_rps"]})
+        for metric in ("p95", "p99"):
+            before, now = previous["latency_ms"][metric], current["latency_ms"][metric]
+            if before and now > before * (1 + threshold):
+                regressions.append({"where": label, "metric": metric, "baseline": before, "current": now})
+
+    for size, current in results["datasets"].items():
+        previous = baseline.get("datasets", {}).get(size)
+        if previous is None:
+            continue
+        check(f"{size} items", current, previous)
+        for name, scenario in current["scenarios"].items():
+            check(f"{size} items {name}", scenario, previous["scenarios"].get(name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, nargs="+", default=[10000],
+                        help="catalogue sizes, e.g. --items 10000 100000 1000000")
+    parser.add_argument("--mode", choices=("asgi", "uvicorn"), default="asgi",
+                        help="in-process ASGI transport, or HTTP to a local uvicorn")
+    parser.add_argument("--requests", type=int, default=3000, help="measured requests per size")
+    parser.add_argument("--warmup", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--as-of", type=date.fromisoformat, default=GENERATED_AS_OF,
+                        help=f"date the generated catalogues end on (default {GENERATED_AS_OF})")
+    parser.add_argument("--cache-dir", help="reuse generated catalogues from this directory")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline report to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed regression as a fraction (default 0.2 = 20%%)")
+    parser.add_argument("--min-samples", type=int, default=30,
+                        help="scenarios with fewer requests are not compared")
+    args = parser.parse_args()
+
+    options = {
+        "mode": args.mode, "requests": args.requests, "warmup": args.warmup, "concurrency": args.concurrency,
+        "seed": args.seed, "as_of": args.as_of.isoformat(), "cache_dir": os.path.abspath(args.cache_dir) if args.cache_dir else None,
+    }
+    results = {
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        **{key: value for key, value in options.items() if key != "cache_dir"},
+        "datasets": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for n_items in args.items:
+        print(f"{n_items:,} items ({args.mode})...", file=sys.stderr)
+        result = run_size_in_process(context, n_items, options)
+        results["datasets"][str(n_items)] = result
+        print(f"  {result['throughput_rps']} req/s, p50 {result['latency_ms']['p50']} ms, "
+              f"p95 {result['latency_ms']['p95']} ms, p99 {result['latency_ms']['p99']} ms, "
+              f"{result['errors']} errors", file=sys.stderr)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        settings = ("mode", "concurrency", "seed", "as_of")
+        if any(baseline.get(key) != results[key] for key in settings):
+            print(f"Baseline {args.baseline} was recorded with other {'/'.join(settings)}; not compared",
+                  file=sys.stderr)
+            baseline = {}
+        regressions = compare(results, baseline, args.threshold, args.min_samples)
+        results["comparison"] = {"baseline": args.baseline, "threshold": args.threshold, "regressions": regressions}
+        for regression in regressions:
+            print(f"REGRESSION {regression['where']}: {regression['metric']} "
+                  f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            file.write(report + "\n")
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Per-item CPU cost of rendering a GET /items/ page: ORM + response_model path vs. the row fast path."""
+
+import argparse
+import json
+import math
+import time
+
+from dataset import use_temp_database, build_dataset
+
+
+def legacy_render(db, filters):
+    # What list_items did before the fast path: ORM graphs, ItemList built from
+    # attributes, FastAPI's second response_model validation, stdlib json.
+    import crud
+    from schemas import ItemList
+
+    items, total = crud.get_items(db, filters)
+    content = ItemList(
+        items=items, total=total, page=filters.page, page_size=filters.page_size,
+        total_pages=math.ceil(total / filters.page_size) if total > 0 else 0
+    )
+    validated = ItemList.model_validate(content.model_dump())
+    return json.dumps(
+        validated.model_dump(mode="json"), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def fast_render(db, filters):
+    import serializers
+    return serializers.render_item_list(db, filters)
+
+
+def measure(render, db, filters, repeat):
+    render(db, filters)
+    start = time.process_time()
+    for _ in range(repeat):
+        db.expunge_all()
+        render(db, filters)
+    return (time.process_time() - start) / repeat / filters.page_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    use_temp_database()
+    build_dataset(args.items)
+
+    from database import SessionLocal
+    from schemas import ItemFilters
+
+    filters = ItemFilters(page_size=args.page_size)
+    with SessionLocal() as db:
+        legacy = measure(legacy_render, db, filters, args.repeat)
+        fast = measure(fast_render, db, filters, args.repeat)
+
+    print(f"items={args.items} page_size={args.page_size} repeat={args.repeat}")
+    print(f"legacy: {legacy * 1e6:8.1f} us CPU per item")
+    print(f"fast:   {fast * 1e6:8.1f} us CPU per item ({legacy / fast:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Payload size and client decode time of JSON vs. MessagePack responses."""
+
+import argparse
+import json
+import time
+
+from dataset import use_temp_database, build_dataset
+
+PATHS = [
+    "/items/?page_size=100",
+    "/items/?page_size=100&search=Benchmark&sort_by=price",
+    "/item-types/?limit=500",
+    "/sizes/?limit=500",
+    "/colors/",
+    "/tags/",
+]
+
+
+def decode_time(decode, payload, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        decode(payload)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    use_temp_database()
+    build_dataset(args.items)
+
+    import msgpack
+    from fastapi.testclient import TestClient
+    from main import app
+
+    print(f"{'path':<55} {'json B':>8} {'mpack B':>8} {'size':>6} {'json us':>8} {'mpack us':>9} {'speedup':>7}")
+    with TestClient(app) as client:
+        for path in PATHS:
+            as_json = client.get(path).content
+            as_msgpack = client.get(path, headers={"Accept": "application/msgpack"}).content
+            assert json.loads(as_json) == msgpack.unpackb(as_msgpack)
+            json_t = decode_time(json.loads, as_json, args.repeat)
+            msgpack_t = decode_time(msgpack.unpackb, as_msgpack, args.repeat)
+            print(
+                f"{path:<55} {len(as_json):>8} {len(as_msgpack):>8} {len(as_msgpack) / len(as_json):>6.0%} "
+                f"{json_t * 1e6:>8.1f} {msgpack_t * 1e6:>9.1f} {json_t / msgpack_t:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""GET latency while photos are being uploaded in parallel, blocking vs. streamed upload handler."""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import time
+import uuid
+
+from dataset import use_temp_database, build_dataset
+
+
+def add_legacy_upload_route(app):
+    # The handler as it was before uploads moved off the event loop.
+    from fastapi import Depends, File, UploadFile
+    from sqlalchemy.orm import Session
+    import crud
+    from database import get_db
+    from schemas import ItemPhotoCreate
+
+    @app.post("/bench/legacy-upload/{item_id}")
+    async def legacy_upload(item_id: int, file: UploadFile = File(...), db: Session = Depends(get_db)):
+        crud.get_item(db, item_id, with_relations=False)
+        os.makedirs("images/", exist_ok=True)
+        filename = f"{item_id}_{uuid.uuid4()}.jpg"
+        with open(os.path.join("images/", filename), "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        crud.create_item_photo(db, ItemPhotoCreate(item_id=item_id, file_path=f"/images/{filename}"))
+        return {"ok": True}
+
+
+async def run(client, upload_path, payload, uploads, min_gets):
+    latencies = []
+    uploading = 4 if uploads else 0
+
+    async def uploader():
+        nonlocal uploading
+        for _ in range(uploads):
+            response = await client.post(upload_path, files={"file": ("photo.jpg", payload, "image/jpeg")})
+            response.raise_for_status()
+        uploading -= 1
+
+    async def reader():
+        # Keep sampling for as long as any upload is still running.
+        while uploading or len(latencies) < min_gets:
+            start = time.perf_counter()
+            (await client.get("/items/1")).raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.002)
+
+    await asyncio.gather(reader(), *(uploader() for _ in range(4 if uploads else 0)))
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<10} {len(latencies):>5} GETs  p50 {statistics.median(latencies) * 1000:7.1f} ms   "
+          f"p95 {p95 * 1000:7.1f} ms   max {latencies[-1] * 1000:7.1f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=float, default=16)
+    parser.add_argument("--uploads", type=int, default=3, help="uploads per parallel uploader (4 uploaders)")
+    parser.add_argument("--gets", type=int, default=50, help="minimum GET samples per scenario")
+    args = parser.parse_args()
+
+    use_temp_database()
+    build_dataset(100)
+
+    import httpx
+    from main import app
+
+    add_legacy_upload_route(app)
+    payload = os.urandom(int(args.size_mb * 1024 * 1024))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.get("/items/1")
+        report("idle", await run(client, "/items/1/photos/upload", payload, 0, args.gets))
+        report("blocking", await run(client, "/bench/legacy-upload/1", payload, args.uploads, args.gets))
+        report("streamed", await run(client, "/items/1/photos/upload", payload, args.uploads, args.gets))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Throwaway SQLite inventories for the benchmark scripts."""
+
+import os
+import random
+import sys
+import tempfile
+from datetime import date
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Generated catalogues end on this day unless told otherwise, so a cached
+# catalogue or a saved baseline always describes the same data.
+GENERATED_AS_OF = date(2025, 1, 1)
+
+
+def use_temp_database():
+    # The app and seed script both use ./inventory.db, so run from a scratch directory.
+    workdir = tempfile.mkdtemp(prefix="inventory-bench-")
+    os.chdir(workdir)
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    return workdir
+
+
+def _seed_reference_tables():
+    from database import init_db
+    import seed_database
+
+    init_db()
+    conn = seed_database.connect_db()
+    seed_database.clear_tables(conn)
+    for seed_table in (
+        seed_database.seed_departments, seed_database.seed_categories, seed_database.seed_item_types,
+        seed_database.seed_sizes, seed_database.seed_colors, seed_database.seed_tags,
+        seed_database.seed_conditions, seed_database.seed_item_status, seed_database.seed_locations,
+    ):
+        seed_table(conn)
+    return conn
+
+
+def build_dataset(n_items, seed=0):
+    conn = _seed_reference_tables()
+
+    rng = random.Random(seed)
+    types = conn.execute(
+        "SELECT t.item_type_id, t.category_id, c.department_id FROM item_types t "
+        "JOIN categories c ON c.category_id = t.category_id"
+    ).fetchall()
+    brands = ["Levi's", "Nike", "Gap", "Zara", "Coach", "Patagonia", "H&M", "Uniqlo", None]
+    items, item_tags, photos = [], [], []
+    for item_id in range(1, n_items + 1):
+        item_type_id, category_id, department_id = rng.choice(types)
+        price = round(rng.uniform(3, 150), 2)
+        items.append((
+            item_id, department_id, category_id, item_type_id, rng.choice(brands), rng.randint(1, 48),
+            rng.randint(1, 28), rng.choice([None, rng.randint(1, 28)]), "Cotton", rng.randint(1, 4),
+            rng.randint(1, 5), rng.randint(1, 12), price, None, 0, None,
+            f"Benchmark item {item_id}", None, None, "All Season", "2024-01-15 10:00:00", None
+        ))
+        item_tags.extend((item_id, tag_id) for tag_id in rng.sample(range(1, 31), 3))
+        photos.append((item_id, f"/images/items/bench_{item_id}.jpg", 1, 1, "2024-01-15 10:00:00"))
+
+    conn.executemany(
+        "INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", items
+    )
+    conn.executemany("INSERT INTO item_tags (item_id, tag_id) VALUES (?, ?)", item_tags)
+    conn.executemany(
+        "INSERT INTO item_photos (item_id, file_path, is_primary, sort_order, uploaded_date) VALUES (?, ?, ?, ?, ?)",
+        photos
+    )
+    conn.commit()
+    conn.close()
+
+
+# A catalogue from seed_database.py's generator, with the change feed and
+# analytics tables filled as in production. Generating 1M items takes a few
+# minutes, so with `cache_dir` each (size, seed, as_of) is built once and
+# copied.
+def build_generated_dataset(n_items, seed=0, as_of=GENERATED_AS_OF, cache_dir=None):
+    import shutil
+
+    cached = os.path.join(cache_dir, f"inventory-{n_items}-{seed}-{as_of}.db") if cache_dir else None
+    if cached and os.path.exists(cached):
+        shutil.copyfile(cached, "inventory.db")
+        return
+
+    import seed_database
+
+    conn = _seed_reference_tables()
+    seed_database.generate_items(conn, n_items, seed, as_of)
+    seed_database.seed_item_changes(conn)
+    conn.close()
+    seed_database.rebuild_analytics()
+
+    if cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.copyfile("inventory.db", cached)
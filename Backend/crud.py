@@ -1,10 +1,14 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from sqlalchemy import String, Text, bindparam, cast, delete, event, func, insert, inspect, literal, or_, select, tuple_, union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from typing import List, Optional
+from collections import Counter
+import threading
+from datetime import datetime, timezone
 
 from models import (
     Department, Category, ItemType, Size, Color, Tag, Condition,
-    ItemStatus, Location, Item, ItemPhoto, ItemHistory
+    ItemStatus, Location, Item, ItemPhoto, ItemHistory, ItemHistoryArchive, ItemChange, ImageBlob, ImageMetadata, ImageVariant, item_tags
 )
 from schemas import (
     DepartmentCreate, DepartmentUpdate, CategoryCreate, CategoryUpdate,
@@ -14,6 +18,11 @@ from schemas import (
     LocationCreate, LocationUpdate, ItemCreate, ItemUpdate,
     ItemPhotoCreate, ItemPhotoUpdate, ItemHistoryCreate, ItemFilters
 )
+import events
+import pricing
+import rollups
+import sales
+import shelf_stats
 
 
 def get_departments(db: Session, skip: int = 0, limit: int = 100, active_only: bool = True):
@@ -336,95 +345,267 @@ def delete_location(db: Session, location_id: int):
     return True
 
 
-def get_items(db: Session, filters: ItemFilters):
-    query = db.query(Item).options(
-        joinedload(Item.department),
-        joinedload(Item.category),
-        joinedload(Item.item_type),
-        joinedload(Item.size),
-        joinedload(Item.color_primary),
-        joinedload(Item.color_secondary),
-        joinedload(Item.condition),
-        joinedload(Item.status),
-        joinedload(Item.current_location),
-        joinedload(Item.tags),
-        joinedload(Item.photos)
-    )
-    
+class StatementCache:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    # Hits are lock-free dict reads; misses are serialised, since threadpool
+    # workers could otherwise evict the same key at once.
+    def get(self, key, build):
+        stmt = self._statements.get(key)
+        if stmt is not None:
+            self.hits += 1
+            return stmt
+        with self._lock:
+            stmt = self._statements.get(key)
+            if stmt is not None:
+                self.hits += 1
+                return stmt
+            self.misses += 1
+            if len(self._statements) >= self.maxsize:
+                self._statements.pop(next(iter(self._statements)), None)
+            stmt = self._statements[key] = build()
+        return stmt
+
+    def info(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._statements),
+            "maxsize": self.maxsize,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Item statements are built once per filter shape and reused, so SQLAlchemy
+# finds them in its compiled cache without rebuilding the query or its cache key.
+statement_cache = StatementCache()
+
+ITEM_RELATIONS = (
+    joinedload(Item.department),
+    joinedload(Item.category),
+    joinedload(Item.item_type),
+    joinedload(Item.size),
+    joinedload(Item.color_primary),
+    joinedload(Item.color_secondary),
+    joinedload(Item.condition),
+    joinedload(Item.status),
+    joinedload(Item.current_location),
+    joinedload(Item.tags),
+    joinedload(Item.photos).selectinload(ItemPhoto.variants),
+)
+
+ITEM_FILTERS = {
+    "department_id": Item.department_id == bindparam("department_id"),
+    "category_id": Item.category_id == bindparam("category_id"),
+    "item_type_id": Item.item_type_id == bindparam("item_type_id"),
+    "brand": Item.brand.ilike(bindparam("brand")),
+    "size_id": Item.size_id == bindparam("size_id"),
+    "color_primary_id": Item.color_primary_id == bindparam("color_primary_id"),
+    "condition_id": Item.condition_id == bindparam("condition_id"),
+    "status_id": Item.status_id == bindparam("status_id"),
+    "location_id": Item.current_location_id == bindparam("location_id"),
+    "min_price": Item.price >= bindparam("min_price"),
+    "max_price": Item.price <= bindparam("max_price"),
+    "on_sale": Item.on_sale == bindparam("on_sale"),
+    "season": Item.season == bindparam("season"),
+    "search": or_(
+        Item.description.ilike(bindparam("search")),
+        Item.brand.ilike(bindparam("search")),
+        Item.customer_notes.ilike(bindparam("search"))
+    ),
+}
+
+ITEM_SORT_COLUMNS = frozenset(Item.__table__.columns.keys())
+
+
+def statement_cache_info():
+    return statement_cache.info()
+
+
+def item_filter_params(filters: ItemFilters):
+    params = {}
     if filters.department_id:
-        query = query.filter(Item.department_id == filters.department_id)
+        params["department_id"] = filters.department_id
     if filters.category_id:
-        query = query.filter(Item.category_id == filters.category_id)
+        params["category_id"] = filters.category_id
     if filters.item_type_id:
-        query = query.filter(Item.item_type_id == filters.item_type_id)
+        params["item_type_id"] = filters.item_type_id
     if filters.brand:
-        query = query.filter(Item.brand.ilike(f"%{filters.brand}%"))
+        params["brand"] = f"%{filters.brand}%"
     if filters.size_id:
-        query = query.filter(Item.size_id == filters.size_id)
+        params["size_id"] = filters.size_id
     if filters.color_primary_id:
-        query = query.filter(Item.color_primary_id == filters.color_primary_id)
+        params["color_primary_id"] = filters.color_primary_id
     if filters.condition_id:
-        query = query.filter(Item.condition_id == filters.condition_id)
+        params["condition_id"] = filters.condition_id
     if filters.status_id:
-        query = query.filter(Item.status_id == filters.status_id)
+        params["status_id"] = filters.status_id
     if filters.location_id:
-        query = query.filter(Item.current_location_id == filters.location_id)
+        params["location_id"] = filters.location_id
     if filters.min_price is not None:
-        query = query.filter(Item.price >= filters.min_price)
+        params["min_price"] = filters.min_price
     if filters.max_price is not None:
-        query = query.filter(Item.price <= filters.max_price)
+        params["max_price"] = filters.max_price
     if filters.on_sale is not None:
-        query = query.filter(Item.on_sale == filters.on_sale)
+        params["on_sale"] = filters.on_sale
     if filters.season:
-        query = query.filter(Item.season == filters.season)
+        params["season"] = filters.season
     if filters.search:
-        term = f"%{filters.search}%"
-        query = query.filter(
-            or_(
-                Item.description.ilike(term),
-                Item.brand.ilike(term),
-                Item.customer_notes.ilike(term)
-            )
-        )
+        params["search"] = f"%{filters.search}%"
     if filters.tag_ids:
-        query = query.join(Item.tags).filter(Tag.tag_id.in_(filters.tag_ids))
-    
-    total = query.count()
-    
-    sort_col = getattr(Item, filters.sort_by, Item.date_added)
-    if filters.sort_order == "desc":
-        query = query.order_by(sort_col.desc())
-    else:
-        query = query.order_by(sort_col.asc())
-    
-    skip = (filters.page - 1) * filters.page_size
-    items = query.offset(skip).limit(filters.page_size).all()
-    
+        params["tag_ids"] = filters.tag_ids
+    return params
+
+
+def filtered_items_select(shape, *columns):
+    stmt = select(*columns).where(*(ITEM_FILTERS[name] for name in shape if name in ITEM_FILTERS))
+    if "tag_ids" in shape:
+        stmt = stmt.join(Item.tags).where(Tag.tag_id.in_(bindparam("tag_ids", expanding=True)))
+    return stmt
+
+
+def _build_item_count(shape):
+    return select(func.count()).select_from(filtered_items_select(shape, Item.item_id).subquery())
+
+
+def _build_item_page(shape, sort_by, descending):
+    sort_col = getattr(Item, sort_by)
+    return (
+        filtered_items_select(shape, Item)
+        .options(*ITEM_RELATIONS)
+        .order_by(sort_col.desc() if descending else sort_col.asc())
+        .offset(bindparam("offset"))
+        .limit(bindparam("limit"))
+    )
+
+
+def get_items(db: Session, filters: ItemFilters):
+    params = item_filter_params(filters)
+    shape = tuple(params)
+    sort_by = filters.sort_by if filters.sort_by in ITEM_SORT_COLUMNS else "date_added"
+    descending = filters.sort_order == "desc"
+
+    count_stmt = statement_cache.get(("items_count", shape), lambda: _build_item_count(shape))
+    total = db.execute(count_stmt, params).scalar_one()
+
+    page_stmt = statement_cache.get(
+        ("items_page", shape, sort_by, descending),
+        lambda: _build_item_page(shape, sort_by, descending)
+    )
+    params["offset"] = (filters.page - 1) * filters.page_size
+    params["limit"] = filters.page_size
+    items = db.execute(page_stmt, params).unique().scalars().all()
+
     return items, total
 
 
-def get_item(db: Session, item_id: int, with_relations: bool = True):
-    query = db.query(Item)
-    if with_relations:
-        query = query.options(
-            joinedload(Item.department),
-            joinedload(Item.category),
-            joinedload(Item.item_type),
-            joinedload(Item.size),
-            joinedload(Item.color_primary),
-            joinedload(Item.color_secondary),
-            joinedload(Item.condition),
-            joinedload(Item.status),
-            joinedload(Item.current_location),
-            joinedload(Item.tags),
-            joinedload(Item.photos),
-            joinedload(Item.history)
+def _build_item_row_page(shape, sort_by, descending):
+    sort_col = getattr(Item, sort_by)
+    return (
+        filtered_items_select(shape, *Item.__table__.columns)
+        .order_by(sort_col.desc() if descending else sort_col.asc())
+        .offset(bindparam("offset"))
+        .limit(bindparam("limit"))
+    )
+
+
+def _build_page_tags():
+    return select(item_tags.c.item_id, item_tags.c.tag_id).where(
+        item_tags.c.item_id.in_(bindparam("item_ids", expanding=True))
+    )
+
+
+def _build_page_photos():
+    return (
+        select(
+            *ItemPhoto.__table__.columns,
+            ImageMetadata.width, ImageMetadata.height, ImageMetadata.size_bytes,
+            ImageMetadata.dominant_color, ImageMetadata.blurhash
         )
-    return query.filter(Item.item_id == item_id).first()
+        .outerjoin(ImageMetadata, ImageMetadata.file_path == ItemPhoto.file_path)
+        .where(ItemPhoto.item_id.in_(bindparam("item_ids", expanding=True)))
+        .order_by(ItemPhoto.item_id, ItemPhoto.sort_order, ItemPhoto.photo_id)
+    )
+
+
+def _build_page_variants():
+    return (
+        select(*ImageVariant.__table__.columns)
+        .where(ImageVariant.source_path.in_(bindparam("paths", expanding=True)))
+        .order_by(ImageVariant.format, ImageVariant.width)
+    )
+
+
+# Plain-row variant of get_items for the listing fast path: item rows plus tag
+# ids and photo rows keyed by item_id, and image variants keyed by source
+# path, without building ORM objects.
+def get_item_rows(db: Session, filters: ItemFilters):
+    params = item_filter_params(filters)
+    shape = tuple(params)
+    sort_by = filters.sort_by if filters.sort_by in ITEM_SORT_COLUMNS else "date_added"
+    descending = filters.sort_order == "desc"
+
+    count_stmt = statement_cache.get(("items_count", shape), lambda: _build_item_count(shape))
+    total = db.execute(count_stmt, params).scalar_one()
+
+    page_stmt = statement_cache.get(
+        ("item_rows_page", shape, sort_by, descending),
+        lambda: _build_item_row_page(shape, sort_by, descending)
+    )
+    params["offset"] = (filters.page - 1) * filters.page_size
+    params["limit"] = filters.page_size
+    rows = {}
+    for row in db.execute(page_stmt, params):
+        rows.setdefault(row.item_id, row)
+
+    tags = {}
+    photos = {}
+    variants = {}
+    if rows:
+        item_ids = {"item_ids": list(rows)}
+        for item_id, tag_id in db.execute(statement_cache.get("page_tags", _build_page_tags), item_ids):
+            tags.setdefault(item_id, []).append(tag_id)
+        for photo in db.execute(statement_cache.get("page_photos", _build_page_photos), item_ids):
+            photos.setdefault(photo.item_id, []).append(photo)
+    if photos:
+        paths = {"paths": [photo.file_path for item_photos in photos.values() for photo in item_photos]}
+        for variant in db.execute(statement_cache.get("page_variants", _build_page_variants), paths):
+            variants.setdefault(variant.source_path, []).append(variant)
+
+    return list(rows.values()), total, tags, photos, variants
+
+
+def _build_item_by_id(with_relations):
+    stmt = select(Item).where(Item.item_id == bindparam("item_id"))
+    if with_relations:
+        stmt = stmt.options(*ITEM_RELATIONS)
+    return stmt
 
 
+def get_item(db: Session, item_id: int, with_relations: bool = True):
+    stmt = statement_cache.get(("item", with_relations), lambda: _build_item_by_id(with_relations))
+    return db.execute(stmt, {"item_id": item_id}).unique().scalars().first()
+
+
+# Without a price, the item is priced at the suggestion from sold
+# comparables; returns None when there are none.
 def create_item(db: Session, item: ItemCreate):
     item_data = item.model_dump(exclude={'tag_ids'})
+    notes = "Initial creation"
+    if item.price is None:
+        suggestion = pricing.sold_items.suggest(
+            db, item.brand, item.item_type_id, item.condition_id, item.size_id, item.material
+        )
+        if suggestion["suggested_price"] is None:
+            return None
+        item_data["price"] = suggestion["suggested_price"]
+        notes = f"Price suggested from {suggestion['comparables']} sold comparables ({suggestion['confidence']} confidence)"
     db_item = Item(**item_data)
     
     if item.tag_ids:
@@ -439,18 +620,41 @@ def create_item(db: Session, item: ItemCreate):
         item_id=db_item.item_id,
         action="Created",
         new_value=f"Item created: {db_item.description[:50]}",
-        notes="Initial creation"
+        notes=notes
     ))
     
     return db_item
 
 
+SOLD_STATUS_NAME = "Sold"
+
+
+def _sold_status_ids(db: Session) -> set:
+    return set(db.execute(select(ItemStatus.status_id).where(ItemStatus.status_name == SOLD_STATUS_NAME)).scalars())
+
+
+# Keeps date_sold in step with a status change: an item moved to the Sold
+# status without a sale date is stamped with the current time (UTC, like
+# date_added), so it appears in the sales figures, and an item moved out of
+# Sold loses its sale date. Returns the change for the item's history.
+def _sync_date_sold(item: Item, old_status_id: Optional[int], sold_status_ids: set) -> Optional[str]:
+    old_date = item.date_sold
+    if item.status_id in sold_status_ids and old_date is None:
+        item.date_sold = datetime.now(timezone.utc).replace(tzinfo=None)
+    elif old_status_id in sold_status_ids and item.status_id not in sold_status_ids and old_date is not None:
+        item.date_sold = None
+    else:
+        return None
+    return f"date_sold: {old_date} -> {item.date_sold}"
+
+
 def update_item(db: Session, item_id: int, item: ItemUpdate):
     db_item = get_item(db, item_id, with_relations=False)
     if not db_item:
         return None
     
     update_data = item.model_dump(exclude_unset=True, exclude={'tag_ids'})
+    old_status_id = db_item.status_id
     changes = []
     
     for key, value in update_data.items():
@@ -459,6 +663,10 @@ def update_item(db: Session, item_id: int, item: ItemUpdate):
             changes.append(f"{key}: {old_val} -> {value}")
             setattr(db_item, key, value)
     
+    if "status_id" in update_data and "date_sold" not in update_data:
+        if date_change := _sync_date_sold(db_item, old_status_id, _sold_status_ids(db)):
+            changes.append(date_change)
+    
     if item.tag_ids is not None:
         tags = db.query(Tag).filter(Tag.tag_id.in_(item.tag_ids)).all()
         db_item.tags = tags
@@ -489,15 +697,84 @@ def delete_item(db: Session, item_id: int):
 
 
 def get_item_photos(db: Session, item_id: int):
-    return db.query(ItemPhoto).filter(ItemPhoto.item_id == item_id).order_by(ItemPhoto.sort_order).all()
+    return db.query(ItemPhoto).options(selectinload(ItemPhoto.variants)).filter(ItemPhoto.item_id == item_id).order_by(ItemPhoto.sort_order).all()
+
+def add_image_variants(db: Session, source_path: str, variants: List[dict]):
+    existing = {path for (path,) in db.query(ImageVariant.file_path).filter(ImageVariant.source_path == source_path)}
+    for variant in variants:
+        if variant["file_path"] not in existing:
+            db.add(ImageVariant(source_path=source_path, **variant))
+
+def get_image_blob(db: Session, sha256: str):
+    return db.query(ImageBlob).filter(ImageBlob.sha256 == sha256).first()
+
+def get_image_blob_hashes(db: Session, hashes: List[str]) -> set:
+    return set(db.execute(select(ImageBlob.sha256).where(ImageBlob.sha256.in_(hashes))).scalars())
+
+# Concurrent uploads of the same bytes may race here, so the insert is a no-op
+# when the blob is already registered.
+def register_image_blob(db: Session, sha256: str, file_path: str, size_bytes: int):
+    db.execute(
+        sqlite_insert(ImageBlob)
+        .values(sha256=sha256, file_path=file_path, size_bytes=size_bytes, ref_count=0)
+        .on_conflict_do_nothing()
+    )
+
+def recount_blob_references(db: Session):
+    references = (
+        select(func.count(ItemPhoto.photo_id))
+        .where(ItemPhoto.file_path == ImageBlob.file_path)
+        .scalar_subquery()
+    )
+    db.execute(update(ImageBlob).values(ref_count=references))
+
+def add_image_metadata(db: Session, file_path: str, metadata: Optional[dict]):
+    if metadata:
+        db.execute(
+            sqlite_insert(ImageMetadata)
+            .values(file_path=file_path, **metadata)
+            .on_conflict_do_update(index_elements=[ImageMetadata.file_path], set_=metadata)
+        )
 
-def create_item_photo(db: Session, photo: ItemPhotoCreate):
+def create_item_photo(
+    db: Session, photo: ItemPhotoCreate, variants: List[dict] = (), blob: Optional[dict] = None,
+    metadata: Optional[dict] = None
+):
     db_photo = ItemPhoto(**photo.model_dump())
+    if blob is not None:
+        register_image_blob(db, file_path=db_photo.file_path, **blob)
+    add_image_metadata(db, db_photo.file_path, metadata)
     db.add(db_photo)
+    add_image_variants(db, db_photo.file_path, variants)
     db.commit()
     db.refresh(db_photo)
     return db_photo
 
+# `uploads` holds (file_path, blob, variants, metadata) tuples; every row is
+# written in a single commit.
+def create_item_photos(db: Session, item_id: int, uploads: List[tuple]):
+    last_sort_order, has_primary = db.query(
+        func.coalesce(func.max(ItemPhoto.sort_order), 0),
+        func.coalesce(func.max(ItemPhoto.is_primary), False)
+    ).filter(ItemPhoto.item_id == item_id).one()
+    db_photos = []
+    for position, (file_path, blob, variants, metadata) in enumerate(uploads, 1):
+        register_image_blob(db, file_path=file_path, **blob)
+        add_image_metadata(db, file_path, metadata)
+        db_photo = ItemPhoto(
+            item_id=item_id, file_path=file_path,
+            is_primary=not has_primary and position == 1,
+            sort_order=last_sort_order + position
+        )
+        db.add(db_photo)
+        add_image_variants(db, file_path, variants)
+        db_photos.append(db_photo)
+    db.commit()
+    return get_item_photos_by_id(db, [photo.photo_id for photo in db_photos])
+
+def get_item_photos_by_id(db: Session, photo_ids: List[int]):
+    return db.query(ItemPhoto).options(selectinload(ItemPhoto.variants)).filter(ItemPhoto.photo_id.in_(photo_ids)).order_by(ItemPhoto.sort_order).all()
+
 def update_item_photo(db: Session, photo_id: int, photo: ItemPhotoUpdate):
     db_photo = db.query(ItemPhoto).filter(ItemPhoto.photo_id == photo_id).first()
     if not db_photo:
@@ -517,8 +794,220 @@ def delete_item_photo(db: Session, photo_id: int):
     return True
 
 
-def get_item_history(db: Session, item_id: int, skip: int = 0, limit: int = 100):
-    return db.query(ItemHistory).filter(ItemHistory.item_id == item_id).order_by(ItemHistory.action_date.desc()).offset(skip).limit(limit).all()
+def _file_path_changes(photo: ItemPhoto):
+    history = inspect(photo).attrs.file_path.history
+    return history.added, history.deleted
+
+
+# ImageBlob.ref_count tracks how many item_photos rows point at each stored
+# file. It is adjusted in the same transaction as every photo insert, delete
+# (including cascades from delete_item) and file_path change.
+@event.listens_for(Session, "after_flush")
+def count_blob_references(session, flush_context):
+    deltas = Counter()
+    for photo in session.new:
+        if isinstance(photo, ItemPhoto):
+            deltas[photo.file_path] += 1
+    for photo in session.deleted:
+        if isinstance(photo, ItemPhoto):
+            added, deleted = _file_path_changes(photo)
+            deltas[deleted[0] if deleted else photo.file_path] -= 1
+    for photo in session.dirty:
+        if isinstance(photo, ItemPhoto):
+            added, deleted = _file_path_changes(photo)
+            for path in added:
+                deltas[path] += 1
+            for path in deleted:
+                deltas[path] -= 1
+    for path, delta in deltas.items():
+        if delta:
+            session.execute(
+                update(ImageBlob)
+                .where(ImageBlob.file_path == path)
+                .values(ref_count=ImageBlob.ref_count + delta)
+            )
+
+
+def _changed_items(session):
+    upserted, deleted = set(), set()
+    for obj in session.new:
+        if isinstance(obj, (Item, ItemPhoto)):
+            upserted.add(obj.item_id)
+    for obj in session.dirty:
+        if isinstance(obj, (Item, ItemPhoto)) and session.is_modified(obj):
+            upserted.add(obj.item_id)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            deleted.add(obj.item_id)
+        elif isinstance(obj, ItemPhoto):
+            upserted.add(obj.item_id)
+    return upserted - deleted, deleted
+
+
+# Writes that bypass the ORM unit of work (core UPDATEs) report their items
+# here themselves.
+def record_item_changes(db: Session, upserted, deleted=()):
+    item_ids = set(upserted) | set(deleted)
+    if not item_ids:
+        return
+    db.execute(delete(ItemChange).where(ItemChange.item_id.in_(item_ids)))
+    db.execute(insert(ItemChange), [
+        {"item_id": item_id, "deleted": item_id in deleted} for item_id in sorted(item_ids)
+    ])
+
+
+# Item columns read by the change log, analytics tables and live events.
+_DERIVED_COLUMNS = tuple(dict.fromkeys((
+    "item_id", *rollups.TRACKED, *shelf_stats.TRACKED, *sales.TRACKED, *events.FILTER_FIELDS.values()
+)))
+UPDATE_CHUNK_SIZE = 900
+
+
+# Sets `values` on the items selected by `item_ids` (a list, or a select of
+# ids) with set-based UPDATEs, and does what the flush listeners do for ORM
+# writes: logs the items in item_changes, adjusts the analytics tables and
+# queues live events. Runs in the caller's transaction; returns the ids.
+def update_items(db: Session, item_ids, values: dict) -> List[int]:
+    before = [
+        dict(row._mapping) for row in db.execute(
+            select(*(getattr(Item, column) for column in _DERIVED_COLUMNS)).where(Item.item_id.in_(item_ids))
+        )
+    ]
+    updated = [row["item_id"] for row in before]
+    for start in range(0, len(updated), UPDATE_CHUNK_SIZE):
+        db.execute(
+            update(Item).where(Item.item_id.in_(updated[start:start + UPDATE_CHUNK_SIZE])).values(values),
+            execution_options={"synchronize_session": False}
+        )
+    after = [{**row, **values} for row in before]
+    for module in (rollups, shelf_stats, sales):
+        module.apply_changes(db, before, after)
+    record_item_changes(db, updated)
+    events.queue_item_updates(db, before, after)
+    return updated
+
+
+# Moves the selected items that are elsewhere to `location_id` (None for no
+# location), with one Location_Changed history entry each, in the caller's
+# transaction. Returns the ids moved.
+def relocate_items(db: Session, item_ids, location_id: Optional[int], notes: Optional[str] = None) -> List[int]:
+    moving = select(Item.item_id).where(
+        Item.item_id.in_(item_ids), Item.current_location_id.is_distinct_from(location_id)
+    )
+    db.execute(insert(ItemHistory).from_select(
+        ["item_id", "action", "old_value", "new_value", "notes"],
+        select(
+            Item.item_id,
+            literal("Location_Changed"),
+            func.coalesce(cast(Item.current_location_id, String), "None"),
+            literal(str(location_id) if location_id else "None"),
+            literal(notes, Text),
+        ).where(Item.item_id.in_(moving))
+    ))
+    return update_items(db, moving, {"current_location_id": location_id})
+
+
+# Every flush that inserts, changes or deletes an item or one of its photos
+# logs the item in item_changes in the same transaction. SQLite holds its
+# write lock until commit, so change_ids become visible in increasing order
+# and a reader's cursor never skips a change that commits later.
+@event.listens_for(Session, "after_flush")
+def log_item_changes(session, flush_context):
+    upserted, deleted = _changed_items(session)
+    record_item_changes(session, upserted, deleted)
+
+
+def _build_item_changes():
+    return (
+        select(ItemChange.change_id, ItemChange.item_id, ItemChange.deleted)
+        .where(ItemChange.change_id > bindparam("since"))
+        .order_by(ItemChange.change_id)
+        .limit(bindparam("limit"))
+    )
+
+
+def _build_items_by_ids():
+    return select(Item).options(*ITEM_RELATIONS).where(Item.item_id.in_(bindparam("item_ids", expanding=True)))
+
+
+# Returns the items changed after change_id `since` (in change order), the
+# ids deleted since then, the cursor to pass next time and whether more
+# changes are waiting.
+def get_item_changes(db: Session, since: int = 0, limit: int = 500):
+    changes = db.execute(
+        statement_cache.get(("item_changes",), _build_item_changes), {"since": since, "limit": limit + 1}
+    ).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    upserted = [change.item_id for change in changes if not change.deleted]
+    items = {}
+    if upserted:
+        stmt = statement_cache.get(("items_by_ids",), _build_items_by_ids)
+        items = {item.item_id: item for item in db.execute(stmt, {"item_ids": upserted}).unique().scalars()}
+    return (
+        [items[item_id] for item_id in upserted if item_id in items],
+        [change.item_id for change in changes if change.deleted],
+        changes[-1].change_id if changes else since,
+        has_more,
+    )
+
+
+def _history_select(model, merged_count, after_cursor: bool):
+    stmt = select(
+        model.history_id, model.item_id, model.action, model.action_date,
+        model.old_value, model.new_value, model.notes, merged_count.label("merged_count")
+    ).where(model.item_id == bindparam("item_id"))
+    if after_cursor:
+        # Compare against the stored values of the cursor row (live or
+        # archived) so DateTime formatting never affects which rows are older.
+        anchors = union_all(*(
+            select(anchor.action_date, anchor.history_id).where(anchor.history_id == bindparam("before"))
+            for anchor in (aliased(ItemHistory), aliased(ItemHistoryArchive))
+        )).subquery()
+        position = select(anchors.c.action_date, anchors.c.history_id).scalar_subquery()
+        stmt = stmt.where(tuple_(model.action_date, model.history_id) < position)
+    return stmt
+
+
+# Live and archived history are read as one sequence.
+def _build_history_page(after_cursor: bool):
+    entries = union_all(
+        _history_select(ItemHistory, literal(1), after_cursor),
+        _history_select(ItemHistoryArchive, ItemHistoryArchive.merged_count, after_cursor),
+    ).subquery()
+    return (
+        select(entries)
+        .order_by(entries.c.action_date.desc(), entries.c.history_id.desc())
+        .limit(bindparam("limit"))
+    )
+
+
+# Newest first, keyset-paginated on (action_date, history_id): `before` is
+# the history_id of the last entry already seen. Returns the page and the
+# cursor for the next one (None on the last page).
+def get_item_history(db: Session, item_id: int, limit: int = 100, before: Optional[int] = None):
+    stmt = statement_cache.get(("history_page", before is not None), lambda: _build_history_page(before is not None))
+    params = {"item_id": item_id, "limit": limit + 1}
+    if before is not None:
+        params["before"] = before
+    entries = db.execute(stmt, params).all()
+    if len(entries) > limit:
+        return entries[:limit], entries[limit - 1].history_id
+    return entries, None
+
+# Whether `history_id` is still one of the item's live or archived entries.
+# A cursor can go stale: archiving merges runs of entries into the last one.
+def history_cursor_exists(db: Session, item_id: int, history_id: int) -> bool:
+    anchors = union_all(*(
+        select(model.history_id).where(model.history_id == history_id, model.item_id == item_id)
+        for model in (ItemHistory, ItemHistoryArchive)
+    )).subquery()
+    return db.execute(select(select(anchors).exists())).scalar()
+
+def count_item_history(db: Session, item_id: int) -> int:
+    live = select(func.count(ItemHistory.history_id)).where(ItemHistory.item_id == item_id).scalar_subquery()
+    archived = select(func.count(ItemHistoryArchive.history_id)).where(ItemHistoryArchive.item_id == item_id).scalar_subquery()
+    return db.execute(select(live + archived)).scalar()
 
 def create_item_history(db: Session, history: ItemHistoryCreate):
     db_hist = ItemHistory(**history.model_dump())
@@ -530,9 +1019,11 @@ def create_item_history(db: Session, history: ItemHistoryCreate):
 
 def bulk_update_status(db: Session, item_ids: List[int], status_id: int, notes: Optional[str] = None):
     items = db.query(Item).filter(Item.item_id.in_(item_ids)).all()
+    sold_status_ids = _sold_status_ids(db)
     for item in items:
         old_status = item.status_id
         item.status_id = status_id
+        date_change = _sync_date_sold(item, old_status, sold_status_ids)
         create_item_history(db, ItemHistoryCreate(
             item_id=item.item_id,
             action="Status_Changed",
@@ -540,6 +1031,14 @@ def bulk_update_status(db: Session, item_ids: List[int], status_id: int, notes:
             new_value=str(status_id),
             notes=notes
         ))
+        if date_change:
+            create_item_history(db, ItemHistoryCreate(
+                item_id=item.item_id,
+                action="Updated",
+                old_value=date_change,
+                new_value="Item updated",
+                notes="1 fields changed"
+            ))
     db.commit()
     return len(items)
 
@@ -1,8 +1,14 @@
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, func, inspect, insert, select, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.engine import Engine
 from typing import Generator
-from models import Base
+from models import Base, Item, ItemChange, ItemHistory, ItemHistoryArchive, InventoryRollup, SalesDaily, ShelfDailyStats
+import rollups
+import sales
+import shelf_stats
+
+# Tables derived from items, rebuilt from them when first created.
+DERIVED_TABLES = ((InventoryRollup, rollups), (ShelfDailyStats, shelf_stats), (SalesDaily, sales))
 
 DATABASE_URL = "sqlite:///./inventory.db"
 
@@ -25,8 +31,59 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+# item_history tables created before it used AUTOINCREMENT reuse the ids of
+# archived rows. Rebuild such a table with AUTOINCREMENT, starting the
+# sequence above every archived id; live rows whose id was already reused
+# by the archive get new ids.
+def _upgrade_item_history(conn):
+    ddl = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'item_history'")).scalar()
+    if ddl is None or "AUTOINCREMENT" in ddl.upper():
+        return
+    columns = ", ".join(column.name for column in ItemHistory.__table__.columns)
+    reassigned = ", ".join(column.name for column in ItemHistory.__table__.columns if column.name != "history_id")
+    for index in ItemHistory.__table__.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    conn.execute(text("ALTER TABLE item_history RENAME TO item_history_old"))
+    ItemHistory.__table__.create(conn)
+    archived = "SELECT history_id FROM item_history_archive"
+    conn.execute(text(
+        f"INSERT INTO item_history ({columns}) SELECT {columns} FROM item_history_old "
+        f"WHERE history_id NOT IN ({archived})"
+    ))
+    last_archived = conn.execute(select(func.max(ItemHistoryArchive.history_id))).scalar() or 0
+    conn.execute(text("DELETE FROM sqlite_sequence WHERE name = 'item_history'"))
+    conn.execute(
+        text("INSERT INTO sqlite_sequence (name, seq) SELECT 'item_history', MAX(:last, COALESCE(MAX(history_id), 0)) FROM item_history"),
+        {"last": last_archived}
+    )
+    conn.execute(text(
+        f"INSERT INTO item_history ({reassigned}) SELECT {reassigned} FROM item_history_old "
+        f"WHERE history_id IN ({archived}) ORDER BY action_date, history_id"
+    ))
+    conn.execute(text("DROP TABLE item_history_old"))
+
+
 def init_db():
+    inspector = inspect(engine)
+    new_change_log = not inspector.has_table(ItemChange.__tablename__)
+    new_derived = [module for model, module in DERIVED_TABLES if not inspector.has_table(model.__tablename__)]
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        _upgrade_item_history(conn)
+    # Items that existed before the change log did are logged once, so a sync
+    # from cursor 0 still returns the whole catalogue; new analytics tables
+    # are filled from the existing items.
+    if new_change_log:
+        with engine.begin() as conn:
+            conn.execute(insert(ItemChange).from_select(["item_id"], select(Item.item_id).order_by(Item.item_id)))
+    for module in new_derived:
+        with engine.begin() as conn:
+            module.rebuild(conn)
+    # create_all skips tables that already exist, so add indexes declared
+    # since an existing database was created.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 
 def drop_db():
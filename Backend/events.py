@@ -0,0 +1,221 @@
+import asyncio
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Item, ItemPhoto
+import metrics
+
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "256"))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+
+# Item columns subscribers can filter on, keyed by filter name.
+FILTER_FIELDS = {
+    "department_id": "department_id",
+    "category_id": "category_id",
+    "status_id": "status_id",
+    "location_id": "current_location_id",
+}
+
+
+def _filter_id(value) -> int:
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError(f"Filter values must be ids, not {value!r}")
+
+
+class Subscription:
+    """One client's filtered, bounded queue. A client that falls more than
+    EVENT_QUEUE_SIZE events behind has its backlog dropped and receives a
+    single "overflow" event instead, telling it to catch up through
+    GET /items/changes; publishers never wait on slow clients."""
+
+    def __init__(self, bus: "EventBus", filters: Dict[str, Iterable[int]]):
+        self.bus = bus
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(EVENT_QUEUE_SIZE)
+        self.set_filters(filters)
+
+    # Values may be an id or a list of ids, given as integers or numeric
+    # strings; anything else raises ValueError and keeps the old filters.
+    def set_filters(self, filters: Dict[str, Iterable[int]]):
+        self.filters = {
+            name: {_filter_id(value) for value in (values if isinstance(values, (list, tuple, set)) else [values])}
+            for name, values in filters.items() if name in FILTER_FIELDS and values is not None
+        }
+
+    # Matches when the item had or now has one of the wanted values, so a
+    # subscriber also learns about items leaving its location or status.
+    def matches(self, item_event: dict) -> bool:
+        for name, wanted in self.filters.items():
+            values = {item_event.get(name), item_event.get("previous", {}).get(name)}
+            if not values & wanted:
+                return False
+        return True
+
+    # Runs on the subscriber's event loop.
+    def _deliver(self, item_events: List[dict]):
+        for item_event in item_events:
+            if not self.matches(item_event):
+                continue
+            if self.queue.full():
+                metrics.events_dropped.inc(amount=self.queue.qsize())
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait({"event": "overflow"})
+                continue
+            self.queue.put_nowait(item_event)
+
+    async def get(self) -> Optional[dict]:
+        return await self.queue.get()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Fans committed item changes out to every subscriber in this process.
+    Publishing is thread-safe: events are handed to each subscriber's loop."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscriptions)
+
+    def subscribe(self, filters: Dict[str, Iterable[int]]) -> Subscription:
+        subscription = Subscription(self, filters)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        metrics.event_subscribers.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.discard(subscription)
+        metrics.event_subscribers.dec()
+
+    def publish(self, item_events: List[dict]):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, item_events)
+            except RuntimeError:
+                self.unsubscribe(subscription)
+
+    # Ends every open stream, e.g. on shutdown.
+    def close(self):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, None)
+            except RuntimeError:
+                pass
+            self.unsubscribe(subscription)
+
+
+item_events = EventBus()
+
+
+def _filter_values(item: Item) -> dict:
+    return {name: getattr(item, column) for name, column in FILTER_FIELDS.items()}
+
+
+def _previous_values(item: Item) -> dict:
+    previous = {}
+    attrs = inspect(item).attrs
+    for name, column in FILTER_FIELDS.items():
+        deleted = attrs[column].history.deleted
+        if deleted:
+            previous[name] = deleted[0]
+    return previous
+
+
+def _collect(session) -> Dict[int, dict]:
+    collected = {}
+    photo_items = set()
+    for obj in session.new:
+        if isinstance(obj, Item):
+            collected[obj.item_id] = {"event": "upsert", "item_id": obj.item_id, **_filter_values(obj)}
+        elif isinstance(obj, ItemPhoto):
+            photo_items.add(obj.item_id)
+    for obj in session.dirty:
+        if isinstance(obj, Item) and session.is_modified(obj):
+            collected[obj.item_id] = {
+                "event": "upsert", "item_id": obj.item_id, **_filter_values(obj), "previous": _previous_values(obj)
+            }
+        elif isinstance(obj, ItemPhoto) and session.is_modified(obj):
+            photo_items.add(obj.item_id)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            collected[obj.item_id] = {"event": "delete", "item_id": obj.item_id, **_filter_values(obj)}
+        elif isinstance(obj, ItemPhoto):
+            photo_items.add(obj.item_id)
+
+    # Photo-only changes need the item's filter columns from the database.
+    photo_items -= collected.keys()
+    if photo_items:
+        rows = session.execute(
+            select(Item.item_id, *(getattr(Item, column) for column in FILTER_FIELDS.values()))
+            .where(Item.item_id.in_(photo_items))
+        )
+        for item_id, *values in rows:
+            collected[item_id] = {"event": "upsert", "item_id": item_id, **dict(zip(FILTER_FIELDS, values))}
+    return collected
+
+
+def _queue(session, collected: Dict[int, dict]):
+    pending = session.info.setdefault("item_events", {})
+    for item_id, item_event in collected.items():
+        earlier = pending.get(item_id)
+        if earlier and "previous" in earlier:
+            # Keep the value from before the transaction's first change.
+            item_event["previous"] = {**item_event.get("previous", {}), **earlier["previous"]}
+        pending[item_id] = item_event
+
+
+# Events are gathered at flush and published only once the transaction
+# commits, so subscribers never see a change that was rolled back.
+@event.listens_for(Session, "after_flush")
+def collect_item_events(session, flush_context):
+    if item_events.active:
+        _queue(session, _collect(session))
+
+
+# Upserts for items changed by a core UPDATE, from their column values
+# before and after; published with the session's other events on commit.
+def queue_item_updates(session, before: List[dict], after: List[dict]):
+    if not item_events.active:
+        return
+    collected = {}
+    for old, new in zip(before, after):
+        previous = {name: old[column] for name, column in FILTER_FIELDS.items() if old[column] != new[column]}
+        collected[new["item_id"]] = {
+            "event": "upsert", "item_id": new["item_id"],
+            **{name: new[column] for name, column in FILTER_FIELDS.items()}, "previous": previous,
+        }
+    _queue(session, collected)
+
+
+@event.listens_for(Session, "after_commit")
+def publish_item_events(session):
+    pending = session.info.pop("item_events", None)
+    if pending:
+        item_events.publish(list(pending.values()))
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_item_events(session):
+    session.info.pop("item_events", None)
@@ -0,0 +1,118 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, insert, or_, select
+from sqlalchemy.orm import Session
+
+from models import Item, ItemHistory, ItemHistoryArchive, ItemStatus
+
+HISTORY_ARCHIVE_DAYS = int(os.environ.get("HISTORY_ARCHIVE_DAYS", "365"))
+ARCHIVE_BATCH_ITEMS = 500
+
+# How a run of consecutive same-action entries is collapsed: "span" actions
+# record old -> new values, so the run becomes first old -> last new; "concat"
+# actions describe their changes in old_value, so those are joined.
+COMPACTION = {
+    "Status_Changed": "span",
+    "Location_Changed": "span",
+    "Updated": "concat",
+    "Price_Changed": "concat",
+}
+
+
+@dataclass
+class ArchiveReport:
+    items: int = 0
+    archived: int = 0
+    written: int = 0
+
+
+def _archive_row(run: List[ItemHistory]) -> dict:
+    first, last = run[0], run[-1]
+    row = {
+        "history_id": last.history_id,
+        "item_id": last.item_id,
+        "action": last.action,
+        "action_date": last.action_date,
+        "old_value": first.old_value,
+        "new_value": last.new_value,
+        "notes": last.notes,
+        "merged_count": len(run),
+    }
+    if len(run) > 1:
+        if COMPACTION[last.action] == "concat":
+            row["old_value"] = "; ".join(dict.fromkeys(entry.old_value for entry in run if entry.old_value))
+        row["notes"] = f"{len(run)} consecutive {last.action} entries"
+    return row
+
+
+# `entries` are one item's history, oldest first.
+def compact(entries: List[ItemHistory]) -> List[dict]:
+    rows = []
+    run: List[ItemHistory] = []
+    for entry in entries:
+        if run and (entry.action != run[-1].action or entry.action not in COMPACTION):
+            rows.append(_archive_row(run))
+            run = []
+        run.append(entry)
+    if run:
+        rows.append(_archive_row(run))
+    return rows
+
+
+def _candidates(cutoff: datetime, include_sold: bool):
+    old = ItemHistory.action_date < cutoff
+    if not include_sold:
+        return old
+    sold_items = (
+        select(Item.item_id)
+        .join(ItemStatus, ItemStatus.status_id == Item.status_id)
+        .where(or_(Item.date_sold.is_not(None), ItemStatus.status_name == "Sold"))
+    )
+    return or_(old, ItemHistory.item_id.in_(sold_items))
+
+
+# Moves history older than `older_than_days` (and, with include_sold, all
+# history of sold items) into item_history_archive, compacting consecutive
+# edits. Each batch of items is copied and deleted in one transaction.
+def archive_history(
+    db: Session, older_than_days: int = HISTORY_ARCHIVE_DAYS, include_sold: bool = True,
+    dry_run: bool = False, now: Optional[datetime] = None
+) -> ArchiveReport:
+    report = ArchiveReport()
+    cutoff = (now or datetime.now()) - timedelta(days=older_than_days)
+    condition = _candidates(cutoff, include_sold)
+    item_ids = db.execute(select(ItemHistory.item_id).where(condition).distinct().order_by(ItemHistory.item_id)).scalars().all()
+
+    for start in range(0, len(item_ids), ARCHIVE_BATCH_ITEMS):
+        batch = item_ids[start:start + ARCHIVE_BATCH_ITEMS]
+        entries = db.execute(
+            select(ItemHistory)
+            .where(condition, ItemHistory.item_id.in_(batch))
+            .order_by(ItemHistory.item_id, ItemHistory.action_date, ItemHistory.history_id)
+        ).scalars().all()
+
+        per_item = {}
+        for entry in entries:
+            per_item.setdefault(entry.item_id, []).append(entry)
+        rows = [row for item_entries in per_item.values() for row in compact(item_entries)]
+
+        report.items += len(per_item)
+        report.archived += len(entries)
+        report.written += len(rows)
+        if dry_run:
+            db.expunge_all()
+            continue
+        if rows:
+            db.execute(insert(ItemHistoryArchive), rows)
+        # Rows written since the select have higher ids and stay behind.
+        last_id = max((entry.history_id for entry in entries), default=0)
+        db.execute(
+            delete(ItemHistory).where(condition, ItemHistory.item_id.in_(batch), ItemHistory.history_id <= last_id),
+            execution_options={"synchronize_session": False}
+        )
+        db.commit()
+        db.expunge_all()
+    return report
@@ -0,0 +1,200 @@
+import os
+import re
+import stat
+from email.utils import formatdate
+from typing import Optional, Tuple
+from urllib.parse import parse_qs
+
+from anyio.to_thread import run_sync
+
+import imaging
+import storage
+
+IMAGE_CACHE_MAX_AGE = int(os.environ.get("IMAGE_CACHE_MAX_AGE", str(365 * 24 * 3600)))
+SEND_CHUNK_BYTES = 256 * 1024
+
+# Content-addressed files, their variants and {item_id}_{uuid} uploads never
+# change under the same name, so clients may cache them without revalidating.
+# Variants of other sources are remade under the same name when the source
+# changes, so they are not immutable.
+IMMUTABLE_NAME = re.compile(r"^(variants/)?sha256/|^\d+_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.")
+SHA256_NAME = re.compile(r"^sha256/[0-9a-f]{2}/([0-9a-f]{64})\.")
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp",
+    ".gif": "image/gif", ".bmp": "image/bmp", ".tif": "image/tiff", ".tiff": "image/tiff",
+}
+
+
+def _etag(relative: str, st: os.stat_result) -> str:
+    match = SHA256_NAME.match(relative)
+    if match:
+        return f'"{match.group(1)}"'
+    return f'"{st.st_size:x}-{st.st_mtime_ns:x}-{st.st_ino:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    return any(tag.strip() in (etag, "*", f"W/{etag}") for tag in header.split(","))
+
+
+# Returns (start, end) inclusive, None for "send everything", or "invalid"
+# when no part of the range overlaps the file.
+def _parse_range(header: str, size: int):
+    units, _, spec = header.partition("=")
+    if units.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return "invalid"
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+# Picks the stored variant closest to ?size= (preferring one at least that
+# wide), as WebP when the client accepts it.
+def _negotiated_variant(relative: str, size: str, accept: str) -> Optional[str]:
+    try:
+        wanted = int(size)
+    except ValueError:
+        return None
+    source = os.path.join(storage.IMAGEDIR, relative)
+    formats = ("webp", "jpg") if "image/webp" in accept else ("jpg",)
+    widths = sorted(imaging.VARIANT_WIDTHS, key=lambda width: (width < wanted, abs(width - wanted)))
+    for fmt in formats:
+        for width in widths:
+            path = imaging.variant_path(source, width, fmt)
+            if os.path.isfile(path):
+                return os.path.relpath(path, storage.IMAGEDIR).replace(os.sep, "/")
+    return None
+
+
+class ImageFiles:
+    """Serves the images directory with long-lived caching, strong ETags,
+    single byte-range requests, ?size= variant negotiation and zero-copy
+    sends when the server offers the pathsend/zerocopysend extensions."""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+
+    def _resolve(self, relative: str) -> Optional[Tuple[str, os.stat_result]]:
+        # Hidden entries are quarantined files and in-flight uploads.
+        if any(part.startswith(".") for part in relative.split("/")):
+            return None
+        path = os.path.realpath(os.path.join(self.directory, relative))
+        if os.path.commonpath([path, self.directory]) != self.directory:
+            return None
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return path, st
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._respond(send, 405, [(b"allow", b"GET, HEAD")])
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        root_path = scope.get("root_path", "")
+        relative = scope["path"][len(root_path):] if scope["path"].startswith(root_path) else scope["path"]
+        relative = relative.lstrip("/")
+
+        vary = []
+        fallback = False
+        size = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("size")
+        if size:
+            vary.append((b"vary", b"Accept"))
+            variant = await run_sync(_negotiated_variant, relative, size[0], headers.get("accept", ""))
+            if variant is not None:
+                relative = variant
+            else:
+                fallback = True
+
+        resolved = await run_sync(self._resolve, relative)
+        if resolved is None:
+            await self._respond(send, 404, vary, b"Not Found")
+            return
+        path, st = resolved
+
+        etag = _etag(relative, st)
+        # A ?size= request served the original (no variant yet) must be
+        # revalidated, or the original would stay cached once variants exist.
+        cache_control = (
+            f"public, max-age={IMAGE_CACHE_MAX_AGE}, immutable" if IMMUTABLE_NAME.match(relative) and not fallback
+            else "public, no-cache"
+        )
+        base_headers = vary + [
+            (b"etag", etag.encode()),
+            (b"last-modified", formatdate(st.st_mtime, usegmt=True).encode()),
+            (b"cache-control", cache_control.encode()),
+            (b"accept-ranges", b"bytes"),
+        ]
+
+        if _etag_matches(headers.get("if-none-match", ""), etag):
+            await self._respond(send, 304, base_headers)
+            return
+
+        size = st.st_size
+        status, start, end = 200, 0, size - 1
+        range_header = headers.get("range")
+        if range_header and headers.get("if-range", etag) == etag:
+            byte_range = _parse_range(range_header, size)
+            if byte_range == "invalid":
+                await self._respond(send, 416, base_headers + [(b"content-range", f"bytes */{size}".encode())])
+                return
+            if byte_range is not None:
+                status, (start, end) = 206, byte_range
+                base_headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+
+        media_type = MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "application/octet-stream")
+        count = end - start + 1 if size else 0
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": base_headers + [
+                (b"content-type", media_type.encode()),
+                (b"content-length", str(count).encode()),
+            ],
+        })
+        if scope["method"] == "HEAD" or count == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await self._send_file(scope, send, path, start, count, status == 200)
+
+    async def _send_file(self, scope, send, path, start, count, whole_file):
+        extensions = scope.get("extensions") or {}
+        if whole_file and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": path})
+            return
+
+        with open(path, "rb") as f:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": f.fileno(), "offset": start, "count": count})
+                return
+
+            await run_sync(f.seek, start)
+            remaining = count
+            while remaining:
+                chunk = await run_sync(f.read, min(SEND_CHUNK_BYTES, remaining))
+                remaining = remaining - len(chunk) if chunk else 0
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+
+    async def _respond(self, send, status, headers, body=b""):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers + [(b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
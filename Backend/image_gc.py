@@ -0,0 +1,171 @@
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from models import ImageBlob, ImageMetadata, ImageVariant, ItemPhoto
+import imaging
+import storage
+
+# Orphaned files are first moved here, then deleted once they have sat in
+# quarantine for the grace period. Dot-directories are never served.
+QUARANTINE_DIR = os.path.join(storage.IMAGEDIR, ".quarantine")
+GC_GRACE_SECONDS = int(os.environ.get("IMAGE_GC_GRACE_SECONDS", str(24 * 3600)))
+GC_CHUNK_SIZE = 500
+
+
+@dataclass
+class GCReport:
+    scanned_files: int = 0
+    scanned_bytes: int = 0
+    quarantined: List[str] = field(default_factory=list)
+    quarantined_bytes: int = 0
+    restored: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    deleted_bytes: int = 0
+
+
+# Streams (path, size, mtime) for every stored image, skipping dot-directories
+# (quarantine) and in-flight .upload-*.part files.
+def iter_image_files(root: str = storage.IMAGEDIR) -> Iterator[Tuple[str, int, float]]:
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False) and imaging.is_image(entry.name):
+                    st = entry.stat()
+                    yield entry.path, st.st_size, st.st_mtime
+
+
+def _chunks(iterable, size: int):
+    chunk = []
+    for value in iterable:
+        chunk.append(value)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# A file is live if an item_photos row points at it, or it is a variant of
+# a file that one does.
+def referenced_paths(db: Session, web_paths: List[str]) -> set:
+    photos = db.execute(select(ItemPhoto.file_path).where(ItemPhoto.file_path.in_(web_paths)))
+    variants = db.execute(
+        select(ImageVariant.file_path)
+        .where(ImageVariant.file_path.in_(web_paths))
+        .where(ImageVariant.source_path.in_(select(ItemPhoto.file_path)))
+    )
+    return {path for (path,) in photos} | {path for (path,) in variants}
+
+
+def _quarantine_path(path: str) -> str:
+    return os.path.join(QUARANTINE_DIR, os.path.relpath(path, storage.IMAGEDIR))
+
+
+def _move(source: str, target: str):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(source, target)
+
+
+def _forget(db: Session, web_paths: List[str]):
+    db.execute(delete(ImageVariant).where(
+        ImageVariant.file_path.in_(web_paths) | ImageVariant.source_path.in_(web_paths)
+    ))
+    db.execute(delete(ImageMetadata).where(ImageMetadata.file_path.in_(web_paths)))
+    db.execute(delete(ImageBlob).where(ImageBlob.file_path.in_(web_paths), ImageBlob.ref_count <= 0))
+
+
+# Files younger than the grace period are left alone so an upload whose row
+# is not committed yet is never touched. Quarantined files that became
+# referenced again are restored; the rest are deleted (with their blob and
+# variant rows) once the grace period has passed since quarantine.
+def collect_garbage(db: Session, grace_seconds: int = GC_GRACE_SECONDS, dry_run: bool = False) -> GCReport:
+    report = GCReport()
+    cutoff = time.time() - grace_seconds
+
+    for chunk in _chunks(iter_image_files(), GC_CHUNK_SIZE):
+        live = referenced_paths(db, [imaging.web_path(path) for path, _, _ in chunk])
+        for path, size, mtime in chunk:
+            report.scanned_files += 1
+            report.scanned_bytes += size
+            if imaging.web_path(path) in live or mtime > cutoff:
+                continue
+            report.quarantined.append(path)
+            report.quarantined_bytes += size
+            if not dry_run:
+                target = _quarantine_path(path)
+                _move(path, target)
+                os.utime(target)
+
+    if not os.path.isdir(QUARANTINE_DIR):
+        return report
+    for chunk in _chunks(iter_image_files(QUARANTINE_DIR), GC_CHUNK_SIZE):
+        originals = {path: os.path.join(storage.IMAGEDIR, os.path.relpath(path, QUARANTINE_DIR)) for path, _, _ in chunk}
+        live = referenced_paths(db, [imaging.web_path(original) for original in originals.values()])
+        expired = []
+        for path, size, mtime in chunk:
+            original = originals[path]
+            if imaging.web_path(original) in live:
+                report.restored.append(original)
+                if not dry_run:
+                    _move(path, original)
+            elif mtime <= cutoff:
+                report.deleted.append(original)
+                report.deleted_bytes += size
+                expired.append(imaging.web_path(original))
+                if not dry_run:
+                    storage.remove_file(path)
+        if expired and not dry_run:
+            _forget(db, expired)
+            db.commit()
+    return report
+
+
+def storage_usage(db: Session, limit: int = 50) -> dict:
+    blobs = db.execute(
+        select(
+            func.count(ImageBlob.sha256),
+            func.coalesce(func.sum(ImageBlob.size_bytes), 0),
+            func.coalesce(func.sum(ImageBlob.size_bytes).filter(ImageBlob.ref_count <= 0), 0),
+        )
+    ).one()
+    photo_bytes = func.coalesce(func.sum(ImageBlob.size_bytes), 0)
+    per_item = db.execute(
+        select(
+            ItemPhoto.item_id,
+            func.count(ItemPhoto.photo_id).label("photo_count"),
+            photo_bytes.label("bytes"),
+        )
+        .outerjoin(ImageBlob, ImageBlob.file_path == ItemPhoto.file_path)
+        .group_by(ItemPhoto.item_id)
+        .order_by(photo_bytes.desc(), ItemPhoto.item_id)
+        .limit(limit)
+    ).all()
+    photo_count, referenced_bytes, untracked = db.execute(
+        select(
+            func.count(ItemPhoto.photo_id),
+            func.coalesce(func.sum(ImageBlob.size_bytes), 0),
+            func.count(ItemPhoto.photo_id).filter(ImageBlob.sha256.is_(None)),
+        ).outerjoin(ImageBlob, ImageBlob.file_path == ItemPhoto.file_path)
+    ).one()
+    variants = db.execute(select(func.count(ImageVariant.variant_id))).scalar()
+    return {
+        "stored_files": blobs[0],
+        "stored_bytes": blobs[1],
+        "unreferenced_bytes": blobs[2],
+        "photo_count": photo_count,
+        "photo_bytes": referenced_bytes,
+        "untracked_photos": untracked,
+        "variant_count": variants,
+        "items": [row._asdict() for row in per_item],
+    }
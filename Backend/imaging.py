@@ -0,0 +1,197 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import storage
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (160, 480, 1200)
+VARIANT_DIR = os.path.join(storage.IMAGEDIR, "variants")
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# Workers are started by a fork server (spawned where there is none), never
+# forked from the app: a fork would copy locks held by its other threads.
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff"}
+
+
+def is_image(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def web_path(file_path: str) -> str:
+    return "/" + os.path.relpath(file_path).replace(os.sep, "/")
+
+
+def disk_path(web_path: str) -> str:
+    return os.path.join(*web_path.lstrip("/").split("/"))
+
+
+# Variants mirror the source's subdirectory (e.g. images/items/) so names never
+# collide: images/items/hat.jpeg -> images/variants/items/hat_480w.webp.
+def variant_path(source: str, width: int, ext: str) -> str:
+    directory = os.path.relpath(os.path.dirname(source), storage.IMAGEDIR)
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return os.path.normpath(os.path.join(VARIANT_DIR, directory, f"{stem}_{width}w.{ext}"))
+
+
+# Runs in a worker process. Writes JPEG and WebP renditions of `source` at
+# each VARIANT_WIDTHS width (never upscaling) and returns their descriptions.
+def make_variants(source: str) -> List[dict]:
+    if Image is None:
+        return []
+    variants = []
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original).convert("RGB")
+        widths = [width for width in VARIANT_WIDTHS if width < original.width] or [original.width]
+        for width in widths:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            for fmt, ext, options in (
+                ("jpeg", "jpg", {"quality": 82, "progressive": True, "optimize": True}),
+                ("webp", "webp", {"quality": 80, "method": 4}),
+            ):
+                path = variant_path(source, width, ext)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                resized.save(path, fmt.upper(), **options)
+                variants.append({
+                    "file_path": web_path(path), "format": fmt, "width": width, "height": height
+                })
+    return variants
+
+
+BLURHASH_COMPONENTS = (4, 3)
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _to_srgb(value: float) -> int:
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+# Encodes a small RGB image as a blurhash (https://blurha.sh) string.
+def blurhash(image, components=BLURHASH_COMPONENTS) -> str:
+    cx, cy = components
+    pixels = np.asarray(image, dtype=np.float64) / 255
+    linear = np.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+    height, width = linear.shape[:2]
+    xs = np.cos(np.pi * np.outer(np.arange(cx), np.arange(width)) / width)
+    ys = np.cos(np.pi * np.outer(np.arange(cy), np.arange(height)) / height)
+    # factors[j, i] = mean over pixels of basis(i, j) * colour, doubled for AC terms.
+    factors = np.einsum("jy,ix,yxc->jic", ys, xs, linear) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, np.floor(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _base83(0, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+    quantised = np.clip(np.floor(np.sign(ac) * np.sqrt(np.abs(ac / max_value)) * 9 + 9.5), 0, 18).astype(int)
+    for r, g, b in quantised:
+        result += _base83(int(r) * 361 + int(g) * 19 + int(b), 2)
+    return result
+
+
+# 64-bit difference hash: one bit per horizontally adjacent pixel pair of a
+# 9x8 greyscale thumbnail. Near-identical photos differ in only a few bits.
+def dhash(image) -> str:
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = value << 1 | (pixels[row * 9 + col + 1] > pixels[row * 9 + col])
+    return f"{value:016x}"
+
+
+# Runs in a worker process, for images that are not stored (duplicate checks).
+def dhash_bytes(data: bytes) -> str:
+    with Image.open(io.BytesIO(data)) as original:
+        return dhash(ImageOps.exif_transpose(original))
+
+
+# Runs in a worker process. Dimensions are as displayed (after EXIF rotation).
+def describe_image(source: str) -> Optional[dict]:
+    if Image is None:
+        return None
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert("RGB")
+    thumbnail = image.copy()
+    thumbnail.thumbnail((32, 32))
+    palette = thumbnail.quantize(colors=5)
+    count, index = max(palette.getcolors())
+    r, g, b = palette.getpalette()[index * 3:index * 3 + 3]
+    return {
+        "width": image.width,
+        "height": image.height,
+        "size_bytes": os.path.getsize(source),
+        "dominant_color": f"#{r:02x}{g:02x}{b:02x}",
+        "blurhash": blurhash(thumbnail) if np is not None else None,
+        "dhash": dhash(image),
+    }
+
+
+async def generate_metadata(source: str) -> Optional[dict]:
+    if Image is None:
+        return None
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pool(), describe_image, source)
+    except Exception:
+        logger.warning("Could not read metadata for %s", source, exc_info=True)
+        return None
+
+
+async def generate_variants(source: str) -> List[dict]:
+    if Image is None:
+        return []
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pool(), make_variants, source)
+    except Exception:
+        logger.warning("Could not create variants for %s", source, exc_info=True)
+        return []
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+# Opt-in repeated statement detector: 0 disables it, otherwise a request that
+# runs the same statement more than SQL_REPEAT_THRESHOLD times is logged
+# (SQL_REPEAT_MODE=log) or fails (SQL_REPEAT_MODE=raise).
+SQL_REPEAT_THRESHOLD = int(os.environ.get("SQL_REPEAT_THRESHOLD", "0"))
+SQL_REPEAT_MODE = os.environ.get("SQL_REPEAT_MODE", "log")
+
+# Statements slower than SLOW_QUERY_THRESHOLD_MS (0 disables) are written with
+# their query plan to a rotating log file and kept for GET /admin/slow-queries.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", "250"))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.environ.get("SLOW_QUERY_LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get("SLOW_QUERY_LOG_BACKUPS", "5"))
+
+slow_queries = deque(maxlen=int(os.environ.get("SLOW_QUERY_BUFFER", "200")))
+slow_query_logger = logging.getLogger("slow_queries")
+slow_query_logger.propagate = False
+_slow_query_handler_lock = threading.Lock()
+
+
+class RepeatedStatementError(RuntimeError):
+    pass
+
+
+class RequestSQLStats:
+    __slots__ = (
+        "scope", "method", "path", "count", "total_time", "slowest_time", "slowest_statement",
+        "shapes", "context"
+    )
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.context = {}
+        self.count = 0
+        self.total_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement: Optional[str] = None
+        self.shapes = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.total_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = statement
+
+        if SQL_REPEAT_THRESHOLD:
+            self.shapes[statement] += 1
+            if self.shapes[statement] == SQL_REPEAT_THRESHOLD + 1:
+                message = (
+                    f"{self.method} {self.path} executed the same statement more than "
+                    f"{SQL_REPEAT_THRESHOLD} times: {statement[:200]}"
+                )
+                if SQL_REPEAT_MODE == "raise":
+                    raise RepeatedStatementError(message)
+                logger.warning(message)
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return route.path if route is not None else self.path
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.total_time * 1000:.2f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest_time * 1000:.2f}"
+        )
+
+
+_current_stats: ContextVar[Optional[RequestSQLStats]] = ContextVar("request_sql_stats", default=None)
+
+
+def current_stats() -> Optional[RequestSQLStats]:
+    return _current_stats.get()
+
+
+# Attach request details (e.g. the ItemFilters of a search) to slow query entries.
+def annotate_request(**context):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.context.update(context)
+
+
+def _explain(conn, statement, parameters):
+    if conn.dialect.name != "sqlite":
+        return []
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    except Exception as exc:
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        cursor.close()
+
+
+# The file is opened on the first slow query; threadpool workers can hit it
+# at once, and two handlers on one file would duplicate lines and rotations.
+def _slow_query_handler():
+    with _slow_query_handler_lock:
+        if not slow_query_logger.handlers:
+            handler = RotatingFileHandler(
+                SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_MAX_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS
+            )
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.INFO)
+    return slow_query_logger
+
+
+def record_slow_query(conn, statement, parameters, duration, executemany, stats):
+    entry = {
+        "logged_at": datetime.now(),
+        "duration_ms": round(duration * 1000, 3),
+        "sql": statement,
+        "parameters": [] if executemany else (parameters if isinstance(parameters, dict) else list(parameters or ())),
+        "method": stats.method if stats else None,
+        "route": stats.route if stats else None,
+        "context": dict(stats.context) if stats else {},
+        "plan": [] if executemany else _explain(conn, statement, parameters),
+    }
+    slow_queries.append(entry)
+    _slow_query_handler().info(json.dumps(entry, default=str))
+
+
+# The start time lives on the statement's execution context rather than the
+# connection, so a statement that raises leaves nothing behind for the next.
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    context.statement_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context.statement_start
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+    if SLOW_QUERY_THRESHOLD_MS and duration * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        record_slow_query(conn, statement, parameters, duration, executemany, stats)
+
+
+class SQLTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSQLStats(scope)
+        token = _current_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+                if stats.slowest_statement is not None:
+                    logger.debug(
+                        "%s %s: %d statements in %.2fms, slowest %.2fms: %s",
+                        stats.method, stats.path, stats.count, stats.total_time * 1000,
+                        stats.slowest_time * 1000, stats.slowest_statement
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
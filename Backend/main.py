@@ -1,14 +1,25 @@
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.exc import IntegrityError
 from contextlib import asynccontextmanager
 import os
 
 from database import init_db
+from image_files import ImageFiles
+from instrumentation import SQLTimingMiddleware
+from metrics import MetricsMiddleware
+from storage import UploadLimitMiddleware
+import crud
+import events
+import imaging
+import metrics
+import serializers
 from routes_items import router as items_router
+from routes_admin import router as admin_router
+from routes_analytics import router as analytics_router
+from routes_stocktake import router as stocktake_router
 from routes_reference import (
     router_departments, router_categories, router_item_types,
     router_sizes, router_colors, router_tags, router_conditions,
@@ -18,7 +29,10 @@ from routes_reference import (
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    imaging.get_pool()
     yield
+    events.item_events.close()
+    imaging.shutdown_pool()
 
 
 app = FastAPI(
@@ -27,13 +41,19 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+app.add_middleware(UploadLimitMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
+app.add_middleware(SQLTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+metrics.register_cache("statements", crud.statement_cache_info)
+metrics.register_cache("reference_fragments", serializers.fragments.info)
 
 
 @app.get("/")
@@ -44,9 +64,17 @@ def root():
 def health_check():
     return {"status": "ok"}
 
+@app.get("/health/cache")
+def statement_cache_stats():
+    return {"statement_cache": crud.statement_cache_info()}
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 
 if os.path.exists("images"):
-    app.mount("/images", StaticFiles(directory="images"), name="images")
+    app.mount("/images", ImageFiles(directory="images"), name="images")
 app.include_router(items_router)
 app.include_router(router_departments)
 app.include_router(router_categories)
@@ -57,6 +85,9 @@ app.include_router(router_tags)
 app.include_router(router_conditions)
 app.include_router(router_item_statuses)
 app.include_router(router_locations)
+app.include_router(admin_router)
+app.include_router(analytics_router)
+app.include_router(stocktake_router)
 
 
 @app.exception_handler(IntegrityError)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Maintenance commands for the analytics tables."""
+
+import argparse
+import time
+
+from database import SessionLocal, init_db
+import rollups
+import sales
+import shelf_stats
+
+TABLES = {"inventory_rollups": rollups, "shelf_daily_stats": shelf_stats, "sales_daily": sales}
+
+
+def rebuild(args):
+    init_db()
+    db = SessionLocal()
+    try:
+        for table, module in TABLES.items():
+            start = time.perf_counter()
+            drift = module.find_drift(db)
+            module.rebuild(db)
+            db.commit()
+            print(f"Rebuilt {table} in {time.perf_counter() - start:.1f}s; {len(drift)} rows had drifted.")
+    finally:
+        db.close()
+
+
+def check(args):
+    init_db()
+    db = SessionLocal()
+    try:
+        for table, module in TABLES.items():
+            drift = module.find_drift(db)
+            if args.verbose:
+                for key, stored, actual in drift:
+                    print(f"  {table} {key}: stored {stored}, actual {actual}")
+            print(f"{table}: {len(drift)} rows differ from the items table.")
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild", help="Recompute the analytics tables from the items table.")
+    rebuild_parser.set_defaults(handler=rebuild)
+
+    check_parser = commands.add_parser("check", help="Count analytics rows that disagree with the items table.")
+    check_parser.add_argument("-v", "--verbose", action="store_true", help="List every differing row.")
+    check_parser.set_defaults(handler=check)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Maintenance commands for item history."""
+
+import argparse
+import time
+
+from database import SessionLocal, init_db
+import history_archive
+
+
+def archive(args):
+    init_db()
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        report = history_archive.archive_history(db, args.older_than_days, not args.keep_sold, args.dry_run)
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start
+    prefix = "Would archive" if args.dry_run else "Archived"
+    print(f"{prefix} {report.archived} history entries for {report.items} items "
+          f"as {report.written} archive rows in {elapsed:.1f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = commands.add_parser(
+        "archive", help="Move old and sold-item history into item_history_archive, compacting repeated edits."
+    )
+    archive_parser.add_argument(
+        "--older-than-days", type=int, default=history_archive.HISTORY_ARCHIVE_DAYS,
+        help="Archive entries older than this many days (default: HISTORY_ARCHIVE_DAYS or 365)."
+    )
+    archive_parser.add_argument("--keep-sold", action="store_true", help="Do not archive recent history of sold items.")
+    archive_parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+    archive_parser.set_defaults(handler=archive)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Maintenance commands for stored item images."""
+
+import argparse
+import os
+import shutil
+import time
+
+from sqlalchemy import update
+
+from database import SessionLocal, init_db
+from models import ImageMetadata, ImageVariant, ItemPhoto
+import crud
+import image_gc
+import imaging
+import storage
+
+SOURCE_DIRS = (storage.IMAGEDIR, os.path.join(storage.IMAGEDIR, "items"))
+# Where dedupe looks for copies to hard-link when no --link is given.
+DEFAULT_LINK_DIRS = ("Clothes",)
+
+
+def find_sources():
+    for directory in SOURCE_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and imaging.is_image(entry.name):
+                    yield os.path.join(directory, entry.name)
+
+
+# Runs `work` over `paths` in the image process pool and hands each result to
+# `record`, committing every `batch_size` images.
+def _process_in_pool(db, paths, work, record, batch_size):
+    start = time.perf_counter()
+    failed = 0
+    futures = [(path, imaging.get_pool().submit(work, path)) for path in paths]
+    try:
+        for count, (path, future) in enumerate(futures, 1):
+            try:
+                result = future.result()
+            except Exception as exc:
+                failed += 1
+                print(f"  skipped {path}: {exc}")
+                continue
+            record(path, result)
+            if count % batch_size == 0:
+                db.commit()
+        db.commit()
+    finally:
+        imaging.shutdown_pool()
+    return time.perf_counter() - start, failed
+
+
+def backfill_variants(args):
+    if imaging.Image is None:
+        print("Pillow is not installed; no variants can be generated.")
+        return
+
+    init_db()
+    db = SessionLocal()
+    created = 0
+
+    def record(path, variants):
+        nonlocal created
+        crud.add_image_variants(db, imaging.web_path(path), variants)
+        created += len(variants)
+
+    try:
+        done = {path for (path,) in db.query(ImageVariant.source_path).distinct()}
+        sources = [
+            path for path in find_sources()
+            if args.force or imaging.web_path(path) not in done
+        ]
+        print(f"Generating variants for {len(sources)} images with {imaging.IMAGE_WORKERS} workers...")
+        elapsed, failed = _process_in_pool(db, sources, imaging.make_variants, record, args.batch_size)
+    finally:
+        db.close()
+
+    print(f"Done: {created} variants from {len(sources) - failed} images in {elapsed:.1f}s ({failed} skipped).")
+
+
+def _photo_items(db, file_path: str):
+    return {item_id for (item_id,) in db.query(ItemPhoto.item_id).filter(ItemPhoto.file_path == file_path)}
+
+
+def backfill_metadata(args):
+    if imaging.Image is None:
+        print("Pillow is not installed; no metadata can be read.")
+        return
+
+    init_db()
+    db = SessionLocal()
+    try:
+        photo_paths = (
+            db.query(ItemPhoto.file_path)
+            .outerjoin(ImageMetadata, ImageMetadata.file_path == ItemPhoto.file_path)
+            .filter(ImageMetadata.file_path.is_(None) | ImageMetadata.dhash.is_(None))
+            .distinct()
+        )
+        sources = [imaging.disk_path(path) for (path,) in photo_paths]
+        missing = [path for path in sources if not os.path.isfile(path)]
+        sources = [path for path in sources if os.path.isfile(path)]
+        print(f"Reading metadata for {len(sources)} photos with {imaging.IMAGE_WORKERS} workers "
+              f"({len(missing)} photo files are missing)...")
+
+        # Items whose photos gain a hash are logged so every API process's
+        # similarity index reloads them.
+        def record(path, metadata):
+            file_path = imaging.web_path(path)
+            crud.add_image_metadata(db, file_path, metadata)
+            crud.record_item_changes(db, _photo_items(db, file_path))
+
+        elapsed, failed = _process_in_pool(db, sources, imaging.describe_image, record, args.batch_size)
+    finally:
+        db.close()
+
+    print(f"Done: {len(sources) - failed} photos in {elapsed:.1f}s ({failed} skipped).")
+
+
+def _link_or_copy(source: str, target: str):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f"{target}.part"
+    try:
+        os.link(source, temp)
+    except OSError:
+        shutil.copy2(source, temp)
+    os.replace(temp, target)
+
+
+def _hard_link(blob: str, path: str) -> bool:
+    temp = f"{path}.part"
+    try:
+        os.link(blob, temp)
+    except OSError:
+        return False
+    os.replace(temp, path)
+    return True
+
+
+# Moves images/ and images/items/ into content-addressed storage in four
+# restartable steps: place one copy of each distinct file under its hash,
+# repoint item_photos and image_variants at it, commit, and only then remove
+# the old files. Identical files in --link directories become hard links.
+def dedupe(args):
+    link_dirs = args.link or DEFAULT_LINK_DIRS
+    sources = list(find_sources())
+    print(f"Hashing {len(sources)} images...")
+    blobs = {}
+    moves = {}
+    for path in sources:
+        sha256 = storage.file_sha256(path)
+        if sha256 not in blobs:
+            target = storage.find_blob(sha256) or storage.blob_path(sha256, os.path.splitext(path)[1])
+            blobs[sha256] = (target, os.path.getsize(path), path)
+        moves[path] = sha256
+
+    linked = []
+    for directory in link_dirs:
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if entry.is_file() and imaging.is_image(entry.name):
+                sha256 = storage.file_sha256(entry.path)
+                if sha256 in blobs:
+                    linked.append((entry.path, sha256))
+
+    saved = sum(os.path.getsize(path) for path in moves) - sum(size for _, size, _ in blobs.values())
+    print(f"{len(blobs)} distinct files, {len(moves) - len(blobs)} duplicates, {saved} bytes reclaimed; "
+          f"{len(linked)} files to hard-link in {', '.join(link_dirs)}.")
+    if args.dry_run:
+        for path, sha256 in moves.items():
+            print(f"  {path} -> {blobs[sha256][0]}")
+        return
+
+    for target, _, first in blobs.values():
+        if not os.path.exists(target):
+            _link_or_copy(first, target)
+
+    init_db()
+    db = SessionLocal()
+    stale_variants = []
+    try:
+        for path, sha256 in moves.items():
+            target, size, _ = blobs[sha256]
+            old_path, new_path = imaging.web_path(path), imaging.web_path(target)
+            crud.register_image_blob(db, sha256, new_path, size)
+            crud.record_item_changes(db, _photo_items(db, old_path))
+            db.execute(update(ItemPhoto).where(ItemPhoto.file_path == old_path).values(file_path=new_path))
+            # Identical files each had their own variants; keep one set per blob.
+            has_variants = db.query(ImageVariant.variant_id).filter(ImageVariant.source_path == new_path).first()
+            for variant in db.query(ImageVariant).filter(ImageVariant.source_path == old_path):
+                if has_variants:
+                    stale_variants.append(variant.file_path)
+                    db.delete(variant)
+                else:
+                    variant.source_path = new_path
+            db.flush()
+        crud.recount_blob_references(db)
+        db.commit()
+    finally:
+        db.close()
+
+    for path in moves:
+        storage.remove_file(path)
+    for file_path in stale_variants:
+        storage.remove_file(imaging.disk_path(file_path))
+    hard_links = sum(1 for path, sha256 in linked if _hard_link(blobs[sha256][0], path))
+    print(f"Done: {len(moves)} files moved into {storage.BLOB_DIR}, {hard_links} hard links created.")
+
+
+def collect_garbage(args):
+    init_db()
+    db = SessionLocal()
+    try:
+        report = image_gc.collect_garbage(db, int(args.grace_hours * 3600), args.dry_run)
+    finally:
+        db.close()
+    prefix = "Would have q" if args.dry_run else "Q"
+    print(f"Scanned {report.scanned_files} files ({report.scanned_bytes} bytes).")
+    print(f"{prefix}uarantined {len(report.quarantined)} orphaned files ({report.quarantined_bytes} bytes), "
+          f"restored {len(report.restored)}, deleted {len(report.deleted)} ({report.deleted_bytes} bytes).")
+    if args.verbose:
+        for label, paths in (("quarantine", report.quarantined), ("restore", report.restored), ("delete", report.deleted)):
+            for path in paths:
+                print(f"  {label} {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backfill = commands.add_parser(
+        "backfill-variants", help="Create resized JPEG/WebP variants for images in images/ and images/items/."
+    )
+    backfill.add_argument("--force", action="store_true", help="Regenerate variants that already exist.")
+    backfill.add_argument("--batch-size", type=int, default=100, help="Images per database commit.")
+    backfill.set_defaults(handler=backfill_variants)
+
+    metadata = commands.add_parser(
+        "backfill-metadata", help="Record dimensions, size, dominant colour, blurhash and perceptual hash for existing photos."
+    )
+    metadata.add_argument("--batch-size", type=int, default=100, help="Photos per database commit.")
+    metadata.set_defaults(handler=backfill_metadata)
+
+    dedupe_parser = commands.add_parser(
+        "dedupe", help="Move images/ and images/items/ into content-addressed storage, merging duplicates."
+    )
+    dedupe_parser.add_argument(
+        "--link", action="append", default=None, metavar="DIR",
+        help=f"Replace files identical to a stored image with hard links (default: {', '.join(DEFAULT_LINK_DIRS)})."
+    )
+    dedupe_parser.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+    dedupe_parser.set_defaults(handler=dedupe)
+
+    gc = commands.add_parser(
+        "gc", help="Quarantine image files no photo refers to, and delete them after the grace period."
+    )
+    gc.add_argument(
+        "--grace-hours", type=float, default=image_gc.GC_GRACE_SECONDS / 3600,
+        help="Minimum age before a file is quarantined, and time spent in quarantine before deletion."
+    )
+    gc.add_argument("--dry-run", action="store_true", help="Only report what would change.")
+    gc.add_argument("-v", "--verbose", action="store_true", help="List every affected file.")
+    gc.set_defaults(handler=collect_garbage)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from anyio.to_thread import current_default_thread_limiter
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Recording only appends to a deque (atomic under the GIL), so request threads
+# never wait on each other. Pending observations are folded into the totals
+# when /metrics is scraped, or by whichever thread first sees the backlog grow
+# past FOLD_THRESHOLD.
+FOLD_THRESHOLD = 10000
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._pending = deque()
+        self._fold_lock = threading.Lock()
+
+    def _record(self, labels, value):
+        self._pending.append((labels, value))
+        if len(self._pending) > FOLD_THRESHOLD and self._fold_lock.acquire(blocking=False):
+            try:
+                self._drain()
+            finally:
+                self._fold_lock.release()
+
+    def _drain(self):
+        pending = self._pending
+        while pending:
+            labels, value = pending.popleft()
+            self._apply(labels, value)
+
+    def collect(self):
+        with self._fold_lock:
+            self._drain()
+            lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, description, labelnames=()):
+        super().__init__(name, description, labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._record(labels, amount)
+
+    def _apply(self, labels, value):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def _samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self._record(labels, -amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, *labels, value):
+        self._record(labels, value)
+
+    def _apply(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _samples(self):
+        for labels, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (le,))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            label_text = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_text} {total}"
+            yield f"{self.name}_count{label_text} {count}"
+
+
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route.", ("method", "route")
+)
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+db_checkout_duration = Histogram(
+    "db_connection_checkout_seconds", "How long sessions hold a pooled database connection."
+)
+bulk_rows_written = Counter(
+    "bulk_rows_written_total", "Rows written by the bulk item endpoints.", ("operation",)
+)
+event_subscribers = Gauge("event_subscribers", "Clients connected to the item event stream.")
+events_dropped = Counter(
+    "events_dropped_total", "Item events discarded because a subscriber fell too far behind."
+)
+
+_metrics = [
+    http_requests, http_request_duration, http_requests_in_flight, db_checkout_duration, bulk_rows_written,
+    event_subscribers, events_dropped,
+]
+_caches = {}
+
+
+# `info` is a callable returning a dict with "hits" and "misses".
+def register_cache(name: str, info):
+    _caches[name] = info
+
+
+def _cache_lines():
+    lines = []
+    for metric, key in (("cache_hits_total", "hits"), ("cache_misses_total", "misses")):
+        lines.append(f"# HELP {metric} Cache {key} by cache name.")
+        lines.append(f"# TYPE {metric} counter")
+        for name, info in _caches.items():
+            lines.append(f'{metric}{{cache="{name}"}} {info()[key]}')
+    return lines
+
+
+def _threadpool_lines():
+    limiter = current_default_thread_limiter()
+    stats = limiter.statistics()
+    return [
+        "# HELP threadpool_tokens_total Worker threads available to sync endpoints.",
+        "# TYPE threadpool_tokens_total gauge",
+        f"threadpool_tokens_total {limiter.total_tokens}",
+        "# HELP threadpool_tokens_in_use Worker threads currently busy.",
+        "# TYPE threadpool_tokens_in_use gauge",
+        f"threadpool_tokens_in_use {stats.borrowed_tokens}",
+        "# HELP threadpool_tasks_waiting Calls queued for a free worker thread.",
+        "# TYPE threadpool_tasks_waiting gauge",
+        f"threadpool_tasks_waiting {stats.tasks_waiting}",
+    ]
+
+
+# Must be called from the event loop: the threadpool limiter is loop-local.
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.collect())
+    lines.extend(_cache_lines())
+    lines.extend(_threadpool_lines())
+    return "\n".join(lines) + "\n"
+
+
+@event.listens_for(Pool, "checkout")
+def start_checkout_timer(dbapi_conn, connection_record, connection_proxy):
+    connection_record.info["checkout_start"] = time.perf_counter()
+
+
+@event.listens_for(Pool, "checkin")
+def record_checkout_duration(dbapi_conn, connection_record):
+    start = connection_record.info.pop("checkout_start", None)
+    if start is not None:
+        db_checkout_duration.observe(value=time.perf_counter() - start)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    return scope.get("root_path") or "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = _route_label(scope)
+            http_requests.inc(scope["method"], route, status_code)
+            http_request_duration.observe(scope["method"], route, value=duration)
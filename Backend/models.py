@@ -1,6 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
-from sqlalchemy import Boolean, Column, Integer, String, Text, DECIMAL, DateTime, ForeignKey, Table
+from sqlalchemy import Boolean, Column, Integer, String, Text, DECIMAL, Date, DateTime, ForeignKey, Index, Table
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -132,31 +132,33 @@ class Location(Base):
     items: Mapped[List["Item"]] = relationship("Item", back_populates="current_location")
 
 
+# Columns marked active_history load their old value even when set on an
+# expired instance, so flush listeners (analytics, events) see what changed.
 class Item(Base):
     __tablename__ = 'items'
     
     item_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    department_id: Mapped[int] = mapped_column(Integer, ForeignKey('departments.department_id'), nullable=False)
-    category_id: Mapped[int] = mapped_column(Integer, ForeignKey('categories.category_id'), nullable=False)
+    department_id: Mapped[int] = mapped_column(Integer, ForeignKey('departments.department_id'), nullable=False, active_history=True)
+    category_id: Mapped[int] = mapped_column(Integer, ForeignKey('categories.category_id'), nullable=False, active_history=True)
     item_type_id: Mapped[int] = mapped_column(Integer, ForeignKey('item_types.item_type_id'), nullable=False)
-    brand: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    brand: Mapped[Optional[str]] = mapped_column(String, nullable=True, active_history=True)
     size_id: Mapped[int] = mapped_column(Integer, ForeignKey('sizes.size_id'), nullable=False)
     color_primary_id: Mapped[int] = mapped_column(Integer, ForeignKey('colors.color_id'), nullable=False)
     color_secondary_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('colors.color_id'), nullable=True)
     material: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    condition_id: Mapped[int] = mapped_column(Integer, ForeignKey('conditions.condition_id'), nullable=False)
-    status_id: Mapped[int] = mapped_column(Integer, ForeignKey('item_status.status_id'), nullable=False)
-    current_location_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('locations.location_id'), nullable=True)
-    price: Mapped[float] = mapped_column(DECIMAL(10, 2), nullable=False)
-    original_price: Mapped[Optional[float]] = mapped_column(DECIMAL(10, 2), nullable=True)
-    on_sale: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
-    sale_price: Mapped[Optional[float]] = mapped_column(DECIMAL(10, 2), nullable=True)
+    condition_id: Mapped[int] = mapped_column(Integer, ForeignKey('conditions.condition_id'), nullable=False, active_history=True)
+    status_id: Mapped[int] = mapped_column(Integer, ForeignKey('item_status.status_id'), nullable=False, active_history=True)
+    current_location_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('locations.location_id'), nullable=True, index=True, active_history=True)
+    price: Mapped[float] = mapped_column(DECIMAL(10, 2), nullable=False, active_history=True)
+    original_price: Mapped[Optional[float]] = mapped_column(DECIMAL(10, 2), nullable=True, active_history=True)
+    on_sale: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False, active_history=True)
+    sale_price: Mapped[Optional[float]] = mapped_column(DECIMAL(10, 2), nullable=True, active_history=True)
     description: Mapped[str] = mapped_column(Text, nullable=False)
     internal_notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     customer_notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     season: Mapped[Optional[str]] = mapped_column(String, nullable=True)
-    date_added: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
-    date_sold: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    date_added: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now(), active_history=True)
+    date_sold: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True, active_history=True)
     
     department: Mapped["Department"] = relationship("Department", back_populates="items")
     category: Mapped["Category"] = relationship("Category", back_populates="items")
@@ -183,6 +185,59 @@ class ItemPhoto(Base):
     uploaded_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
     
     item: Mapped["Item"] = relationship("Item", back_populates="photos")
+    variants: Mapped[List["ImageVariant"]] = relationship(
+        "ImageVariant",
+        primaryjoin="ItemPhoto.file_path == foreign(ImageVariant.source_path)",
+        order_by="(ImageVariant.format, ImageVariant.width)",
+        viewonly=True
+    )
+    image_metadata: Mapped[Optional["ImageMetadata"]] = relationship(
+        "ImageMetadata",
+        primaryjoin="ItemPhoto.file_path == foreign(ImageMetadata.file_path)",
+        lazy="joined",
+        viewonly=True
+    )
+
+    width = property(lambda self: self.image_metadata.width if self.image_metadata else None)
+    height = property(lambda self: self.image_metadata.height if self.image_metadata else None)
+    size_bytes = property(lambda self: self.image_metadata.size_bytes if self.image_metadata else None)
+    dominant_color = property(lambda self: self.image_metadata.dominant_color if self.image_metadata else None)
+    blurhash = property(lambda self: self.image_metadata.blurhash if self.image_metadata else None)
+
+
+class ImageMetadata(Base):
+    __tablename__ = 'image_metadata'
+    
+    file_path: Mapped[str] = mapped_column(String, primary_key=True)
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    dominant_color: Mapped[Optional[str]] = mapped_column(String(7), nullable=True)
+    blurhash: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    dhash: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+    created_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
+class ImageBlob(Base):
+    __tablename__ = 'image_blobs'
+    
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    file_path: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    size_bytes: Mapped[int] = mapped_column(Integer, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    created_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+
+class ImageVariant(Base):
+    __tablename__ = 'image_variants'
+    
+    variant_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    source_path: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    file_path: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    format: Mapped[str] = mapped_column(String, nullable=False)
+    width: Mapped[int] = mapped_column(Integer, nullable=False)
+    height: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
 
 
 class ItemHistory(Base):
@@ -197,3 +252,149 @@ class ItemHistory(Base):
     notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
     item: Mapped["Item"] = relationship("Item", back_populates="history")
+
+    # history_id is the rowid, so this index also orders ties on action_date.
+    # AUTOINCREMENT: ids moved to item_history_archive must never be reused.
+    __table_args__ = (
+        Index("ix_item_history_item_id_action_date", "item_id", "action_date"),
+        {"sqlite_autoincrement": True},
+    )
+
+
+# Old and sold-item history moved out of item_history by history_archive.py.
+# history_id is kept from the original row (the last one of a compacted run),
+# and merged_count records how many original entries the row stands for.
+class ItemHistoryArchive(Base):
+    __tablename__ = 'item_history_archive'
+    
+    history_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    item_id: Mapped[int] = mapped_column(Integer, ForeignKey('items.item_id', ondelete='CASCADE'), nullable=False)
+    action: Mapped[str] = mapped_column(String, nullable=False)
+    action_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    old_value: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    new_value: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    merged_count: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    archived_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (Index("ix_item_history_archive_item_id_action_date", "item_id", "action_date"),)
+
+
+# One row per item that changed, holding its latest change only: earlier rows
+# for the item are removed when a new one is written, so reading everything
+# after a cursor costs one row per changed item. Deleted items keep a
+# tombstone row. AUTOINCREMENT keeps change_id from ever being reused.
+class ItemChange(Base):
+    __tablename__ = 'item_changes'
+    
+    change_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    item_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    deleted: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    changed_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+# A version per reference table, bumped in the same transaction as every
+# write to it through the ORM, so each worker process can tell when its
+# cached copy of the table is stale.
+class CacheVersion(Base):
+    __tablename__ = 'cache_versions'
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# Inventory totals per (department, category, status, location, condition),
+# kept current by rollups.py in the same transaction as every item write.
+# Money is held in integer cents so repeated increments never drift, and
+# items without a location are counted under location_id 0.
+class InventoryRollup(Base):
+    __tablename__ = 'inventory_rollups'
+    
+    department_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    category_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    location_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    condition_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    item_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    price_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sale_price_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sale_price_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# Per-day shelf statistics per (department, category, brand, condition),
+# kept current by shelf_stats.py in the same transaction as every item write.
+# A row's added/unsold counts describe the items added that day (unsold_count
+# is how many of them are still unsold); its sold columns describe the items
+# sold that day, with days on shelf bucketed as sold_within_<N> days. Items
+# without a brand are counted under brand "".
+class ShelfDailyStats(Base):
+    __tablename__ = 'shelf_daily_stats'
+    
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    department_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    category_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    brand: Mapped[str] = mapped_column(String, primary_key=True)
+    condition_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    added_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    unsold_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    days_on_shelf_total: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_7: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_14: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_30: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_60: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_90: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_180: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_within_365: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    sold_after_365: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# Sold items per day of date_sold and (department, category, location),
+# kept current by sales.py. Revenue is the sale price when the item is on
+# sale, otherwise its price; discounts are measured against original_price
+# for the items that have one. Amounts are integer cents; location_id 0
+# means no location.
+class SalesDaily(Base):
+    __tablename__ = 'sales_daily'
+    
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    department_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    category_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    location_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    sold_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    revenue_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    original_price_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    discount_cents: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    discounted_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# A count of one location. When it starts, the unsold items recorded there
+# are copied into stock_take_expected; scans accumulate in stock_take_scans,
+# and the two are compared with set operations on their primary keys.
+class StockTake(Base):
+    __tablename__ = 'stock_takes'
+    
+    stock_take_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    location_id: Mapped[int] = mapped_column(Integer, ForeignKey('locations.location_id'), nullable=False)
+    status: Mapped[str] = mapped_column(String, nullable=False, default="open")
+    started_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
+    completed_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    notes: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+
+class StockTakeExpected(Base):
+    __tablename__ = 'stock_take_expected'
+    
+    stock_take_id: Mapped[int] = mapped_column(Integer, ForeignKey('stock_takes.stock_take_id', ondelete='CASCADE'), primary_key=True)
+    item_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+
+class StockTakeScan(Base):
+    __tablename__ = 'stock_take_scans'
+    
+    stock_take_id: Mapped[int] = mapped_column(Integer, ForeignKey('stock_takes.stock_take_id', ondelete='CASCADE'), primary_key=True)
+    item_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    scan_count: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
+    last_scanned_date: Mapped[datetime] = mapped_column(DateTime, nullable=False, server_default=func.now())
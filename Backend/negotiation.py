@@ -0,0 +1,98 @@
+from contextvars import ContextVar
+from typing import Any, Callable
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+def _media_ranges(header: str):
+    for part in header.split(","):
+        media_type, *params = [piece.strip() for piece in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        yield media_type.lower(), quality
+
+
+def accepts_msgpack(accept: str) -> bool:
+    if msgpack is None or not accept:
+        return False
+    msgpack_q = json_q = 0.0
+    for media_type, quality in _media_ranges(accept):
+        if media_type in MSGPACK_MEDIA_TYPES:
+            msgpack_q = max(msgpack_q, quality)
+        elif media_type == "application/json":
+            json_q = max(json_q, quality)
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+
+def is_msgpack(content_type: str) -> bool:
+    return content_type.split(";")[0].strip().lower() in MSGPACK_MEDIA_TYPES
+
+
+def wants_msgpack() -> bool:
+    return _wants_msgpack.get()
+
+
+class MsgPackRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = msgpack.unpackb(await self.body())
+        return self._json
+
+
+class MsgPackRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def negotiating_handler(request: Request) -> Response:
+            if is_msgpack(request.headers.get("content-type", "")):
+                if msgpack is None:
+                    return JSONResponse(status_code=415, content={"detail": "MessagePack support is not installed"})
+                # FastAPI only parses JSON content types as a body, so present the
+                # payload as JSON and let MsgPackRequest.json() decode it.
+                scope = dict(request.scope)
+                scope["headers"] = [
+                    (key, b"application/json" if key == b"content-type" else value)
+                    for key, value in request.scope["headers"]
+                ]
+                request = MsgPackRequest(scope, request.receive)
+
+            token = _wants_msgpack.set(accepts_msgpack(request.headers.get("accept", "")))
+            try:
+                response = await handler(request)
+            finally:
+                _wants_msgpack.reset(token)
+            response.headers.append("Vary", "Accept")
+            return response
+
+        return negotiating_handler
+
+
+# FastAPI hands the response class the response_model output already reduced to
+# plain JSON types, so MessagePack is packed straight from it with no JSON step.
+class NegotiatedResponse(JSONResponse):
+    def __init__(self, content: Any, *args, **kwargs):
+        self.msgpack = _wants_msgpack.get()
+        if self.msgpack:
+            self.media_type = "application/msgpack"
+        super().__init__(content, *args, **kwargs)
+
+    def render(self, content: Any) -> bytes:
+        if self.msgpack:
+            return msgpack.packb(content)
+        return super().render(content)
@@ -0,0 +1,172 @@
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.orm import Session
+
+from models import Item, ItemChange
+
+PRICE_MIN_COMPARABLES = int(os.environ.get("PRICE_MIN_COMPARABLES", "5"))
+PRICE_LOOKBACK_DAYS = int(os.environ.get("PRICE_LOOKBACK_DAYS", "730"))
+PRICE_LOAD_CHUNK = 900
+
+# Attribute sets tried from most to least specific; the first with at least
+# PRICE_MIN_COMPARABLES sold items in the lookback window is used. Omitted
+# attributes are left out of every level.
+MATCH_LEVELS = (
+    ("brand", "item_type_id", "condition_id", "size_id", "material"),
+    ("brand", "item_type_id", "condition_id", "size_id"),
+    ("brand", "item_type_id", "condition_id"),
+    ("brand", "item_type_id"),
+    ("item_type_id", "condition_id", "size_id"),
+    ("item_type_id", "condition_id"),
+    ("item_type_id",),
+)
+TEXT_FIELDS = ("brand", "material")
+ID_FIELDS = ("item_type_id", "condition_id", "size_id")
+
+_NONE = -1
+_UNKNOWN = -2
+
+# What a sold item went for: its sale price if it sold on sale, else price.
+_sold_price = case((and_(Item.on_sale, Item.sale_price.is_not(None)), Item.sale_price), else_=Item.price)
+
+
+def _normalise(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip().lower()
+    return value or None
+
+
+class SoldItemSnapshot:
+    """Sold items' price, sale day and comparable attributes as parallel
+    NumPy arrays, so a suggestion is a few vectorised comparisons. Brand
+    and material are stored as integer codes. The first search loads every
+    sold item; later searches apply only the items logged in item_changes
+    since the last one, so writes from any process are picked up."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._cursor = 0
+        self._codes: Dict[str, Dict[str, int]] = {field: {} for field in TEXT_FIELDS}
+        self.item_ids = np.empty(0, dtype=np.int64)
+        self.columns: Dict[str, np.ndarray] = {
+            "price_cents": np.empty(0, dtype=np.int64),
+            "sold_day": np.empty(0, dtype="datetime64[D]"),
+            **{field: np.empty(0, dtype=np.int32) for field in (*TEXT_FIELDS, *ID_FIELDS)},
+        }
+
+    def _code(self, field: str, value: Optional[str]) -> int:
+        value = _normalise(value)
+        if value is None:
+            return _NONE
+        return self._codes[field].setdefault(value, len(self._codes[field]))
+
+    # Code of a queried value; values never sold match nothing.
+    def _lookup(self, field: str, value: Optional[str]) -> int:
+        value = _normalise(value)
+        return _NONE if value is None else self._codes[field].get(value, _UNKNOWN)
+
+    def _sold_rows(self, db: Session, item_ids: Optional[List[int]] = None):
+        query = select(
+            Item.item_id, _sold_price, Item.date_sold, Item.brand, Item.material,
+            Item.item_type_id, Item.condition_id, Item.size_id,
+        ).where(Item.date_sold.is_not(None))
+        if item_ids is None:
+            return db.execute(query.execution_options(yield_per=10000)).all()
+        rows = []
+        for start in range(0, len(item_ids), PRICE_LOAD_CHUNK):
+            rows.extend(db.execute(query.where(Item.item_id.in_(item_ids[start:start + PRICE_LOAD_CHUNK]))))
+        return rows
+
+    def _arrays(self, rows) -> tuple:
+        count = len(rows)
+        item_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+        columns = {
+            "price_cents": np.fromiter((int(round(float(row[1]) * 100)) for row in rows), dtype=np.int64, count=count),
+            "sold_day": np.array([row[2].date() for row in rows], dtype="datetime64[D]"),
+            "brand": np.fromiter((self._code("brand", row[3]) for row in rows), dtype=np.int32, count=count),
+            "material": np.fromiter((self._code("material", row[4]) for row in rows), dtype=np.int32, count=count),
+        }
+        for index, field in enumerate(ID_FIELDS, start=5):
+            columns[field] = np.fromiter((row[index] for row in rows), dtype=np.int32, count=count)
+        return item_ids, columns
+
+    # Drops every changed item and re-adds those that are (still) sold.
+    def _apply(self, db: Session, changed: List[int]):
+        item_ids, columns = self._arrays(self._sold_rows(db, changed))
+        keep = ~np.isin(self.item_ids, np.asarray(changed, dtype=np.int64))
+        self.item_ids = np.concatenate((self.item_ids[keep], item_ids))
+        self.columns = {name: np.concatenate((values[keep], columns[name])) for name, values in self.columns.items()}
+
+    def refresh(self, db: Session):
+        with self._lock:
+            if not self._loaded:
+                # Take the cursor first: items changed during the load are
+                # applied again on the next refresh, which is harmless.
+                self._cursor = db.execute(select(func.coalesce(func.max(ItemChange.change_id), 0))).scalar()
+                self.item_ids, self.columns = self._arrays(self._sold_rows(db))
+                self._loaded = True
+                return
+            rows = db.execute(
+                select(ItemChange.change_id, ItemChange.item_id)
+                .where(ItemChange.change_id > self._cursor)
+                .order_by(ItemChange.change_id)
+            ).all()
+            if rows:
+                self._apply(db, list({item_id for _, item_id in rows}))
+                self._cursor = rows[-1][0]
+
+    # Suggested price (median of the comparables) with the interquartile
+    # range as its confidence band.
+    def suggest(
+        self, db: Session, brand: Optional[str] = None, item_type_id: Optional[int] = None,
+        condition_id: Optional[int] = None, size_id: Optional[int] = None, material: Optional[str] = None,
+        today: Optional[datetime] = None
+    ) -> dict:
+        self.refresh(db)
+        with self._lock:
+            columns, codes = self.columns, {
+                "brand": self._lookup("brand", brand) if brand else None,
+                "material": self._lookup("material", material) if material else None,
+            }
+        wanted = {**codes, "item_type_id": item_type_id, "condition_id": condition_id, "size_id": size_id}
+        given = {field: value for field, value in wanted.items() if value is not None}
+
+        today = (today or datetime.now(timezone.utc)).date()
+        recent = columns["sold_day"] >= np.datetime64(today - timedelta(days=PRICE_LOOKBACK_DAYS), "D")
+        prices, matched_on = columns["price_cents"][:0], []
+        for level in MATCH_LEVELS:
+            fields = [field for field in level if field in given]
+            mask = recent.copy()
+            for field in fields:
+                mask &= columns[field] == given[field]
+            if mask.sum() > len(prices):
+                prices, matched_on = columns["price_cents"][mask], fields
+            if len(prices) >= PRICE_MIN_COMPARABLES:
+                break
+
+        result = {
+            "suggested_price": None, "low": None, "high": None,
+            "comparables": int(len(prices)), "matched_on": matched_on, "confidence": "none",
+        }
+        if not len(prices):
+            return result
+        low, median, high = np.percentile(prices, (25, 50, 75))
+        if len(prices) < PRICE_MIN_COMPARABLES:
+            confidence = "low"
+        elif len(matched_on) == len(given) and len(prices) >= 4 * PRICE_MIN_COMPARABLES:
+            confidence = "high"
+        else:
+            confidence = "medium"
+        result.update(
+            suggested_price=round(median / 100, 2), low=round(low / 100, 2), high=round(high / 100, 2),
+            confidence=confidence,
+        )
+        return result
+
+
+sold_items = SoldItemSnapshot()
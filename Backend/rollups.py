@@ -0,0 +1,203 @@
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import Integer, cast, delete, event, func, insert, inspect, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import InventoryRollup, Item
+
+# Rollup key columns, keyed by the item attribute each is taken from.
+KEY_COLUMNS = {
+    "department_id": "department_id",
+    "category_id": "category_id",
+    "status_id": "status_id",
+    "current_location_id": "location_id",
+    "condition_id": "condition_id",
+}
+TRACKED = (*KEY_COLUMNS, "price", "sale_price")
+GROUP_COLUMNS = tuple(KEY_COLUMNS.values())
+MEASURES = ("item_count", "price_cents", "sale_price_cents", "sale_price_count")
+
+
+def to_cents(value) -> int:
+    return int(round(float(value) * 100)) if value is not None else 0
+
+
+def _key(values: dict) -> tuple:
+    return tuple(values[attr] or 0 for attr in KEY_COLUMNS)
+
+
+def _measures(values: dict, sign: int) -> tuple:
+    sale_price = values["sale_price"]
+    return (sign, sign * to_cents(values["price"]), sign * to_cents(sale_price), sign * (sale_price is not None))
+
+
+def current_values(item: Item, attrs: Sequence[str]) -> dict:
+    return {attr: getattr(item, attr) for attr in attrs}
+
+
+def committed_values(item: Item, attrs: Sequence[str]) -> dict:
+    values = {}
+    state = inspect(item).attrs
+    for attr in attrs:
+        history = state[attr].history
+        values[attr] = history.deleted[0] if history.deleted else getattr(item, attr)
+    return values
+
+
+# Calls add(values, sign) with +1 for the state of every item a flush
+# writes and -1 for the state it replaces, for items whose `tracked`
+# attributes changed.
+def item_deltas(session, tracked: Sequence[str], add, current=current_values):
+    for item in session.new:
+        if isinstance(item, Item):
+            add(current(item, tracked), 1)
+    for item in session.dirty:
+        if isinstance(item, Item):
+            state = inspect(item).attrs
+            if any(state[attr].history.has_changes() for attr in tracked):
+                add(committed_values(item, tracked), -1)
+                add(current(item, tracked), 1)
+    for item in session.deleted:
+        if isinstance(item, Item):
+            add(committed_values(item, tracked), -1)
+
+
+# The same for items changed outside the unit of work (core UPDATEs), from
+# each item's `tracked` values before and after the write.
+def value_deltas(before: Sequence[dict], after: Sequence[dict], add):
+    for values in before:
+        add(values, -1)
+    for values in after:
+        add(values, 1)
+
+
+def _add(deltas, values: dict, sign: int):
+    row = deltas[_key(values)]
+    for index, amount in enumerate(_measures(values, sign)):
+        row[index] += amount
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0] * len(MEASURES))
+
+
+def _deltas(session) -> Dict[tuple, List[int]]:
+    deltas = _new_deltas()
+    item_deltas(session, TRACKED, lambda values, sign: _add(deltas, values, sign))
+    return {key: values for key, values in deltas.items() if any(values)}
+
+
+# Adds each key's measure deltas to its row of `model`, creating missing
+# rows, in one statement.
+def increment(db, model, key_columns: Sequence[str], measures: Sequence[str], deltas: Dict[tuple, Sequence[int]]):
+    if not deltas:
+        return
+    rows = [{**dict(zip(key_columns, key)), **dict(zip(measures, values))} for key, values in deltas.items()]
+    stmt = sqlite_insert(model).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={measure: getattr(model, measure) + getattr(stmt.excluded, measure) for measure in measures}
+    ))
+
+
+# Replaces every row of `model` with `stats` ({key: measures}).
+def replace_rows(db, model, key_columns: Sequence[str], measures: Sequence[str], stats: Dict[tuple, Sequence[int]],
+                 chunk_size: int = 5000):
+    db.execute(delete(model))
+    rows = [{**dict(zip(key_columns, key)), **dict(zip(measures, values))} for key, values in stats.items()]
+    for start in range(0, len(rows), chunk_size):
+        db.execute(insert(model), rows[start:start + chunk_size])
+
+
+# Rows of `model` whose measures differ from `actual`, as (key, stored,
+# actual) tuples; missing rows count as all zeros.
+def compare_rows(db, model, key_columns: Sequence[str], measures: Sequence[str], actual: Dict[tuple, Sequence[int]]):
+    stored = {
+        tuple(row[:len(key_columns)]): tuple(row[len(key_columns):])
+        for row in db.execute(select(
+            *(getattr(model, column) for column in key_columns), *(getattr(model, measure) for measure in measures)
+        ))
+    }
+    actual = {key: tuple(values) for key, values in actual.items()}
+    empty = (0,) * len(measures)
+    return [
+        (key, stored.get(key, empty), actual.get(key, empty))
+        for key in sorted(actual.keys() | stored.keys(), key=lambda key: tuple(str(value) for value in key))
+        if stored.get(key, empty) != actual.get(key, empty)
+    ]
+
+
+def apply_deltas(db: Session, deltas: Dict[tuple, Sequence[int]]):
+    increment(db, InventoryRollup, GROUP_COLUMNS, MEASURES, deltas)
+
+
+# Adjusted in the same transaction as every ORM insert, update and delete of
+# an item, so the totals never disagree with committed items.
+@event.listens_for(Session, "after_flush")
+def maintain_inventory_rollups(session, flush_context):
+    apply_deltas(session, _deltas(session))
+
+
+# For items changed by a core UPDATE, from their values before and after.
+def apply_changes(db, before: Sequence[dict], after: Sequence[dict]):
+    deltas = _new_deltas()
+    value_deltas(before, after, lambda values, sign: _add(deltas, values, sign))
+    apply_deltas(db, {key: values for key, values in deltas.items() if any(values)})
+
+
+def _totals_from_items():
+    return select(
+        Item.department_id, Item.category_id, Item.status_id,
+        func.coalesce(Item.current_location_id, 0), Item.condition_id,
+        func.count(Item.item_id),
+        func.coalesce(func.sum(cast(func.round(Item.price * 100), Integer)), 0),
+        func.coalesce(func.sum(cast(func.round(Item.sale_price * 100), Integer)), 0),
+        func.count(Item.sale_price),
+    ).group_by(
+        Item.department_id, Item.category_id, Item.status_id,
+        func.coalesce(Item.current_location_id, 0), Item.condition_id,
+    )
+
+
+# Recomputes every group from items; `db` may be a Session or a Connection.
+def rebuild(db):
+    db.execute(delete(InventoryRollup))
+    db.execute(insert(InventoryRollup).from_select([*GROUP_COLUMNS, *MEASURES], _totals_from_items()))
+
+
+def find_drift(db: Session) -> List[tuple]:
+    width = len(GROUP_COLUMNS)
+    actual = {tuple(row[:width]): tuple(row[width:]) for row in db.execute(_totals_from_items())}
+    return compare_rows(db, InventoryRollup, GROUP_COLUMNS, MEASURES, actual)
+
+
+# Sums the rollup rows matching `filters` per combination of `group_by`
+# columns; the cost depends on the number of groups, not items.
+def inventory_summary(db: Session, group_by: Sequence[str], filters: Optional[Dict[str, int]] = None) -> dict:
+    columns = [getattr(InventoryRollup, column) for column in group_by]
+    sums = [func.sum(getattr(InventoryRollup, measure)) for measure in MEASURES]
+    conditions = [
+        getattr(InventoryRollup, column) == value for column, value in (filters or {}).items() if value is not None
+    ]
+    groups = db.execute(
+        select(*columns, *sums).where(*conditions).group_by(*columns).having(sums[0] > 0).order_by(*columns)
+    ).all()
+
+    def describe(values):
+        count, price_cents, sale_cents, sale_count = (value or 0 for value in values)
+        return {
+            "item_count": count,
+            "total_price": price_cents / 100,
+            "average_price": round(price_cents / count / 100, 2) if count else None,
+            "total_sale_price": sale_cents / 100,
+            "average_sale_price": round(sale_cents / sale_count / 100, 2) if sale_count else None,
+        }
+
+    rows = []
+    for row in groups:
+        keys = {column: (value or None) if column == "location_id" else value for column, value in zip(group_by, row)}
+        rows.append({**keys, **describe(row[len(group_by):])})
+    totals = describe([sum(row[len(group_by) + index] for row in groups) for index in range(len(MEASURES))])
+    return {"groups": rows, "totals": totals}
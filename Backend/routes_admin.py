@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import List
+
+from database import get_db
+from schemas import SlowQuery, StorageUsage
+import image_gc
+import instrumentation
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+@router.get("/slow-queries", response_model=List[SlowQuery])
+def list_slow_queries(limit: int = Query(50, ge=1, le=500)):
+    entries = list(instrumentation.slow_queries)
+    entries.reverse()
+    return entries[:limit]
+
+
+# Bytes are those of the original uploads recorded in image_blobs; photos
+# stored before content addressing are counted under untracked_photos.
+@router.get("/storage", response_model=StorageUsage)
+def storage_usage(limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_db)):
+    return image_gc.storage_usage(db, limit)
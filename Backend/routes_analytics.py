@@ -0,0 +1,111 @@
+from datetime import date, datetime, timedelta, timezone
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+
+from database import get_db
+from negotiation import MsgPackRoute, NegotiatedResponse
+from schemas import AgedInventoryReport, InventorySummary, SalesReport, SellThroughReport
+import rollups
+import sales
+import shelf_stats
+
+router = APIRouter(
+    prefix="/analytics", tags=["analytics"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
+
+
+def _group_columns(group_by: List[str], allowed) -> List[str]:
+    unknown = [column for column in group_by if column not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot group by {', '.join(unknown)}; use {', '.join(allowed)}")
+    return list(dict.fromkeys(group_by))
+
+
+# Defaults to the 30 days up to today (UTC).
+def _date_range(date_from: Optional[date], date_to: Optional[date]):
+    date_to = date_to or datetime.now(timezone.utc).date()
+    date_from = date_from or date_to - timedelta(days=30)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+    return date_from, date_to
+
+
+# Stock counts and value read from the inventory_rollups table, grouped by
+# any of department_id, category_id, status_id, location_id and
+# condition_id (repeat group_by for several). location_id 0 selects items
+# with no location.
+@router.get("/inventory", response_model=InventorySummary, response_model_exclude_unset=True)
+def inventory_summary(
+    group_by: List[str] = Query(["department_id"]),
+    department_id: Optional[int] = Query(None),
+    category_id: Optional[int] = Query(None),
+    status_id: Optional[int] = Query(None),
+    location_id: Optional[int] = Query(None),
+    condition_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    group_by = _group_columns(group_by, rollups.GROUP_COLUMNS)
+    filters = {
+        "department_id": department_id, "category_id": category_id, "status_id": status_id,
+        "location_id": location_id, "condition_id": condition_id,
+    }
+    return rollups.inventory_summary(db, group_by, filters)
+
+
+# Sell-through rate and days on shelf over [from, to] (default: the last 30
+# days), from the shelf_daily_stats table, grouped by any of department_id,
+# category_id, brand and condition_id.
+@router.get("/sell-through", response_model=SellThroughReport, response_model_exclude_unset=True)
+def sell_through(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    group_by: List[str] = Query(["department_id"]),
+    department_id: Optional[int] = Query(None),
+    category_id: Optional[int] = Query(None),
+    brand: Optional[str] = Query(None),
+    condition_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    date_from, date_to = _date_range(date_from, date_to)
+    filters = {"department_id": department_id, "category_id": category_id, "brand": brand, "condition_id": condition_id}
+    return shelf_stats.sell_through(
+        db, date_from, date_to, _group_columns(group_by, shelf_stats.SLICE_COLUMNS), filters
+    )
+
+
+# Unsold items bucketed by days since they were added.
+@router.get("/aged-inventory", response_model=AgedInventoryReport, response_model_exclude_unset=True)
+def aged_inventory(
+    group_by: List[str] = Query(["department_id"]),
+    department_id: Optional[int] = Query(None),
+    category_id: Optional[int] = Query(None),
+    brand: Optional[str] = Query(None),
+    condition_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    filters = {"department_id": department_id, "category_id": category_id, "brand": brand, "condition_id": condition_id}
+    return shelf_stats.aged_inventory(db, _group_columns(group_by, shelf_stats.SLICE_COLUMNS), filters)
+
+
+# Revenue time series from the sales_daily buckets, per day, week (from
+# Monday) or month, optionally split by department_id, category_id and
+# location_id. Discounts compare the amount paid with original_price.
+@router.get("/sales", response_model=SalesReport, response_model_exclude_unset=True)
+def sales_report(
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    granularity: str = Query("day", pattern="^(day|week|month)$"),
+    group_by: List[str] = Query([]),
+    department_id: Optional[int] = Query(None),
+    category_id: Optional[int] = Query(None),
+    location_id: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    date_from, date_to = _date_range(date_from, date_to)
+    filters = {"department_id": department_id, "category_id": category_id, "location_id": location_id}
+    return sales.sales_series(
+        db, date_from, date_to, granularity, _group_columns(group_by, sales.DIMENSIONS), filters
+    )
@@ -1,22 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Form
+from fastapi import (
+    APIRouter, Depends, HTTPException, status, Query, File, UploadFile, Form, Request, Response, WebSocket,
+    WebSocketDisconnect
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import math
-import shutil
+import asyncio
+import json
 import os
-import uuid
 
 from database import get_db
 from schemas import (
     Item, ItemCreate, ItemUpdate, ItemWithRelations, ItemWithHistory,
-    ItemList, ItemFilters, ItemPhoto, ItemPhotoCreate, ItemPhotoUpdate,
-    ItemHistory, BulkUpdateStatus, BulkUpdateLocation, BulkUpdatePrice, BulkDelete
+    ItemList, ItemChanges, ItemFilters, ItemPhoto, ItemPhotoCreate, ItemPhotoUpdate,
+    ItemHistory, PriceSuggestion, SimilarItem, BulkUpdateStatus, BulkUpdateLocation, BulkUpdatePrice, BulkDelete
 )
 import crud
+import events
+import imaging
+import instrumentation
+import metrics
+import negotiation
+import pricing
+import serializers
+import similarity
+import storage
+
+HISTORY_PREVIEW_LIMIT = 10
+
+router = APIRouter(
+    prefix="/items", tags=["items"],
+    route_class=negotiation.MsgPackRoute, default_response_class=negotiation.NegotiatedResponse
+)
+
+
+# Files are stored once per distinct content (see storage.save_blob), so
+# re-uploading the same bytes adds only an item_photos row.
+async def _save_upload(file: UploadFile) -> storage.StoredBlob:
+    file_extension = os.path.splitext(file.filename)[1]
+    try:
+        return await run_in_threadpool(storage.save_blob, file.file, file_extension)
+    except storage.UploadTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+
+
+# Stored files still to be processed: those with no committed image_blobs
+# row. Whether this request wrote the file is not enough, since a concurrent
+# upload of the same bytes may not have committed yet, or may fail.
+async def _unprocessed(db: Session, stored_files: List[storage.StoredBlob]) -> List[storage.StoredBlob]:
+    committed = await run_in_threadpool(crud.get_image_blob_hashes, db, [stored.sha256 for stored in stored_files])
+    return list({stored.path: stored for stored in stored_files if stored.sha256 not in committed}.values())
+
 
-router = APIRouter(prefix="/items", tags=["items"])
+# Resized JPEG/WebP renditions and layout metadata are made in the image
+# process pool. A photo whose processing fails is still saved and can be
+# backfilled later.
+async def _process_upload(stored: storage.StoredBlob):
+    return await asyncio.gather(imaging.generate_variants(stored.path), imaging.generate_metadata(stored.path))
+
+
+def _photo_upload(stored: storage.StoredBlob, variants, metadata):
+    blob = {"sha256": stored.sha256, "size_bytes": stored.size}
+    return imaging.web_path(stored.path), blob, variants, metadata
 
-IMAGEDIR = "images/"
 
 @router.post("/{item_id}/photos/upload", response_model=ItemPhoto, status_code=status.HTTP_201_CREATED)
 async def upload_item_photo(
@@ -26,35 +73,78 @@ async def upload_item_photo(
     sort_order: int = Form(1),
     db: Session = Depends(get_db)
 ):
-    if not crud.get_item(db, item_id, with_relations=False):
+    # Disk and DB work runs in the threadpool so large uploads never block the event loop.
+    if not await run_in_threadpool(crud.get_item, db, item_id, with_relations=False):
         raise HTTPException(status_code=404, detail="Item not found")
 
-    # Ensure image directory exists
-    if not os.path.exists(IMAGEDIR):
-        os.makedirs(IMAGEDIR)
-    
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{item_id}_{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(IMAGEDIR, unique_filename)
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    # Create DB record
-    # API serves images at /images/{filename}
-    web_path = f"/images/{unique_filename}"
-    
+    # If the insert below fails, the stored files are left to the image
+    # garbage collector: another request may already point at the same blob.
+    stored = await _save_upload(file)
+    variants, metadata = await _process_upload(stored) if await _unprocessed(db, [stored]) else ([], None)
+
+    file_path, blob, variants, metadata = _photo_upload(stored, variants, metadata)
     photo_create = ItemPhotoCreate(
         item_id=item_id,
-        file_path=web_path,
+        file_path=file_path,
         is_primary=is_primary,
         sort_order=sort_order
     )
-    
-    return crud.create_item_photo(db, photo_create)
+    return await run_in_threadpool(crud.create_item_photo, db, photo_create, variants, blob, metadata)
+
+
+# Saves all files concurrently, then inserts their photos in one transaction,
+# ordered after the item's existing photos. The first file becomes primary if
+# the item has no primary photo yet.
+@router.post("/{item_id}/photos/upload-batch", response_model=List[ItemPhoto], status_code=status.HTTP_201_CREATED)
+async def upload_item_photos(
+    item_id: int,
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db)
+):
+    if len(files) > storage.MAX_BATCH_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {storage.MAX_BATCH_FILES} files per batch")
+    if not await run_in_threadpool(crud.get_item, db, item_id, with_relations=False):
+        raise HTTPException(status_code=404, detail="Item not found")
 
+    # As for single uploads, files stored before a failure are left to the
+    # image garbage collector.
+    results = await asyncio.gather(*(_save_upload(file) for file in files), return_exceptions=True)
+    failures = [result for result in results if isinstance(result, BaseException)]
+    if failures:
+        raise failures[0]
+
+    # The same bytes may appear twice in one batch; process them once.
+    new_files = await _unprocessed(db, results)
+    processed = dict(zip(
+        (stored.path for stored in new_files), await asyncio.gather(*map(_process_upload, new_files))
+    ))
+    uploads = [(stored, *processed.pop(stored.path, ([], None))) for stored in results]
+    return await run_in_threadpool(
+        crud.create_item_photos, db, item_id, [_photo_upload(*upload) for upload in uploads]
+    )
+
+
+
+# Hashes a photo without storing it and returns items whose photos are near
+# duplicates, so staff can check for an existing entry before creating one.
+@router.post("/duplicate-check", response_model=List[SimilarItem])
+async def check_duplicate_photo(
+    file: UploadFile = File(...),
+    max_distance: int = Query(similarity.DUPLICATE_MAX_DISTANCE, ge=0, le=64),
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    if imaging.Image is None:
+        raise HTTPException(status_code=503, detail="Image processing is not installed")
+    data = await file.read(storage.MAX_UPLOAD_BYTES + 1)
+    if len(data) > storage.MAX_UPLOAD_BYTES:
+        detail = str(storage.UploadTooLarge(storage.MAX_UPLOAD_BYTES))
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=detail)
+    try:
+        photo_hash = await asyncio.get_running_loop().run_in_executor(imaging.get_pool(), imaging.dhash_bytes, data)
+    except Exception:
+        raise HTTPException(status_code=400, detail="File is not a readable image")
+    return await run_in_threadpool(similarity.photo_hashes.search, db, [photo_hash], max_distance, limit)
 
 
 @router.get("/", response_model=ItemList)
@@ -89,27 +179,156 @@ def list_items(
         season=season, tag_ids=tag_ids, search=search,
         page=page, page_size=page_size, sort_by=sort_by, sort_order=sort_order
     )
+    instrumentation.annotate_request(filters=filters.model_dump(exclude_none=True))
     
-    items, total = crud.get_items(db, filters)
-    total_pages = math.ceil(total / page_size) if total > 0 else 0
-    
-    return ItemList(
-        items=items, total=total, page=page,
-        page_size=page_size, total_pages=total_pages
-    )
+    layout = serializers.MSGPACK if negotiation.wants_msgpack() else serializers.JSON
+    return Response(content=serializers.render_item_list(db, filters, layout), media_type=layout.media_type)
 
 
 @router.post("/", response_model=ItemWithRelations, status_code=status.HTTP_201_CREATED)
 def create_item(item: ItemCreate, db: Session = Depends(get_db)):
-    return crud.create_item(db, item)
+    db_item = crud.create_item(db, item)
+    if db_item is None:
+        raise HTTPException(status_code=400, detail="No sold comparables to suggest a price from; price is required")
+    return db_item
+
+
+# Suggested price from comparable items sold in the last PRICE_LOOKBACK_DAYS,
+# matching as many of the given attributes as still leaves enough of them.
+@router.get("/price-suggestion", response_model=PriceSuggestion)
+def suggest_price(
+    brand: Optional[str] = Query(None),
+    item_type_id: Optional[int] = Query(None),
+    condition_id: Optional[int] = Query(None),
+    size_id: Optional[int] = Query(None),
+    material: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    return pricing.sold_items.suggest(db, brand, item_type_id, condition_id, size_id, material)
+
+
+# Delta sync: returns items created or changed and ids deleted after change
+# `since`, oldest change first. Pass the returned cursor as `since` on the
+# next call, repeating while has_more is true; since=0 returns every item.
+@router.get("/changes", response_model=ItemChanges)
+def list_item_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    items, deleted_ids, cursor, has_more = crud.get_item_changes(db, since, limit)
+    return {"items": items, "deleted_ids": deleted_ids, "cursor": cursor, "has_more": has_more}
+
+
+# Live events
+
+def _event_filters(department_id, category_id, status_id, location_id):
+    return {
+        "department_id": department_id, "category_id": category_id,
+        "status_id": status_id, "location_id": location_id,
+    }
+
+
+# Server-Sent Events stream of committed item changes, optionally filtered
+# (repeat a parameter to allow several values). Each event carries the
+# item's department, category, status and location, and under "previous"
+# any of those the change replaced. An "overflow" event means events were
+# dropped; catch up through GET /items/changes.
+@router.get("/events")
+async def stream_item_events(
+    request: Request,
+    department_id: Optional[List[int]] = Query(None),
+    category_id: Optional[List[int]] = Query(None),
+    status_id: Optional[List[int]] = Query(None),
+    location_id: Optional[List[int]] = Query(None),
+):
+    filters = _event_filters(department_id, category_id, status_id, location_id)
+
+    async def stream():
+        subscription = events.item_events.subscribe(filters)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    item_event = await asyncio.wait_for(subscription.get(), events.EVENT_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                if item_event is None:
+                    break
+                yield f"event: {item_event['event']}\ndata: {json.dumps(item_event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
+# The same events over a WebSocket, as JSON messages. The client may send a
+# JSON object of filters (e.g. {"status_id": [2, 3]}) to replace its
+# subscription's filters at any time.
+@router.websocket("/events/ws")
+async def item_events_socket(
+    websocket: WebSocket,
+    department_id: Optional[List[int]] = Query(None),
+    category_id: Optional[List[int]] = Query(None),
+    status_id: Optional[List[int]] = Query(None),
+    location_id: Optional[List[int]] = Query(None),
+):
+    await websocket.accept()
+    subscription = events.item_events.subscribe(_event_filters(department_id, category_id, status_id, location_id))
+
+    async def forward():
+        while (item_event := await subscription.get()) is not None:
+            await websocket.send_json(item_event)
+        await websocket.close()
+
+    async def receive_filters():
+        while True:
+            try:
+                filters = await websocket.receive_json()
+            except ValueError:
+                filters = None
+            if not isinstance(filters, dict):
+                await websocket.send_json({"event": "error", "detail": "Expected a JSON object of filters"})
+                continue
+            try:
+                subscription.set_filters(filters)
+            except ValueError as exc:
+                await websocket.send_json({"event": "error", "detail": str(exc)})
+
+    tasks = [asyncio.create_task(forward()), asyncio.create_task(receive_filters())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if task.exception() and not isinstance(task.exception(), WebSocketDisconnect):
+                raise task.exception()
+    finally:
+        subscription.close()
+
+
+# Embeds only the newest `history_limit` entries; the rest are paged through
+# GET /items/{item_id}/history.
 @router.get("/{item_id}", response_model=ItemWithHistory)
-def get_item(item_id: int, db: Session = Depends(get_db)):
+def get_item(
+    item_id: int,
+    history_limit: int = Query(HISTORY_PREVIEW_LIMIT, ge=0, le=100),
+    db: Session = Depends(get_db)
+):
     db_item = crud.get_item(db, item_id)
     if not db_item:
         raise HTTPException(status_code=404, detail="Item not found")
-    return db_item
+    history, _ = crud.get_item_history(db, item_id, history_limit) if history_limit else ([], None)
+    return ItemWithHistory(
+        **dict(ItemWithRelations.model_validate(db_item)),
+        history=history,
+        history_total=crud.count_item_history(db, item_id)
+    )
 
 
 @router.patch("/{item_id}", response_model=ItemWithRelations)
@@ -157,18 +376,40 @@ def delete_photo(photo_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Photo not found")
 
 
+@router.get("/{item_id}/similar", response_model=List[SimilarItem])
+def list_similar_items(
+    item_id: int,
+    max_distance: int = Query(similarity.SIMILAR_MAX_DISTANCE, ge=0, le=64),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    if not crud.get_item(db, item_id, with_relations=False):
+        raise HTTPException(status_code=404, detail="Item not found")
+    hashes = similarity.item_hashes(db, item_id)
+    return similarity.photo_hashes.search(db, hashes, max_distance, limit, exclude_item=item_id)
+
+
 # History
 
+# Newest first. Pass the X-Next-Cursor header of a page as `cursor` to get
+# the following one; the header is absent on the last page. A cursor that
+# no longer matches an entry (e.g. merged by archiving) is a 400.
 @router.get("/{item_id}/history", response_model=List[ItemHistory])
 def list_item_history(
     item_id: int,
-    skip: int = Query(0, ge=0),
+    response: Response,
+    cursor: Optional[int] = Query(None, ge=1),
     limit: int = Query(100, ge=1, le=500),
     db: Session = Depends(get_db)
 ):
     if not crud.get_item(db, item_id, with_relations=False):
         raise HTTPException(status_code=404, detail="Item not found")
-    return crud.get_item_history(db, item_id, skip, limit)
+    if cursor is not None and not crud.history_cursor_exists(db, item_id, cursor):
+        raise HTTPException(status_code=400, detail="Unknown history cursor; start again without one")
+    entries, next_cursor = crud.get_item_history(db, item_id, limit, cursor)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return entries
 
 
 # Bulk Operations
@@ -176,22 +417,26 @@ def list_item_history(
 @router.post("/bulk/update-status")
 def bulk_status_update(data: BulkUpdateStatus, db: Session = Depends(get_db)):
     count = crud.bulk_update_status(db, data.item_ids, data.status_id, data.notes)
+    metrics.bulk_rows_written.inc("update-status", amount=count)
     return {"message": f"Updated {count} items", "updated_count": count}
 
 
 @router.post("/bulk/update-location")
 def bulk_location_update(data: BulkUpdateLocation, db: Session = Depends(get_db)):
     count = crud.bulk_update_location(db, data.item_ids, data.location_id, data.notes)
+    metrics.bulk_rows_written.inc("update-location", amount=count)
     return {"message": f"Updated {count} items", "updated_count": count}
 
 
 @router.post("/bulk/update-price")
 def bulk_price_update(data: BulkUpdatePrice, db: Session = Depends(get_db)):
     count = crud.bulk_update_price(db, data.item_ids, data.price, data.on_sale, data.sale_price)
+    metrics.bulk_rows_written.inc("update-price", amount=count)
     return {"message": f"Updated {count} items", "updated_count": count}
 
 
 @router.post("/bulk/delete")
 def bulk_delete_items(data: BulkDelete, db: Session = Depends(get_db)):
     deleted = sum(1 for item_id in data.item_ids if crud.delete_item(db, item_id))
+    metrics.bulk_rows_written.inc("delete", amount=deleted)
     return {"message": f"Deleted {deleted} items", "deleted_count": deleted}
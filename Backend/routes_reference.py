@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import Optional
 
 from database import get_db
+from negotiation import MsgPackRoute, NegotiatedResponse
 from schemas import (
     Department, DepartmentCreate, DepartmentUpdate, DepartmentList,
     Category, CategoryCreate, CategoryUpdate, CategoryList, CategoryWithDepartment,
@@ -19,7 +20,10 @@ import crud
 
 # Departments
 
-router_departments = APIRouter(prefix="/departments", tags=["departments"])
+router_departments = APIRouter(
+    prefix="/departments", tags=["departments"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_departments.get("/", response_model=DepartmentList)
 def list_departments(
@@ -57,7 +61,10 @@ def delete_department(department_id: int, db: Session = Depends(get_db)):
 
 # Categories
 
-router_categories = APIRouter(prefix="/categories", tags=["categories"])
+router_categories = APIRouter(
+    prefix="/categories", tags=["categories"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_categories.get("/", response_model=CategoryList)
 def list_categories(
@@ -96,7 +103,10 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
 
 # Item Types
 
-router_item_types = APIRouter(prefix="/item-types", tags=["item-types"])
+router_item_types = APIRouter(
+    prefix="/item-types", tags=["item-types"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_item_types.get("/", response_model=ItemTypeList)
 def list_item_types(
@@ -135,7 +145,10 @@ def delete_item_type(item_type_id: int, db: Session = Depends(get_db)):
 
 # Sizes
 
-router_sizes = APIRouter(prefix="/sizes", tags=["sizes"])
+router_sizes = APIRouter(
+    prefix="/sizes", tags=["sizes"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_sizes.get("/", response_model=SizeList)
 def list_sizes(
@@ -173,7 +186,10 @@ def delete_size(size_id: int, db: Session = Depends(get_db)):
 
 # Colors
 
-router_colors = APIRouter(prefix="/colors", tags=["colors"])
+router_colors = APIRouter(
+    prefix="/colors", tags=["colors"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_colors.get("/", response_model=ColorList)
 def list_colors(
@@ -211,7 +227,10 @@ def delete_color(color_id: int, db: Session = Depends(get_db)):
 
 # Tags
 
-router_tags = APIRouter(prefix="/tags", tags=["tags"])
+router_tags = APIRouter(
+    prefix="/tags", tags=["tags"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_tags.get("/", response_model=TagList)
 def list_tags(
@@ -250,7 +269,10 @@ def delete_tag(tag_id: int, db: Session = Depends(get_db)):
 
 # Conditions
 
-router_conditions = APIRouter(prefix="/conditions", tags=["conditions"])
+router_conditions = APIRouter(
+    prefix="/conditions", tags=["conditions"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_conditions.get("/", response_model=ConditionList)
 def list_conditions(
@@ -287,7 +309,10 @@ def delete_condition(condition_id: int, db: Session = Depends(get_db)):
 
 # Item Statuses
 
-router_item_statuses = APIRouter(prefix="/item-statuses", tags=["item-statuses"])
+router_item_statuses = APIRouter(
+    prefix="/item-statuses", tags=["item-statuses"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_item_statuses.get("/", response_model=ItemStatusList)
 def list_item_statuses(
@@ -325,7 +350,10 @@ def delete_item_status(status_id: int, db: Session = Depends(get_db)):
 
 # Locations
 
-router_locations = APIRouter(prefix="/locations", tags=["locations"])
+router_locations = APIRouter(
+    prefix="/locations", tags=["locations"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
 
 @router_locations.get("/", response_model=LocationList)
 def list_locations(
@@ -0,0 +1,62 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from database import get_db
+from negotiation import MsgPackRoute, NegotiatedResponse
+from schemas import (
+    StockTake, StockTakeApply, StockTakeApplyResult, StockTakeCreate, StockTakeReport,
+    StockTakeScanBatch, StockTakeScanResult
+)
+import stocktake
+
+router = APIRouter(
+    prefix="/stocktake", tags=["stocktake"],
+    route_class=MsgPackRoute, default_response_class=NegotiatedResponse
+)
+
+
+def _get_stock_take(db: Session, stock_take_id: int, open_only: bool = False):
+    stock_take = stocktake.get_stock_take(db, stock_take_id)
+    if stock_take is None:
+        raise HTTPException(status_code=404, detail="Stock-take not found")
+    if open_only and stock_take.status != stocktake.STOCK_TAKE_OPEN:
+        raise HTTPException(status_code=409, detail=f"Stock-take is {stock_take.status}")
+    return stock_take
+
+
+# Starts counting a location: the unsold items recorded there are
+# snapshotted as the expected set.
+@router.post("/", response_model=StockTake, status_code=status.HTTP_201_CREATED)
+def start_stock_take(data: StockTakeCreate, db: Session = Depends(get_db)):
+    stock_take = stocktake.start_stock_take(db, data.location_id, data.notes)
+    if stock_take is None:
+        raise HTTPException(status_code=404, detail="Location not found")
+    return stock_take
+
+
+# Send scans in batches as they are made; each response flags the batch's
+# misplaced and unknown ids.
+@router.post("/{stock_take_id}/scans", response_model=StockTakeScanResult)
+def add_scans(stock_take_id: int, batch: StockTakeScanBatch, db: Session = Depends(get_db)):
+    stock_take = _get_stock_take(db, stock_take_id, open_only=True)
+    return stocktake.add_scans(db, stock_take, batch.item_ids)
+
+
+@router.get("/{stock_take_id}", response_model=StockTakeReport)
+def get_stock_take_report(
+    stock_take_id: int,
+    limit: int = Query(1000, ge=0, le=100000),
+    db: Session = Depends(get_db)
+):
+    return stocktake.reconcile(db, _get_stock_take(db, stock_take_id), limit)
+
+
+@router.post("/{stock_take_id}/apply", response_model=StockTakeApplyResult)
+def apply_stock_take(stock_take_id: int, data: StockTakeApply, db: Session = Depends(get_db)):
+    stock_take = _get_stock_take(db, stock_take_id, open_only=True)
+    return stocktake.apply_corrections(db, stock_take, data.relocate_misplaced, data.clear_missing, data.notes)
+
+
+@router.delete("/{stock_take_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_stock_take(stock_take_id: int, db: Session = Depends(get_db)):
+    stocktake.delete_stock_take(db, _get_stock_take(db, stock_take_id))
@@ -0,0 +1,142 @@
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from models import Item, SalesDaily
+import rollups
+
+DIMENSIONS = ("department_id", "category_id", "location_id")
+KEY_COLUMNS = ("day", *DIMENSIONS)
+MEASURES = ("sold_count", "revenue_cents", "original_price_cents", "discount_cents", "discounted_count")
+TRACKED = (
+    "date_sold", "department_id", "category_id", "current_location_id",
+    "price", "sale_price", "on_sale", "original_price",
+)
+
+PERIODS = {
+    "day": lambda day: day,
+    # SQLite weeks: move to the coming Sunday, then back to its Monday.
+    "week": lambda day: func.date(day, "weekday 0", "-6 days"),
+    "month": lambda day: func.strftime("%Y-%m-01", day),
+}
+
+
+def _day(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _revenue(values: dict):
+    if values["on_sale"] and values["sale_price"] is not None:
+        return values["sale_price"]
+    return values["price"]
+
+
+# The (key, measures) pair one sold item contributes; unsold items none.
+def _contribution(values: dict):
+    sold = _day(values["date_sold"])
+    if sold is None:
+        return None
+    key = (sold, values["department_id"], values["category_id"], values["current_location_id"] or 0)
+    revenue = rollups.to_cents(_revenue(values))
+    original = values["original_price"]
+    if original is None:
+        return key, (1, revenue, 0, 0, 0)
+    original = rollups.to_cents(original)
+    return key, (1, revenue, original, original - revenue, 1)
+
+
+def _add(deltas, values: dict, sign: int):
+    contribution = _contribution(values)
+    if contribution:
+        key, measures = contribution
+        row = deltas[key]
+        for index, amount in enumerate(measures):
+            row[index] += sign * amount
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0] * len(MEASURES))
+
+
+def _deltas(session) -> Dict[tuple, List[int]]:
+    deltas = _new_deltas()
+    rollups.item_deltas(session, TRACKED, lambda values, sign: _add(deltas, values, sign))
+    return {key: values for key, values in deltas.items() if any(values)}
+
+
+# Kept current in the same transaction as every write that sells an item,
+# reverses a sale or changes a sold item's price or slice.
+@event.listens_for(Session, "after_flush")
+def maintain_sales(session, flush_context):
+    rollups.increment(session, SalesDaily, KEY_COLUMNS, MEASURES, _deltas(session))
+
+
+# For items changed by a core UPDATE, from their values before and after.
+def apply_changes(db, before: Sequence[dict], after: Sequence[dict]):
+    deltas = _new_deltas()
+    rollups.value_deltas(before, after, lambda values, sign: _add(deltas, values, sign))
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    rollups.increment(db, SalesDaily, KEY_COLUMNS, MEASURES, deltas)
+
+
+# Only sold items are read, through the date_sold index.
+def _sales_from_items(db) -> Dict[tuple, List[int]]:
+    deltas = _new_deltas()
+    rows = db.execute(
+        select(*(getattr(Item, attr) for attr in TRACKED))
+        .where(Item.date_sold.is_not(None))
+        .execution_options(yield_per=10000)
+    )
+    for row in rows:
+        _add(deltas, dict(zip(TRACKED, row)), 1)
+    return deltas
+
+
+# Recomputes every row from items; `db` may be a Session or a Connection.
+def rebuild(db):
+    rollups.replace_rows(db, SalesDaily, KEY_COLUMNS, MEASURES, _sales_from_items(db))
+
+
+def find_drift(db: Session) -> List[tuple]:
+    return rollups.compare_rows(db, SalesDaily, KEY_COLUMNS, MEASURES, _sales_from_items(db))
+
+
+def _describe(values) -> dict:
+    count, revenue, original, discount, discounted = (value or 0 for value in values)
+    return {
+        "sold_count": count,
+        "revenue": revenue / 100,
+        "average_sale_price": round(revenue / count / 100, 2) if count else None,
+        "average_discount": round(discount / discounted / 100, 2) if discounted else None,
+        "discount_rate": round(discount / original, 4) if original else None,
+    }
+
+
+# Sales between date_from and date_to (inclusive) summed per day, week
+# (starting Monday) or month, and per combination of `group_by` dimensions.
+def sales_series(
+    db: Session, date_from: date, date_to: date, granularity: str = "day",
+    group_by: Sequence[str] = (), filters: Optional[Dict[str, int]] = None
+) -> dict:
+    period = PERIODS[granularity](SalesDaily.day).label("period")
+    columns = [getattr(SalesDaily, column) for column in group_by]
+    sums = [func.sum(getattr(SalesDaily, measure)) for measure in MEASURES]
+    conditions = [getattr(SalesDaily, column) == value for column, value in (filters or {}).items() if value is not None]
+    rows = db.execute(
+        select(period, *columns, *sums)
+        .where(SalesDaily.day.between(date_from, date_to), *conditions)
+        .group_by(period, *columns)
+        .having(sums[0] != 0)
+        .order_by(period, *columns)
+    ).all()
+
+    width = len(group_by) + 1
+    series = []
+    for row in rows:
+        keys = {column: (value or None) if column == "location_id" else value for column, value in zip(group_by, row[1:])}
+        series.append({"period": row[0], **keys, **_describe(row[width:])})
+    totals = _describe([sum(row[width + index] for row in rows) for index in range(len(MEASURES))])
+    return {"date_from": date_from, "date_to": date_to, "granularity": granularity, "series": series, "totals": totals}
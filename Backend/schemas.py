@@ -1,6 +1,6 @@
-from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, ConfigDict, Field
+from datetime import date, datetime
+from typing import Any, Dict, Optional, List
+from pydantic import BaseModel, ConfigDict, Field, computed_field
 
 
 # Department
@@ -208,12 +208,46 @@ class ItemPhotoUpdate(BaseModel):
     is_primary: Optional[bool] = None
     sort_order: Optional[int] = None
 
+class ImageVariant(BaseModel):
+    file_path: str
+    format: str
+    width: int
+    height: int
+    model_config = ConfigDict(from_attributes=True)
+
+def build_srcset(variants, fmt: str) -> Optional[str]:
+    entries = [f"{v.file_path} {v.width}w" for v in variants if v.format == fmt]
+    return ", ".join(entries) if entries else None
+
 class ItemPhoto(ItemPhotoBase):
     photo_id: int
     item_id: int
     uploaded_date: datetime
+    width: Optional[int] = None
+    height: Optional[int] = None
+    size_bytes: Optional[int] = None
+    dominant_color: Optional[str] = None
+    blurhash: Optional[str] = None
+    variants: List[ImageVariant] = []
     model_config = ConfigDict(from_attributes=True)
 
+    @computed_field
+    @property
+    def srcset(self) -> Optional[str]:
+        return build_srcset(self.variants, "jpeg")
+
+    @computed_field
+    @property
+    def srcset_webp(self) -> Optional[str]:
+        return build_srcset(self.variants, "webp")
+
+
+class SimilarItem(BaseModel):
+    item_id: int
+    photo_id: int
+    file_path: str
+    distance: int
+
 
 # ItemHistory
 class ItemHistoryBase(BaseModel):
@@ -229,6 +263,7 @@ class ItemHistory(ItemHistoryBase):
     history_id: int
     item_id: int
     action_date: datetime
+    merged_count: int = 1
     model_config = ConfigDict(from_attributes=True)
 
 
@@ -255,6 +290,8 @@ class ItemBase(BaseModel):
     season: Optional[str] = None
 
 class ItemCreate(ItemBase):
+    # Omit to use the suggested price from sold comparables.
+    price: Optional[float] = Field(default=None, ge=0)
     tag_ids: Optional[List[int]] = []
 
 class ItemUpdate(BaseModel):
@@ -301,6 +338,7 @@ class ItemWithRelations(Item):
 
 class ItemWithHistory(ItemWithRelations):
     history: List[ItemHistory] = []
+    history_total: int = 0
 
 
 # List responses
@@ -347,6 +385,89 @@ class ItemList(BaseModel):
     page_size: int
     total_pages: int
 
+class ItemChanges(BaseModel):
+    items: List[ItemWithRelations]
+    deleted_ids: List[int]
+    cursor: int
+    has_more: bool
+
+
+class InventoryGroup(BaseModel):
+    department_id: Optional[int] = None
+    category_id: Optional[int] = None
+    status_id: Optional[int] = None
+    location_id: Optional[int] = None
+    condition_id: Optional[int] = None
+    item_count: int
+    total_price: float
+    average_price: Optional[float] = None
+    total_sale_price: float
+    average_sale_price: Optional[float] = None
+
+class InventorySummary(BaseModel):
+    groups: List[InventoryGroup]
+    totals: InventoryGroup
+
+
+class SellThroughGroup(BaseModel):
+    department_id: Optional[int] = None
+    category_id: Optional[int] = None
+    brand: Optional[str] = None
+    condition_id: Optional[int] = None
+    sold_count: int
+    added_count: int
+    opening_stock: int
+    sell_through_rate: Optional[float] = None
+    average_days_on_shelf: Optional[float] = None
+    median_days_on_shelf: Optional[float] = None
+
+class SellThroughReport(BaseModel):
+    date_from: date
+    date_to: date
+    groups: List[SellThroughGroup]
+    totals: SellThroughGroup
+
+class AgedInventoryGroup(BaseModel):
+    department_id: Optional[int] = None
+    category_id: Optional[int] = None
+    brand: Optional[str] = None
+    condition_id: Optional[int] = None
+    unsold_count: int
+    age_buckets: Dict[str, int]
+
+class AgedInventoryReport(BaseModel):
+    as_of: date
+    groups: List[AgedInventoryGroup]
+    totals: AgedInventoryGroup
+
+
+class SalesPeriod(BaseModel):
+    period: Optional[date] = None
+    department_id: Optional[int] = None
+    category_id: Optional[int] = None
+    location_id: Optional[int] = None
+    sold_count: int
+    revenue: float
+    average_sale_price: Optional[float] = None
+    average_discount: Optional[float] = None
+    discount_rate: Optional[float] = None
+
+class SalesReport(BaseModel):
+    date_from: date
+    date_to: date
+    granularity: str
+    series: List[SalesPeriod]
+    totals: SalesPeriod
+
+
+class PriceSuggestion(BaseModel):
+    suggested_price: Optional[float] = None
+    low: Optional[float] = None
+    high: Optional[float] = None
+    comparables: int
+    matched_on: List[str]
+    confidence: str
+
 
 # Filters
 class ItemFilters(BaseModel):
@@ -391,3 +512,84 @@ class BulkUpdatePrice(BaseModel):
 class BulkDelete(BaseModel):
     item_ids: List[int]
     reason: Optional[str] = None
+
+
+# Admin
+class SlowQuery(BaseModel):
+    logged_at: datetime
+    duration_ms: float
+    sql: str
+    parameters: Any = None
+    method: Optional[str] = None
+    route: Optional[str] = None
+    context: Dict[str, Any] = {}
+    plan: List[str] = []
+
+class ItemStorage(BaseModel):
+    item_id: int
+    photo_count: int
+    bytes: int
+
+class StorageUsage(BaseModel):
+    stored_files: int
+    stored_bytes: int
+    unreferenced_bytes: int
+    photo_count: int
+    photo_bytes: int
+    untracked_photos: int
+    variant_count: int
+    items: List[ItemStorage]
+
+
+# Stock-take
+class StockTakeCreate(BaseModel):
+    location_id: int
+    notes: Optional[str] = None
+
+class StockTake(BaseModel):
+    stock_take_id: int
+    location_id: int
+    status: str
+    started_date: datetime
+    completed_date: Optional[datetime] = None
+    notes: Optional[str] = None
+    model_config = ConfigDict(from_attributes=True)
+
+class StockTakeScanBatch(BaseModel):
+    item_ids: List[int] = Field(min_length=1, max_length=5000)
+
+class MisplacedItem(BaseModel):
+    item_id: int
+    location_id: Optional[int] = None
+
+class StockTakeScanResult(BaseModel):
+    scanned: int
+    expected: int
+    misplaced: List[MisplacedItem]
+    sold: List[int]
+    unexpected: List[int]
+    total_scanned: int
+
+class StockTakeReport(BaseModel):
+    stock_take: StockTake
+    expected_count: int
+    scanned_count: int
+    matched_count: int
+    missing_count: int
+    misplaced_count: int
+    sold_count: int
+    unexpected_count: int
+    missing: List[int]
+    misplaced: List[MisplacedItem]
+    sold: List[int]
+    unexpected: List[int]
+
+class StockTakeApply(BaseModel):
+    relocate_misplaced: bool = True
+    clear_missing: bool = False
+    notes: Optional[str] = None
+
+class StockTakeApplyResult(BaseModel):
+    stock_take: StockTake
+    relocated: List[int]
+    cleared: List[int]
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
-"""Seeds the inventory database with reference data and sample items."""
+"""Seeds the inventory database with reference data and sample items, or
+with a generated catalogue of any size (--items N)."""
 
+import argparse
+import itertools
+import math
+import random
 import sqlite3
 import os
+import time
+from datetime import date, datetime, timedelta
 
 DATABASE_PATH = "inventory.db"
 
@@ -301,7 +308,301 @@ def seed_item_history(conn):
     conn.commit()
 
 
+def seed_item_changes(conn):
+    conn.execute("INSERT INTO item_changes (item_id, deleted) SELECT item_id, 0 FROM items ORDER BY item_id")
+    conn.commit()
+
+
+# Generated catalogues
+
+GENERATE_BATCH_ITEMS = 50000
+# Fixed so a seed names the same catalogue on every day it is generated.
+GENERATE_AS_OF = date(2025, 1, 1)
+
+# (brand, relative popularity, price multiplier); None is an unbranded item.
+BRANDS = [
+    (None, 160, 0.8), ("H&M", 90, 0.7), ("Old Navy", 85, 0.7), ("Gap", 80, 0.9), ("Zara", 75, 1.0),
+    ("Target", 70, 0.6), ("Forever 21", 60, 0.6), ("Nike", 60, 1.3), ("Levi's", 55, 1.3),
+    ("American Eagle", 50, 0.9), ("Uniqlo", 45, 0.9), ("Adidas", 45, 1.2), ("J.Crew", 40, 1.2),
+    ("Banana Republic", 35, 1.2), ("Urban Outfitters", 35, 1.1), ("Express", 30, 0.9),
+    ("Ann Taylor", 30, 1.1), ("Loft", 30, 1.0), ("Carhartt", 25, 1.4), ("Wrangler", 25, 1.1),
+    ("Patagonia", 20, 2.0), ("The North Face", 20, 1.9), ("Free People", 20, 1.6),
+    ("Anthropologie", 18, 1.7), ("Madewell", 18, 1.6), ("Lululemon", 18, 2.0), ("Brooks Brothers", 12, 1.8),
+    ("Ralph Lauren", 15, 1.7), ("Tommy Hilfiger", 15, 1.3), ("Dr. Martens", 10, 2.2),
+    ("Coach", 10, 3.0), ("Michael Kors", 8, 2.5), ("Kate Spade", 6, 2.8), ("Burberry", 2, 6.0),
+    ("Gucci", 1, 10.0),
+]
+CONDITION_WEIGHTS = {"Excellent": (30, 1.2), "Good": (45, 1.0), "Fair": (20, 0.7), "Poor": (5, 0.4)}
+DEPARTMENT_WEIGHTS = {"Women's": 45, "Men's": 30, "Kids": 15, "Unisex": 10}
+# Typical price per category, before brand and condition.
+CATEGORY_PRICES = {"Tops": 14, "Bottoms": 20, "Dresses": 26, "Outerwear": 38, "Shoes": 30, "Accessories": 18}
+CATEGORY_SIZES = {"Bottoms": ("Waist", "US Numeric", "Letter"), "Dresses": ("US Numeric", "Letter"),
+                  "Shoes": ("Shoes",), "Accessories": ("Universal",)}
+CATEGORY_MATERIALS = {
+    "Tops": ["Cotton", "Cotton Blend", "Polyester", "Silk", "Linen", "Rayon"],
+    "Bottoms": ["Denim", "Cotton", "Polyester", "Wool Blend", "Linen"],
+    "Dresses": ["Cotton", "Polyester", "Silk", "Rayon", "Chiffon"],
+    "Outerwear": ["Wool", "Wool Blend", "Polyester", "Leather", "Denim", "Nylon"],
+    "Shoes": ["Leather", "Canvas", "Suede", "Synthetic", "Rubber"],
+    "Accessories": ["Leather", "Canvas", "Cotton", "Metal", "Wool", None],
+}
+SEASONS = ["All Season", "All Season", "Spring/Summer", "Fall/Winter"]
+UNSOLD_STATUSES = ("Available", "Processing", "On Hold", "Removed")
+PHOTO_COUNTS = (0, 1, 2, 3, 4, 5, 6, 8)
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+UNSOLD_STATUS_WEIGHTS = _cumulative((80, 8, 5, 7))
+PHOTO_COUNT_WEIGHTS = _cumulative((10, 30, 20, 15, 10, 7, 5, 3))
+
+
+class CatalogueGenerator:
+    """Item, tag, photo and history rows drawn from the reference tables.
+    Batches requested in order with the same seed and as_of always produce
+    the same catalogue."""
+
+    def __init__(self, conn, seed: int, as_of: date, days: int, sold_ratio: float):
+        self.rng = random.Random(seed)
+        self.as_of = datetime.combine(as_of, datetime.min.time()) + timedelta(hours=18)
+        self.days = days
+        self.sold_ratio = sold_ratio
+
+        types = conn.execute(
+            "SELECT t.item_type_id, t.item_type_name, c.category_id, c.category_name, d.department_name, d.department_id "
+            "FROM item_types t JOIN categories c ON c.category_id = t.category_id "
+            "JOIN departments d ON d.department_id = c.department_id WHERE t.active = 1"
+        ).fetchall()
+        self.types = types
+        self.type_weights = _cumulative(DEPARTMENT_WEIGHTS.get(row[4], 10) for row in types)
+        self.sizes = {}
+        for size_id, system in conn.execute("SELECT size_id, size_system FROM sizes"):
+            self.sizes.setdefault(system, []).append(size_id)
+        self.colors = [(color_id, name) for color_id, name in conn.execute("SELECT color_id, color_name FROM colors")]
+        # Neutrals (the first few colours) are the most common.
+        self.color_weights = _cumulative(6 if index < 5 else 2 for index in range(len(self.colors)))
+        conditions = conn.execute("SELECT condition_id, condition_name FROM conditions").fetchall()
+        self.conditions = [(condition_id, CONDITION_WEIGHTS.get(name, (10, 1.0))[1]) for condition_id, name in conditions]
+        self.condition_weights = _cumulative(CONDITION_WEIGHTS.get(name, (10, 1.0))[0] for _, name in conditions)
+        self.statuses = {name: status_id for status_id, name in conn.execute("SELECT status_id, status_name FROM item_status")}
+        self.locations = {}
+        for location_id, name, location_type in conn.execute("SELECT location_id, location_name, location_type FROM locations"):
+            self.locations.setdefault(location_type, []).append((location_id, name))
+        self.location_ids = [location_id for locations in self.locations.values() for location_id, _ in locations]
+        self.tag_ids = [tag_id for (tag_id,) in conn.execute("SELECT tag_id FROM tags WHERE active = 1")]
+        # Zipf-like tag popularity.
+        self.tag_weights = _cumulative(1 / (rank + 1) for rank in range(len(self.tag_ids)))
+        self.brand_weights = _cumulative(weight for _, weight, _ in BRANDS)
+
+    def _location(self, category_name: str, age_days: int, status_name: str):
+        floor = self.locations.get("Sales Floor", [])
+        if status_name == "Processing":
+            return self.rng.choice(self.locations.get("Processing", floor))[0]
+        if status_name == "Removed" or not floor:
+            return None
+        special = {"Shoes": "Shoe", "Accessories": "Accessories"}.get(category_name)
+        if special and self.rng.random() < 0.8:
+            matches = [location for location in floor if special in location[1]]
+            if matches:
+                return matches[0][0]
+        if age_days > 180 and self.rng.random() < 0.5:
+            matches = [location for location in floor if "Clearance" in location[1]]
+            if matches:
+                return matches[0][0]
+        if self.rng.random() < 0.15 and self.locations.get("Storage"):
+            return self.rng.choice(self.locations["Storage"])[0]
+        racks = [location for location in floor if "Rack" in location[1]] or floor
+        return self.rng.choice(racks)[0]
+
+    def _size(self, category_name: str) -> int:
+        systems = [system for system in CATEGORY_SIZES.get(category_name, ("Letter",)) if system in self.sizes]
+        return self.rng.choice(self.sizes[self.rng.choice(systems or list(self.sizes))])
+
+    def _history(self, item_id, added, sold, price, location_id, sold_status, history):
+        rng = self.rng
+        stamp = added.isoformat(" ", "seconds")
+        history.append((item_id, "Created", stamp, None, f"Item created: generated item {item_id}", "Initial creation"))
+        end = sold or self.as_of
+        span = max((end - added).total_seconds(), 60)
+        # Most items are edited a few times; a long tail much more often.
+        for _ in range(min(int(rng.expovariate(1 / 2.0)), 40)):
+            when = (added + timedelta(seconds=rng.uniform(0, span))).isoformat(" ", "seconds")
+            kind = rng.random()
+            if kind < 0.5:
+                old = round(price * rng.uniform(1.05, 1.6), 2)
+                history.append((item_id, "Price_Changed", when, f"price: {old} -> {price}", "Bulk price update", "Bulk operation"))
+            elif kind < 0.8:
+                history.append((item_id, "Location_Changed", when, str(rng.choice(self.location_ids)), str(location_id or "None"), None))
+            else:
+                history.append((item_id, "Updated", when, "description: edited", None, None))
+        if sold:
+            history.append((item_id, "Status_Changed", sold.isoformat(" ", "seconds"),
+                            str(self.statuses.get("Available", 1)), str(sold_status), None))
+
+    def batch(self, first_id: int, count: int):
+        rng = self.rng
+        items, item_tags, photos, history = [], [], [], []
+        sold_status = self.statuses.get("Sold")
+        for item_id in range(first_id, first_id + count):
+            item_type_id, type_name, category_id, category_name, _, department_id = rng.choices(
+                self.types, cum_weights=self.type_weights
+            )[0]
+            brand, _, brand_factor = rng.choices(BRANDS, cum_weights=self.brand_weights)[0]
+            condition_id, condition_factor = rng.choices(self.conditions, cum_weights=self.condition_weights)[0]
+            color_id, color_name = rng.choices(self.colors, cum_weights=self.color_weights)[0]
+            secondary = rng.choices(self.colors, cum_weights=self.color_weights)[0][0] if rng.random() < 0.25 else None
+            base = CATEGORY_PRICES.get(category_name, 20)
+            price = max(round(base * brand_factor * condition_factor * rng.lognormvariate(0, 0.35)) - 0.01, 1.99)
+            original_price = round(price * rng.uniform(2, 5), 2) if rng.random() < 0.4 else None
+
+            # The catalogue grows over time: later days add more items.
+            age_days = int(self.days * (1 - math.sqrt(rng.random())))
+            added = self.as_of - timedelta(days=age_days, seconds=rng.randint(0, 10 * 3600))
+            sold = None
+            if sold_status and rng.random() < self.sold_ratio * min(1.0, (age_days + 1) / 90):
+                shelf_days = min(rng.expovariate(1 / 35), age_days + 0.5)
+                sold = min(added + timedelta(days=shelf_days), self.as_of)
+            if sold:
+                status_name = "Sold"
+            else:
+                status_name = rng.choices(UNSOLD_STATUSES, cum_weights=UNSOLD_STATUS_WEIGHTS)[0]
+            status_id = self.statuses.get(status_name, self.statuses.get("Available", 1))
+            location_id = None if sold else self._location(category_name, age_days, status_name)
+
+            on_sale = not sold and age_days > 90 and rng.random() < 0.3
+            sale_price = round(price * rng.uniform(0.5, 0.8), 2) if on_sale else None
+            if sold and rng.random() < 0.1:
+                on_sale, sale_price = True, round(price * rng.uniform(0.5, 0.8), 2)
+
+            items.append((
+                item_id, department_id, category_id, item_type_id, brand, self._size(category_name),
+                color_id, secondary, rng.choice(CATEGORY_MATERIALS.get(category_name, [None])), condition_id,
+                status_id, location_id, price, original_price, int(on_sale), sale_price,
+                f"{color_name} {brand + ' ' if brand else ''}{type_name}", None, None, rng.choice(SEASONS),
+                added.isoformat(" ", "seconds"), sold.isoformat(" ", "seconds") if sold else None,
+            ))
+
+            tag_count = min(int(rng.expovariate(1 / 2.2)), 8)
+            for tag_id in set(rng.choices(self.tag_ids, cum_weights=self.tag_weights, k=tag_count)):
+                item_tags.append((item_id, tag_id))
+
+            photo_count = rng.choices(PHOTO_COUNTS, cum_weights=PHOTO_COUNT_WEIGHTS)[0]
+            uploaded = (added + timedelta(minutes=rng.randint(1, 120))).isoformat(" ", "seconds")
+            for index in range(photo_count):
+                photos.append((item_id, f"/images/items/generated_{item_id}_{index + 1}.jpg", int(index == 0), index + 1, uploaded))
+
+            self._history(item_id, added, sold, price, location_id, status_id, history)
+        return {"items": items, "item_tags": item_tags, "item_photos": photos, "item_history": history}
+
+
+INSERTS = {
+    "items": """
+        INSERT INTO items (
+            item_id, department_id, category_id, item_type_id, brand, size_id,
+            color_primary_id, color_secondary_id, material, condition_id, status_id,
+            current_location_id, price, original_price, on_sale, sale_price,
+            description, internal_notes, customer_notes, season, date_added, date_sold
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "item_tags": "INSERT INTO item_tags (item_id, tag_id) VALUES (?, ?)",
+    "item_photos": "INSERT INTO item_photos (item_id, file_path, is_primary, sort_order, uploaded_date) VALUES (?, ?, ?, ?, ?)",
+    "item_history": "INSERT INTO item_history (item_id, action, action_date, old_value, new_value, notes) VALUES (?, ?, ?, ?, ?, ?)",
+}
+
+
+# Loading settings: no fsync, an in-memory rollback journal and a large page
+# cache. A crash mid-load can corrupt the file, so they are only used here.
+def tune_for_loading(conn):
+    conn.commit()
+    for pragma in (
+        "PRAGMA journal_mode = MEMORY", "PRAGMA synchronous = OFF", "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -262144", "PRAGMA foreign_keys = OFF",
+    ):
+        conn.execute(pragma)
+
+
+def restore_after_loading(conn):
+    conn.commit()
+    for pragma in ("PRAGMA journal_mode = DELETE", "PRAGMA synchronous = FULL", "PRAGMA foreign_keys = ON"):
+        conn.execute(pragma)
+
+
+# Secondary indexes on the loaded tables are dropped for the load and built
+# once at the end, which is much faster than maintaining them row by row.
+def drop_indexes(conn, tables):
+    placeholders = ", ".join("?" for _ in tables)
+    indexes = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        list(tables)
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+def generate_items(conn, n_items: int, seed: int = 0, as_of: date = GENERATE_AS_OF, days: int = 730,
+                   sold_ratio: float = 0.6, batch_items: int = GENERATE_BATCH_ITEMS):
+    generator = CatalogueGenerator(conn, seed, as_of, days, sold_ratio)
+    tune_for_loading(conn)
+    index_sql = drop_indexes(conn, INSERTS)
+    totals = dict.fromkeys(INSERTS, 0)
+    started = time.perf_counter()
+    for first_id in range(1, n_items + 1, batch_items):
+        rows = generator.batch(first_id, min(batch_items, n_items - first_id + 1))
+        # One transaction per batch.
+        with conn:
+            for table, statement in INSERTS.items():
+                conn.executemany(statement, rows[table])
+                totals[table] += len(rows[table])
+        elapsed = time.perf_counter() - started
+        loaded = sum(totals.values())
+        print(f"  {totals['items']:,}/{n_items:,} items, {loaded:,} rows, {loaded / elapsed:,.0f} rows/s")
+
+    index_started = time.perf_counter()
+    with conn:
+        for sql in index_sql:
+            conn.execute(sql)
+    conn.execute("ANALYZE")
+    elapsed = time.perf_counter() - started
+    for table, count in totals.items():
+        print(f"  {table}: {count:,} rows")
+    print(f"  indexes rebuilt in {time.perf_counter() - index_started:.1f}s")
+    print(f"  {sum(totals.values()):,} rows in {elapsed:.1f}s ({sum(totals.values()) / elapsed:,.0f} rows/s)")
+    restore_after_loading(conn)
+    return totals
+
+
+# The analytics tables are derived from items, so they are rebuilt with the
+# application's own code once the items are in place.
+def rebuild_analytics():
+    from database import engine
+    import rollups
+    import sales
+    import shelf_stats
+    with engine.begin() as conn:
+        rollups.rebuild(conn)
+        shelf_stats.rebuild(conn)
+        sales.rebuild(conn)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, help="generate this many items instead of the sample items")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for --items (default 0)")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=GENERATE_AS_OF,
+                        help=f"date the generated catalogue ends on (default {GENERATE_AS_OF})")
+    parser.add_argument("--days", type=int, default=730, help="days of generated history (default 730)")
+    parser.add_argument("--sold-ratio", type=float, default=0.6,
+                        help="share of items old enough to have sold that did (default 0.6)")
+    parser.add_argument("--batch-items", type=int, default=GENERATE_BATCH_ITEMS,
+                        help=f"items per transaction (default {GENERATE_BATCH_ITEMS})")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
     if not os.path.exists(DATABASE_PATH):
         print(f"Database '{DATABASE_PATH}' not found. Run the app first to create it.")
         return
@@ -322,13 +623,22 @@ def main():
     seed_item_status(conn)
     seed_locations(conn)
     
-    print("Seeding items...")
-    seed_items(conn)
-    seed_item_tags(conn)
-    seed_item_photos(conn)
-    seed_item_history(conn)
+    if args.items:
+        print(f"Generating {args.items:,} items (seed {args.seed})...")
+        generate_items(conn, args.items, args.seed, args.as_of, args.days, args.sold_ratio, args.batch_items)
+    else:
+        print("Seeding items...")
+        seed_items(conn)
+        seed_item_tags(conn)
+        seed_item_photos(conn)
+        seed_item_history(conn)
+    seed_item_changes(conn)
     
     conn.close()
+    print("Rebuilding analytics tables...")
+    started = time.perf_counter()
+    rebuild_analytics()
+    print(f"  done in {time.perf_counter() - started:.1f}s")
     print("Done! Database seeded.")
 
 
@@ -0,0 +1,251 @@
+import json
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
+
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import crud
+import schemas
+from models import CacheVersion, Department, Category, ItemType, Size, Color, Tag, Condition, ItemStatus, Location
+from schemas import ItemFilters
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(value) -> bytes:
+        return orjson.dumps(value, default=_default)
+else:
+    def dumps(value) -> bytes:
+        return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+REFERENCE_SCHEMAS = {
+    Department: schemas.Department,
+    Category: schemas.Category,
+    ItemType: schemas.ItemType,
+    Size: schemas.Size,
+    Color: schemas.Color,
+    Tag: schemas.Tag,
+    Condition: schemas.Condition,
+    ItemStatus: schemas.ItemStatus,
+    Location: schemas.Location,
+}
+
+# (response key, foreign key column, referenced model) in ItemWithRelations field order.
+ITEM_REFERENCES = (
+    ("department", "department_id", Department),
+    ("category", "category_id", Category),
+    ("item_type", "item_type_id", ItemType),
+    ("size", "size_id", Size),
+    ("color_primary", "color_primary_id", Color),
+    ("color_secondary", "color_secondary_id", Color),
+    ("condition", "condition_id", Condition),
+    ("status", "status_id", ItemStatus),
+    ("current_location", "current_location_id", Location),
+)
+
+ITEM_FIELDS = tuple(schemas.Item.model_fields)
+PHOTO_FIELDS = tuple(name for name in schemas.ItemPhoto.model_fields if name != "variants")
+VARIANT_FIELDS = tuple(schemas.ImageVariant.model_fields)
+PRICE_FIELDS = ("price", "original_price", "sale_price")
+
+
+class JSONLayout:
+    media_type = "application/json"
+    null = b"null"
+
+    def __init__(self):
+        self.keys = {key: b',"%s":' % key.encode() for key, _, _ in ITEM_REFERENCES}
+
+    def encode(self, value) -> bytes:
+        return dumps(value)
+
+    def item(self, scalars, references, tags, photos) -> bytes:
+        parts = [self.encode(scalars)[:-1]]
+        for key, fragment in references:
+            parts.append(self.keys[key])
+            parts.append(fragment)
+        parts.append(b',"tags":[')
+        parts.append(b",".join(tags))
+        parts.append(b'],"photos":')
+        parts.append(self.encode(photos))
+        parts.append(b"}")
+        return b"".join(parts)
+
+    def envelope(self, items, meta) -> bytes:
+        return b'{"items":[' + b",".join(items) + b"]," + self.encode(meta)[1:]
+
+
+def _msgpack_header(n, fix, short, long):
+    if n < 16:
+        return bytes([fix | n])
+    if n < 0x10000:
+        return bytes([short]) + n.to_bytes(2, "big")
+    return bytes([long]) + n.to_bytes(4, "big")
+
+
+def _map_header(n):
+    return _msgpack_header(n, 0x80, 0xde, 0xdf)
+
+
+def _array_header(n):
+    return _msgpack_header(n, 0x90, 0xdc, 0xdd)
+
+
+# Same splicing for MessagePack: re-emit the map header with the extra entry
+# count, then append the pre-packed key/value pairs after the scalar fields.
+class MsgPackLayout:
+    media_type = "application/msgpack"
+    null = b"\xc0"
+
+    def __init__(self):
+        self.keys = {key: msgpack.packb(key) for key, _, _ in ITEM_REFERENCES}
+        self._tags_key = msgpack.packb("tags")
+        self._photos_key = msgpack.packb("photos")
+        self._items_key = msgpack.packb("items")
+
+    def encode(self, value) -> bytes:
+        return msgpack.packb(value, default=_default)
+
+    def _map_body(self, value) -> bytes:
+        return self.encode(value)[len(_map_header(len(value))):]
+
+    def item(self, scalars, references, tags, photos) -> bytes:
+        parts = [_map_header(len(scalars) + len(references) + 2), self._map_body(scalars)]
+        for key, fragment in references:
+            parts.append(self.keys[key])
+            parts.append(fragment)
+        parts.append(self._tags_key)
+        parts.append(_array_header(len(tags)))
+        parts.extend(tags)
+        parts.append(self._photos_key)
+        parts.append(self.encode(photos))
+        return b"".join(parts)
+
+    def envelope(self, items, meta) -> bytes:
+        return b"".join([
+            _map_header(len(meta) + 1),
+            self._items_key,
+            _array_header(len(items)),
+            *items,
+            self._map_body(meta),
+        ])
+
+
+JSON = JSONLayout()
+MSGPACK = MsgPackLayout() if msgpack is not None else None
+
+
+# Reference rows pre-serialized per layout, loaded a whole table at a time
+# and tagged with the table's version. A render reads every version once
+# (`versions`) and reloads any table that was written since it was cached,
+# by this worker or another. Keys missing from a current table render as null.
+class FragmentCache:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._tables = {}
+
+    def versions(self, db: Session) -> dict:
+        return dict(db.execute(select(CacheVersion.name, CacheVersion.version)).all())
+
+    def get(self, db: Session, layout, model, key, versions: dict) -> bytes:
+        if key is None:
+            return layout.null
+        version = versions.get(model.__tablename__, 0)
+        cached = self._tables.get((model, layout.media_type))
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1].get(key, layout.null)
+        self.misses += 1
+        table = self._load(db, layout, model)
+        self._tables[(model, layout.media_type)] = (version, table)
+        return table.get(key, layout.null)
+
+    def _load(self, db: Session, layout, model):
+        schema = REFERENCE_SCHEMAS[model]
+        pk = model.__mapper__.primary_key[0].key
+        return {
+            getattr(obj, pk): layout.encode(schema.model_validate(obj).model_dump(mode="json"))
+            for obj in db.query(model)
+        }
+
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+fragments = FragmentCache()
+
+
+# The bump commits or rolls back with the write itself, so a reader never
+# tags the old rows with the new version.
+@event.listens_for(Session, "after_flush")
+def bump_reference_versions(session, flush_context):
+    changed = {type(obj) for obj in chain(session.new, session.dirty, session.deleted)} & REFERENCE_SCHEMAS.keys()
+    if not changed:
+        return
+    stmt = sqlite_insert(CacheVersion).values([{"name": model.__tablename__, "version": 1} for model in changed])
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[CacheVersion.name], set_={"version": CacheVersion.version + 1}
+    ))
+
+
+def _photo_dict(photo, variants):
+    values = {name: photo._mapping[name] for name in PHOTO_FIELDS}
+    values["variants"] = [{name: variant._mapping[name] for name in VARIANT_FIELDS} for variant in variants]
+    values["srcset"] = schemas.build_srcset(variants, "jpeg")
+    values["srcset_webp"] = schemas.build_srcset(variants, "webp")
+    return values
+
+
+def _render_item(db: Session, layout, versions, row, tag_ids, photos, variants) -> bytes:
+    values = row._mapping
+    scalars = {name: values[name] for name in ITEM_FIELDS}
+    for name in PRICE_FIELDS:
+        if scalars[name] is not None:
+            scalars[name] = float(scalars[name])
+
+    references = [
+        (key, fragments.get(db, layout, model, values[column], versions)) for key, column, model in ITEM_REFERENCES
+    ]
+    tags = [fragments.get(db, layout, Tag, tag_id, versions) for tag_id in tag_ids]
+    photo_dicts = [_photo_dict(photo, variants.get(photo.file_path, ())) for photo in photos]
+    return layout.item(scalars, references, tags, photo_dicts)
+
+
+# Builds the ItemList body straight from row tuples and cached reference
+# fragments, skipping ORM object graphs and response_model re-validation.
+def render_item_list(db: Session, filters: ItemFilters, layout=JSON) -> bytes:
+    rows, total, tags, photos, variants = crud.get_item_rows(db, filters)
+    versions = fragments.versions(db)
+    items = [
+        _render_item(db, layout, versions, row, tags.get(row.item_id, ()), photos.get(row.item_id, ()), variants)
+        for row in rows
+    ]
+    return layout.envelope(items, {
+        "total": total,
+        "page": filters.page,
+        "page_size": filters.page_size,
+        "total_pages": math.ceil(total / filters.page_size) if total > 0 else 0,
+    })
@@ -0,0 +1,203 @@
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import case, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import Item, ShelfDailyStats
+import rollups
+
+SLICE_COLUMNS = ("department_id", "category_id", "brand", "condition_id")
+TRACKED = (*SLICE_COLUMNS, "date_added", "date_sold")
+DAYS_ON_SHELF_BUCKETS = (7, 14, 30, 60, 90, 180, 365)
+BUCKET_COLUMNS = (*(f"sold_within_{days}" for days in DAYS_ON_SHELF_BUCKETS), "sold_after_365")
+MEASURES = ("added_count", "unsold_count", "sold_count", "days_on_shelf_total", *BUCKET_COLUMNS)
+KEY_COLUMNS = ("day", *SLICE_COLUMNS)
+AGE_BUCKETS = (30, 60, 90, 180, 365)
+AGE_LABELS = ("0-30", "31-60", "61-90", "91-180", "181-365", "365+")
+
+_MEASURE_INDEX = {measure: index for index, measure in enumerate(MEASURES)}
+
+
+def _day(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _bucket(days: int) -> str:
+    for limit, column in zip(DAYS_ON_SHELF_BUCKETS, BUCKET_COLUMNS):
+        if days <= limit:
+            return column
+    return BUCKET_COLUMNS[-1]
+
+
+# The (key, measures) rows one item contributes: its added day counts it as
+# added (and unsold until it sells), its sold day counts it as sold.
+def _contributions(values: dict):
+    item_slice = (values["department_id"], values["category_id"], values["brand"] or "", values["condition_id"])
+    added, sold = _day(values["date_added"]), _day(values["date_sold"])
+    yield (added, *item_slice), {"added_count": 1, "unsold_count": 0 if sold else 1}
+    if sold:
+        days = max((sold - added).days, 0)
+        yield (sold, *item_slice), {"sold_count": 1, "days_on_shelf_total": days, _bucket(days): 1}
+
+
+def _add(deltas, values: dict, sign: int):
+    for key, measures in _contributions(values):
+        row = deltas[key]
+        for measure, amount in measures.items():
+            row[_MEASURE_INDEX[measure]] += sign * amount
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0] * len(MEASURES))
+
+
+# date_added comes from the database default, which is not loaded yet when a
+# new item is flushed; SQLite's CURRENT_TIMESTAMP is UTC.
+def _current(item: Item, attrs) -> dict:
+    values = rollups.current_values(item, [attr for attr in attrs if attr != "date_added"])
+    values["date_added"] = inspect(item).dict.get("date_added") or datetime.now(timezone.utc).replace(tzinfo=None)
+    return values
+
+
+def _deltas(session) -> Dict[tuple, List[int]]:
+    deltas = _new_deltas()
+    rollups.item_deltas(session, TRACKED, lambda values, sign: _add(deltas, values, sign), current=_current)
+    return {key: values for key, values in deltas.items() if any(values)}
+
+
+# Updated from each flush's date_added/date_sold (and slice) changes in the
+# same transaction, so a day's row is final as soon as the day's sales are.
+@event.listens_for(Session, "after_flush")
+def maintain_shelf_stats(session, flush_context):
+    rollups.increment(session, ShelfDailyStats, KEY_COLUMNS, MEASURES, _deltas(session))
+
+
+# For items changed by a core UPDATE, from their values before and after.
+def apply_changes(db, before: Sequence[dict], after: Sequence[dict]):
+    deltas = _new_deltas()
+    rollups.value_deltas(before, after, lambda values, sign: _add(deltas, values, sign))
+    deltas = {key: values for key, values in deltas.items() if any(values)}
+    rollups.increment(db, ShelfDailyStats, KEY_COLUMNS, MEASURES, deltas)
+
+
+def _stats_from_items(db) -> Dict[tuple, List[int]]:
+    deltas = _new_deltas()
+    rows = db.execute(
+        select(*(getattr(Item, attr) for attr in TRACKED)).execution_options(yield_per=10000)
+    )
+    for row in rows:
+        _add(deltas, dict(zip(TRACKED, row)), 1)
+    return deltas
+
+
+# Recomputes every row from items; `db` may be a Session or a Connection.
+def rebuild(db):
+    rollups.replace_rows(db, ShelfDailyStats, KEY_COLUMNS, MEASURES, _stats_from_items(db))
+
+
+def find_drift(db: Session) -> List[tuple]:
+    return rollups.compare_rows(db, ShelfDailyStats, KEY_COLUMNS, MEASURES, _stats_from_items(db))
+
+
+# Median days on shelf, interpolated within the histogram bucket holding it
+# (the open-ended last bucket reports its lower bound).
+def _median_days(bucket_counts: Sequence[int]) -> Optional[float]:
+    total = sum(bucket_counts)
+    if not total:
+        return None
+    half, seen, lower = total / 2, 0, 0
+    for upper, count in zip(DAYS_ON_SHELF_BUCKETS + (None,), bucket_counts):
+        if count and seen + count >= half:
+            if upper is None:
+                return float(lower)
+            return round(lower + (upper - lower) * (half - seen) / count, 1)
+        seen += count
+        lower = upper if upper is not None else lower
+    return float(lower)
+
+
+def _conditions(filters: Optional[dict]):
+    return [getattr(ShelfDailyStats, column) == value for column, value in (filters or {}).items() if value is not None]
+
+
+def _slice_keys(group_by: Sequence[str], row) -> dict:
+    return {column: (value or None) if column == "brand" else value for column, value in zip(group_by, row)}
+
+
+# Sell-through = units sold in [date_from, date_to] / (units on hand at the
+# start + units added during the period), with days-on-shelf figures for the
+# units sold, per combination of `group_by` slice columns.
+def sell_through(
+    db: Session, date_from: date, date_to: date, group_by: Sequence[str], filters: Optional[dict] = None
+) -> dict:
+    day = ShelfDailyStats.day
+    in_period = day.between(date_from, date_to)
+
+    def period_sum(column):
+        return func.coalesce(func.sum(case((in_period, getattr(ShelfDailyStats, column)), else_=0)), 0)
+
+    columns = [getattr(ShelfDailyStats, column) for column in group_by]
+    sums = [
+        period_sum("sold_count"),
+        period_sum("added_count"),
+        func.coalesce(func.sum(case(
+            (day < date_from, ShelfDailyStats.added_count - ShelfDailyStats.sold_count), else_=0
+        )), 0),
+        period_sum("days_on_shelf_total"),
+        *(period_sum(column) for column in BUCKET_COLUMNS),
+    ]
+    groups = db.execute(
+        select(*columns, *sums).where(day <= date_to, *_conditions(filters)).group_by(*columns).order_by(*columns)
+    ).all()
+
+    def describe(values):
+        sold, added, opening, days_total, *buckets = values
+        stock = opening + added
+        return {
+            "sold_count": sold,
+            "added_count": added,
+            "opening_stock": opening,
+            "sell_through_rate": round(sold / stock, 4) if stock > 0 else None,
+            "average_days_on_shelf": round(days_total / sold, 1) if sold else None,
+            "median_days_on_shelf": _median_days(buckets),
+        }
+
+    width = len(group_by)
+    rows = [{**_slice_keys(group_by, row), **describe(row[width:])} for row in groups if any(row[width:width + 3])]
+    totals = describe([sum(row[width + index] for row in groups) for index in range(len(sums))])
+    return {"date_from": date_from, "date_to": date_to, "groups": rows, "totals": totals}
+
+
+# Unsold items by how long they have been on the shelf as of `today`.
+def aged_inventory(
+    db: Session, group_by: Sequence[str], filters: Optional[dict] = None, today: Optional[date] = None
+) -> dict:
+    today = today or datetime.now(timezone.utc).date()
+    columns = [getattr(ShelfDailyStats, column) for column in group_by]
+    rows = db.execute(
+        select(*columns, ShelfDailyStats.day, func.sum(ShelfDailyStats.unsold_count))
+        .where(ShelfDailyStats.unsold_count > 0, *_conditions(filters))
+        .group_by(*columns, ShelfDailyStats.day)
+    ).all()
+
+    width = len(group_by)
+    groups = {}
+    totals = dict.fromkeys(AGE_LABELS, 0)
+    for row in rows:
+        added_day, count = row[width], row[width + 1]
+        age = (today - added_day).days
+        label = next((label for limit, label in zip(AGE_BUCKETS, AGE_LABELS) if age <= limit), AGE_LABELS[-1])
+        buckets = groups.setdefault(tuple(row[:width]), dict.fromkeys(AGE_LABELS, 0))
+        buckets[label] += count
+        totals[label] += count
+
+    return {
+        "as_of": today,
+        "groups": [
+            {**_slice_keys(group_by, key), "unsold_count": sum(buckets.values()), "age_buckets": buckets}
+            for key, buckets in sorted(groups.items(), key=lambda group: tuple(str(value) for value in group[0]))
+        ],
+        "totals": {"unsold_count": sum(totals.values()), "age_buckets": totals},
+    }
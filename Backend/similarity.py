@@ -0,0 +1,139 @@
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models import ImageMetadata, ItemChange, ItemPhoto
+
+SIMILAR_MAX_DISTANCE = int(os.environ.get("SIMILAR_MAX_DISTANCE", "12"))
+DUPLICATE_MAX_DISTANCE = int(os.environ.get("DUPLICATE_MAX_DISTANCE", "4"))
+HASH_LOAD_CHUNK = 900
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(values):
+        return np.bitwise_count(values)
+else:
+    _BYTE_BITS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+    def _popcount(values):
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _to_uint64(hex_hash: str) -> np.uint64:
+    return np.uint64(int(hex_hash, 16))
+
+
+class PhotoHashIndex:
+    """Every photo's dHash packed into one uint64 array, so a search is one
+    vectorised XOR + popcount over the whole catalogue. The first search
+    loads every hash; later searches reload only the photos of items logged
+    in item_changes since the last one, so writes from any process are
+    picked up."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._cursor = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.item_ids = np.empty(0, dtype=np.int64)
+        self.photo_ids = np.empty(0, dtype=np.int64)
+        self.file_paths: List[str] = []
+
+    def _rows(self, db: Session, item_ids: Optional[List[int]] = None):
+        query = (
+            select(ItemPhoto.photo_id, ItemPhoto.item_id, ItemPhoto.file_path, ImageMetadata.dhash)
+            .join(ImageMetadata, ImageMetadata.file_path == ItemPhoto.file_path)
+            .where(ImageMetadata.dhash.is_not(None))
+        )
+        if item_ids is None:
+            return db.execute(query).all()
+        rows = []
+        for start in range(0, len(item_ids), HASH_LOAD_CHUNK):
+            rows.extend(db.execute(query.where(ItemPhoto.item_id.in_(item_ids[start:start + HASH_LOAD_CHUNK]))))
+        return rows
+
+    # Keeps the entries selected by `keep` and appends `rows`.
+    def _merge(self, keep, rows):
+        count = len(rows)
+        self.photo_ids = np.concatenate((
+            self.photo_ids[keep], np.fromiter((row.photo_id for row in rows), dtype=np.int64, count=count)
+        ))
+        self.item_ids = np.concatenate((
+            self.item_ids[keep], np.fromiter((row.item_id for row in rows), dtype=np.int64, count=count)
+        ))
+        self.hashes = np.concatenate((
+            self.hashes[keep], np.fromiter((int(row.dhash, 16) for row in rows), dtype=np.uint64, count=count)
+        ))
+        self.file_paths = [path for path, kept in zip(self.file_paths, keep) if kept]
+        self.file_paths.extend(row.file_path for row in rows)
+
+    def refresh(self, db: Session):
+        with self._lock:
+            if not self._loaded:
+                # Take the cursor first: items changed during the load are
+                # applied again on the next refresh, which is harmless.
+                self._cursor = db.execute(select(func.coalesce(func.max(ItemChange.change_id), 0))).scalar()
+                self._merge(np.zeros(0, dtype=bool), self._rows(db))
+                self._loaded = True
+                return
+            rows = db.execute(
+                select(ItemChange.change_id, ItemChange.item_id)
+                .where(ItemChange.change_id > self._cursor)
+                .order_by(ItemChange.change_id)
+            ).all()
+            if rows:
+                # Drops the photos of every changed item and re-adds those it still has.
+                changed = list({item_id for _, item_id in rows})
+                self._merge(~np.isin(self.item_ids, np.asarray(changed, dtype=np.int64)), self._rows(db, changed))
+                self._cursor = rows[-1][0]
+
+    def _snapshot(self, db: Session):
+        self.refresh(db)
+        with self._lock:
+            return self.hashes, self.item_ids, self.photo_ids, self.file_paths
+
+    # Returns one match per item (its closest photo) within max_distance bits
+    # of any of `hashes`, nearest first.
+    def search(
+        self, db: Session, hashes: List[str], max_distance: int, limit: int, exclude_item: Optional[int] = None
+    ) -> List[dict]:
+        catalogue, item_ids, photo_ids, file_paths = self._snapshot(db)
+        if not hashes or not len(catalogue):
+            return []
+        queries = np.array([_to_uint64(value) for value in hashes], dtype=np.uint64)
+        distances = _popcount(catalogue[None, :] ^ queries[:, None]).min(axis=0)
+
+        candidates = np.flatnonzero(distances <= max_distance)
+        if exclude_item is not None:
+            candidates = candidates[item_ids[candidates] != exclude_item]
+        candidates = candidates[np.lexsort((photo_ids[candidates], distances[candidates]))]
+
+        matches = {}
+        for index in candidates:
+            item_id = int(item_ids[index])
+            if item_id not in matches:
+                matches[item_id] = {
+                    "item_id": item_id,
+                    "photo_id": int(photo_ids[index]),
+                    "file_path": file_paths[index],
+                    "distance": int(distances[index]),
+                }
+                if len(matches) == limit:
+                    break
+        return list(matches.values())
+
+
+photo_hashes = PhotoHashIndex()
+
+
+def item_hashes(db: Session, item_id: int) -> List[str]:
+    return [
+        value for (value,) in db.execute(
+            select(ImageMetadata.dhash)
+            .join(ItemPhoto, ItemPhoto.file_path == ImageMetadata.file_path)
+            .where(ItemPhoto.item_id == item_id, ImageMetadata.dhash.is_not(None))
+        )
+    ]
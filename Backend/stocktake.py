@@ -0,0 +1,190 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import except_, func, insert, literal, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from models import Item, StockTake, StockTakeExpected, StockTakeScan
+import crud
+
+STOCK_TAKE_OPEN = "open"
+STOCK_TAKE_APPLIED = "applied"
+
+
+def _expected(stock_take_id: int):
+    return select(StockTakeExpected.item_id).where(StockTakeExpected.stock_take_id == stock_take_id)
+
+
+def _scanned(stock_take_id: int):
+    return select(StockTakeScan.item_id).where(StockTakeScan.stock_take_id == stock_take_id)
+
+
+# Expected but not scanned.
+def _missing(stock_take_id: int):
+    return _expected(stock_take_id).except_(_scanned(stock_take_id))
+
+
+# Scanned but not expected: unsold items recorded elsewhere (misplaced) or
+# here since the snapshot (arrived), sold items, and ids that match no item
+# (unexpected).
+def _not_expected(stock_take_id: int):
+    return _scanned(stock_take_id).except_(_expected(stock_take_id))
+
+
+def _not_expected_items(stock_take_id: int):
+    return select(Item.item_id).where(Item.item_id.in_(_not_expected(stock_take_id)))
+
+
+def _misplaced(stock_take: StockTake):
+    return _not_expected_items(stock_take.stock_take_id).where(
+        Item.date_sold.is_(None),
+        or_(Item.current_location_id.is_(None), Item.current_location_id != stock_take.location_id),
+    )
+
+
+def _arrived(stock_take: StockTake):
+    return _not_expected_items(stock_take.stock_take_id).where(
+        Item.date_sold.is_(None), Item.current_location_id == stock_take.location_id
+    )
+
+
+def _sold(stock_take_id: int):
+    return _not_expected_items(stock_take_id).where(Item.date_sold.is_not(None))
+
+
+# SQLite evaluates chained EXCEPTs left to right.
+def _unexpected(stock_take_id: int):
+    return except_(_scanned(stock_take_id), _expected(stock_take_id), select(Item.item_id))
+
+
+def _count(db: Session, query) -> int:
+    return db.execute(select(func.count()).select_from(query.subquery())).scalar()
+
+
+def _ids(db: Session, query, limit: int) -> List[int]:
+    subquery = query.subquery()
+    return list(db.execute(select(subquery.c.item_id).order_by(subquery.c.item_id).limit(limit)).scalars())
+
+
+# Snapshots the unsold items recorded at the location; returns None for an
+# unknown location.
+def start_stock_take(db: Session, location_id: int, notes: Optional[str] = None) -> Optional[StockTake]:
+    if crud.get_location(db, location_id) is None:
+        return None
+    stock_take = StockTake(location_id=location_id, notes=notes, status=STOCK_TAKE_OPEN)
+    db.add(stock_take)
+    db.flush()
+    db.execute(insert(StockTakeExpected).from_select(
+        ["stock_take_id", "item_id"],
+        select(literal(stock_take.stock_take_id), Item.item_id)
+        .where(Item.current_location_id == location_id, Item.date_sold.is_(None))
+    ))
+    db.commit()
+    db.refresh(stock_take)
+    return stock_take
+
+
+def get_stock_take(db: Session, stock_take_id: int) -> Optional[StockTake]:
+    return db.get(StockTake, stock_take_id)
+
+
+# Records one batch of scans (repeats count as rescans) and classifies the
+# batch's ids against the snapshot, so scanners can flag items as they go.
+# Items recorded here since the snapshot are not flagged.
+def add_scans(db: Session, stock_take: StockTake, item_ids: List[int]) -> dict:
+    counts = Counter(item_ids)
+    stmt = sqlite_insert(StockTakeScan).values([
+        {"stock_take_id": stock_take.stock_take_id, "item_id": item_id, "scan_count": count}
+        for item_id, count in counts.items()
+    ])
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[StockTakeScan.stock_take_id, StockTakeScan.item_id],
+        set_={
+            "scan_count": StockTakeScan.scan_count + stmt.excluded.scan_count,
+            "last_scanned_date": func.now(),
+        }
+    ))
+
+    scanned = set(counts)
+    expected = set(db.execute(
+        _expected(stock_take.stock_take_id).where(StockTakeExpected.item_id.in_(scanned))
+    ).scalars())
+    found = db.execute(
+        select(Item.item_id, Item.current_location_id, Item.date_sold).where(Item.item_id.in_(scanned - expected))
+    ).all()
+    sold = sorted(item_id for item_id, _, date_sold in found if date_sold is not None)
+    misplaced = sorted(
+        (item_id, location_id) for item_id, location_id, date_sold in found
+        if date_sold is None and location_id != stock_take.location_id
+    )
+    total = _count(db, _scanned(stock_take.stock_take_id))
+    db.commit()
+    return {
+        "scanned": len(scanned),
+        "expected": len(expected),
+        "misplaced": [{"item_id": item_id, "location_id": location_id} for item_id, location_id in misplaced],
+        "sold": sold,
+        "unexpected": sorted(scanned - expected - {item_id for item_id, _, _ in found}),
+        "total_scanned": total,
+    }
+
+
+# Compares every scan so far with the snapshot; lists hold at most `limit`
+# ids each, the counts are exact. Items that arrived here after the snapshot
+# count as matched.
+def reconcile(db: Session, stock_take: StockTake, limit: int = 1000) -> dict:
+    stock_take_id = stock_take.stock_take_id
+    misplaced_ids = _ids(db, _misplaced(stock_take), limit)
+    recorded = dict(db.execute(
+        select(Item.item_id, Item.current_location_id).where(Item.item_id.in_(misplaced_ids))
+    ).all())
+    return {
+        "stock_take": stock_take,
+        "expected_count": _count(db, _expected(stock_take_id)),
+        "scanned_count": _count(db, _scanned(stock_take_id)),
+        "matched_count": (
+            _count(db, _scanned(stock_take_id).intersect(_expected(stock_take_id))) + _count(db, _arrived(stock_take))
+        ),
+        "missing_count": _count(db, _missing(stock_take_id)),
+        "misplaced_count": _count(db, _misplaced(stock_take)),
+        "sold_count": _count(db, _sold(stock_take_id)),
+        "unexpected_count": _count(db, _unexpected(stock_take_id)),
+        "missing": _ids(db, _missing(stock_take_id), limit),
+        "misplaced": [{"item_id": item_id, "location_id": recorded[item_id]} for item_id in misplaced_ids],
+        "sold": _ids(db, _sold(stock_take_id), limit),
+        "unexpected": _ids(db, _unexpected(stock_take_id), limit),
+    }
+
+
+# Moves misplaced items to the counted location (sold items are left alone)
+# and, with clear_missing, clears the location of missing items still
+# recorded there (unless sold since), each with history, then closes the
+# stock-take. One transaction.
+def apply_corrections(
+    db: Session, stock_take: StockTake, relocate_misplaced: bool = True, clear_missing: bool = False,
+    notes: Optional[str] = None
+) -> dict:
+    stock_take_id = stock_take.stock_take_id
+    notes = notes or f"Stock-take {stock_take_id}"
+    relocated, cleared = [], []
+    if relocate_misplaced:
+        relocated = crud.relocate_items(db, _misplaced(stock_take), stock_take.location_id, notes)
+    if clear_missing:
+        still_recorded = select(Item.item_id).where(
+            Item.item_id.in_(_missing(stock_take_id)),
+            Item.current_location_id == stock_take.location_id,
+            Item.date_sold.is_(None),
+        )
+        cleared = crud.relocate_items(db, still_recorded, None, notes)
+    stock_take.status = STOCK_TAKE_APPLIED
+    stock_take.completed_date = datetime.now(timezone.utc).replace(tzinfo=None)
+    db.commit()
+    db.refresh(stock_take)
+    return {"stock_take": stock_take, "relocated": relocated, "cleared": cleared}
+
+
+def delete_stock_take(db: Session, stock_take: StockTake):
+    db.delete(stock_take)
+    db.commit()
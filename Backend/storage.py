@@ -0,0 +1,157 @@
+import hashlib
+import os
+import tempfile
+from typing import NamedTuple, Optional
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+IMAGEDIR = "images/"
+# Uploads are stored once per distinct content as images/sha256/<ab>/<digest><ext>.
+BLOB_DIR = os.path.join(IMAGEDIR, "sha256")
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "20"))
+# Allowance per file for multipart boundaries, part headers and form fields.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Upload exceeds the {limit} byte limit")
+        self.limit = limit
+
+
+class StoredBlob(NamedTuple):
+    sha256: str
+    path: str
+    size: int
+    created: bool
+
+
+# Largest multipart body an upload route can legitimately receive.
+def upload_body_limit(path: str) -> int:
+    files = MAX_BATCH_FILES if path.endswith("/upload-batch") else 1
+    return files * (MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES)
+
+
+class UploadLimitMiddleware:
+    """Rejects multipart bodies over upload_body_limit() before the form
+    parser spools them to disk: from Content-Length before anything is
+    read, or as soon as a chunked body passes the limit. Each file is still
+    checked against MAX_UPLOAD_BYTES when it is stored."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        headers = Headers(scope=scope) if scope["type"] == "http" else None
+        if headers is None or not headers.get("content-type", "").startswith("multipart/form-data"):
+            await self.app(scope, receive, send)
+            return
+
+        limit = upload_body_limit(scope["path"])
+        detail = str(UploadTooLarge(MAX_UPLOAD_BYTES))
+        length = headers.get("content-length", "")
+        if length.isdigit() and int(length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def _stream_to_temp(source, directory: str, max_bytes: int):
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := source.read(UPLOAD_CHUNK_BYTES):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+    except BaseException:
+        remove_file(temp_path)
+        raise
+    return temp_path, written, digest.hexdigest()
+
+
+# Blocking: run it in a worker thread. Streams `source` in chunks into a temp
+# file next to the destination and renames it into place, so a partially
+# written or oversized upload never appears under its final name.
+def save_upload(source, directory: str, filename: str, max_bytes: int = MAX_UPLOAD_BYTES) -> int:
+    temp_path, written, _ = _stream_to_temp(source, directory, max_bytes)
+    try:
+        os.replace(temp_path, os.path.join(directory, filename))
+    except BaseException:
+        remove_file(temp_path)
+        raise
+    return written
+
+
+def blob_path(sha256: str, extension: str) -> str:
+    return os.path.join(BLOB_DIR, sha256[:2], sha256 + extension.lower())
+
+
+def find_blob(sha256: str) -> Optional[str]:
+    shard = os.path.join(BLOB_DIR, sha256[:2])
+    try:
+        with os.scandir(shard) as entries:
+            for entry in entries:
+                if entry.name.startswith(sha256):
+                    return entry.path
+    except FileNotFoundError:
+        pass
+    return None
+
+
+# Blocking, like save_upload, but names the file by the SHA-256 of its bytes.
+# When that content is already stored the temp copy is dropped and the
+# existing file is returned with created=False.
+def save_blob(source, extension: str, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredBlob:
+    temp_path, written, sha256 = _stream_to_temp(source, BLOB_DIR, max_bytes)
+    existing = find_blob(sha256)
+    if existing is not None:
+        remove_file(temp_path)
+        return StoredBlob(sha256, existing, written, False)
+    path = blob_path(sha256, extension)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    except BaseException:
+        remove_file(temp_path)
+        raise
+    return StoredBlob(sha256, path, written, True)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_file(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass